@@ -0,0 +1,860 @@
+#!/usr/bin/env python3
+"""
+Hardware Simulator - 第 1~5 章 HDL 晶片的模擬器 (取代官方的 Java HardwareSimulator)
+
+1. 解析 .hdl，把晶片一層一層展開成只剩內建晶片 (Nand、DFF，以及目錄中沒有 .hdl 的
+   Mux16、RAM64 ... 等標準晶片) 的 netlist，和官方模擬器一樣：零件先找晶片所在目錄的 .hdl，
+   找不到才用內建版本
+2. 依組合邏輯的相依關係做拓撲排序，產生一個直線的 Python 函數 (compile()) 計算所有線路；
+   每條線路 (bus) 是一個整數，16 位元的 bus 用整數的位元運算一次算完
+3. 時序晶片 (DFF、Register、PC、RAM ...) 在 tick 取樣輸入、tock 更新輸出
+
+執行 .tst 腳本用 期末作業/TestRunner.py (腳本語言、輸出格式和 .cmp 比對都在那裡)。
+--verify 把 HDL 晶片和內建的參考版本比較：輸入位元數少時窮舉，否則用隨機向量；
+有 NumPy 時所有向量放在陣列中一次計算 (產生的程式碼只用位元運算，整數和陣列都適用)。
+"""
+
+import os
+import re
+import sys
+import random
+import argparse
+import importlib.util
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np  # 選用：--verify 一次計算全部的測試向量
+except ImportError:
+    np = None
+
+SIMULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_RUNNER = os.path.join(os.path.dirname(SIMULATOR_DIR), '期末作業', 'TestRunner.py')
+
+TOKEN = re.compile(r'\.\.|[A-Za-z_]\w*|\d+|[{}()\[\];:,=]')
+COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+# 一段線路：(net 編號, 起始位元, 寬度)；net 編號為 None 時是常數，起始位元的位置放常數值
+Segment = Tuple[Optional[int], int, int]
+Ref = List[Segment]
+# 輸出 pin 的連接：(pin 的起始位元, 寫到哪些線路)
+Binding = Tuple[int, Ref]
+
+
+class HDLError(ValueError):
+    """HDL 語法錯誤、找不到晶片或 pin、寬度不符、組合邏輯迴圈 ..."""
+
+
+def mask(width: int) -> int:
+    return (1 << width) - 1
+
+
+# ============= 內建晶片 =============
+
+def alu(x, y, zx, nx, zy, ny, f, no):
+    """第 2 章的 ALU，只用位元運算 (整數和 NumPy 陣列都適用)"""
+    x = x & (zx ^ 1) * 0xFFFF ^ nx * 0xFFFF
+    y = y & (zy ^ 1) * 0xFFFF ^ ny * 0xFFFF
+    out = ((x + y) & 0xFFFF) & f * 0xFFFF | (x & y) & (f ^ 1) * 0xFFFF
+    out = out ^ no * 0xFFFF
+    return out, (out == 0) * 1, out >> 15 & 1
+
+
+def mux_ways(ways: int) -> str:
+    names = 'abcdefgh'[:ways]
+    return ' | '.join(f'{{{name}}} & ({{sel}} == {i}) * 0xFFFF' for i, name in enumerate(names))
+
+
+def dmux_ways(ways: int) -> Dict[str, str]:
+    return {name: f'{{in}} * ({{sel}} == {i})' for i, name in enumerate('abcdefgh'[:ways])}
+
+
+class BuiltinChip:
+    """
+    組合邏輯的內建晶片：每個輸出 pin 是一個 Python 運算式 ({pin} 代入輸入)，
+    或是 function (回傳所有輸出的 tuple)。
+    """
+    clocked = False
+
+    def __init__(self, name: str, inputs: List[Tuple[str, int]], outputs: List[Tuple[str, int]],
+                 expressions: Optional[Dict[str, str]] = None, function: Optional[Callable] = None):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.expressions = expressions
+        self.function = function
+        self.combinational = {pin for pin, _ in inputs}  # 會立即影響輸出的輸入
+
+
+BUILTIN_CHIPS: Dict[str, object] = {}
+
+
+def builtin(name, inputs, outputs, expressions=None, function=None):
+    BUILTIN_CHIPS[name] = BuiltinChip(name, inputs, outputs, expressions, function)
+
+
+builtin('Nand', [('a', 1), ('b', 1)], [('out', 1)], {'out': '{a} & {b} ^ 1'})
+builtin('Not', [('in', 1)], [('out', 1)], {'out': '{in} ^ 1'})
+builtin('And', [('a', 1), ('b', 1)], [('out', 1)], {'out': '{a} & {b}'})
+builtin('Or', [('a', 1), ('b', 1)], [('out', 1)], {'out': '{a} | {b}'})
+builtin('Xor', [('a', 1), ('b', 1)], [('out', 1)], {'out': '{a} ^ {b}'})
+builtin('Mux', [('a', 1), ('b', 1), ('sel', 1)], [('out', 1)], {'out': '{a} & ({sel} ^ 1) | {b} & {sel}'})
+builtin('DMux', [('in', 1), ('sel', 1)], [('a', 1), ('b', 1)], {'a': '{in} & ({sel} ^ 1)', 'b': '{in} & {sel}'})
+builtin('Not16', [('in', 16)], [('out', 16)], {'out': '{in} ^ 0xFFFF'})
+builtin('And16', [('a', 16), ('b', 16)], [('out', 16)], {'out': '{a} & {b}'})
+builtin('Or16', [('a', 16), ('b', 16)], [('out', 16)], {'out': '{a} | {b}'})
+builtin('Mux16', [('a', 16), ('b', 16), ('sel', 1)], [('out', 16)],
+        {'out': '{a} & ({sel} ^ 1) * 0xFFFF | {b} & {sel} * 0xFFFF'})
+builtin('Or8Way', [('in', 8)], [('out', 1)], {'out': '({in} != 0) * 1'})
+builtin('Mux4Way16', [('a', 16), ('b', 16), ('c', 16), ('d', 16), ('sel', 2)], [('out', 16)],
+        {'out': mux_ways(4)})
+builtin('Mux8Way16', [(name, 16) for name in 'abcdefgh'] + [('sel', 3)], [('out', 16)],
+        {'out': mux_ways(8)})
+builtin('DMux4Way', [('in', 1), ('sel', 2)], [(name, 1) for name in 'abcd'], dmux_ways(4))
+builtin('DMux8Way', [('in', 1), ('sel', 3)], [(name, 1) for name in 'abcdefgh'], dmux_ways(8))
+builtin('HalfAdder', [('a', 1), ('b', 1)], [('sum', 1), ('carry', 1)],
+        {'sum': '{a} ^ {b}', 'carry': '{a} & {b}'})
+builtin('FullAdder', [('a', 1), ('b', 1), ('c', 1)], [('sum', 1), ('carry', 1)],
+        {'sum': '{a} ^ {b} ^ {c}', 'carry': '{a} & {b} | {c} & ({a} ^ {b})'})
+builtin('Add16', [('a', 16), ('b', 16)], [('out', 16)], {'out': '({a} + {b}) & 0xFFFF'})
+builtin('Inc16', [('in', 16)], [('out', 16)], {'out': '({in} + 1) & 0xFFFF'})
+builtin('ALU', [('x', 16), ('y', 16), ('zx', 1), ('nx', 1), ('zy', 1), ('ny', 1), ('f', 1), ('no', 1)],
+        [('out', 16), ('zr', 1), ('ng', 1)], function=alu)
+
+
+class ClockedChip:
+    """
+    時序晶片的基底類別。每個實例保存自己的狀態；tick() 取樣輸入 (所有輸入 pin 依序傳入)，
+    tock() 更新輸出。outputs 的運算式中 {state} 代表這個實例。
+    peek / poke 是腳本中 Register[]、RAM16K[5] 這類直接讀寫內部狀態的寫法。
+    """
+    clocked = True
+    inputs: List[Tuple[str, int]] = []
+    outputs: List[Tuple[str, int]] = []
+    expressions = {'out': '{state}.value'}
+    function = None
+    combinational = frozenset()
+
+    def __init__(self):
+        self.value = self.next = 0
+
+    def tick(self, *inputs):
+        pass
+
+    def tock(self):
+        self.value = self.next
+
+    def peek(self, index: Optional[int]) -> int:
+        return self.next
+
+    def poke(self, index: Optional[int], value: int):
+        self.value = self.next = value
+
+
+class DFF(ClockedChip):
+    name = 'DFF'
+    inputs = [('in', 1)]
+    outputs = [('out', 1)]
+
+    def tick(self, value):
+        self.next = value
+
+
+class Register(ClockedChip):
+    name = 'Register'
+    inputs = [('in', 16), ('load', 1)]
+    outputs = [('out', 16)]
+
+    def tick(self, value, load):
+        self.next = value if load else self.value
+
+
+class Bit(Register):
+    name = 'Bit'
+    inputs = [('in', 1), ('load', 1)]
+    outputs = [('out', 1)]
+
+
+class ARegister(Register):
+    name = 'ARegister'
+
+
+class DRegister(Register):
+    name = 'DRegister'
+
+
+class PC(ClockedChip):
+    name = 'PC'
+    inputs = [('in', 16), ('load', 1), ('inc', 1), ('reset', 1)]
+    outputs = [('out', 16)]
+
+    def tick(self, value, load, inc, reset):
+        if reset:
+            self.next = 0
+        elif load:
+            self.next = value
+        elif inc:
+            self.next = (self.value + 1) & 0xFFFF
+        else:
+            self.next = self.value
+
+
+class RAM(ClockedChip):
+    """RAM8 ~ RAM16K 和 Screen：out 立即反映 address 的內容，寫入在 tock 生效"""
+    address_bits = 3
+    expressions = {'out': '{state}.memory[{address}]'}
+    combinational = frozenset({'address'})
+
+    def __init__(self):
+        super().__init__()
+        self.memory = [0] * (1 << self.address_bits)
+        self.pending: Optional[Tuple[int, int]] = None
+
+    def tick(self, value, load, address):
+        self.pending = (address, value) if load else None
+
+    def tock(self):
+        if self.pending:
+            address, value = self.pending
+            self.memory[address] = value
+            self.pending = None
+
+    def peek(self, index: Optional[int]) -> int:
+        return self.memory[index or 0]
+
+    def poke(self, index: Optional[int], value: int):
+        self.memory[index or 0] = value
+
+
+def ram_chip(name: str, address_bits: int):
+    BUILTIN_CHIPS[name] = type(name, (RAM,), {
+        'name': name, 'address_bits': address_bits,
+        'inputs': [('in', 16), ('load', 1), ('address', address_bits)], 'outputs': [('out', 16)]})
+
+
+for ram_name, ram_bits in (('RAM8', 3), ('RAM64', 6), ('RAM512', 9), ('RAM4K', 12), ('RAM16K', 14),
+                           ('Screen', 13)):
+    ram_chip(ram_name, ram_bits)
+
+
+class Keyboard(ClockedChip):
+    """out 是目前按下的按鍵碼，由腳本 (或 echo 提示要按的鍵) 設定"""
+    name = 'Keyboard'
+    outputs = [('out', 16)]
+
+
+class ROM32K(ClockedChip):
+    """程式記憶體；腳本用 "ROM32K load Xxx.hack" 載入"""
+    name = 'ROM32K'
+    inputs = [('address', 15)]
+    outputs = [('out', 16)]
+    expressions = {'out': '{state}.memory[{address}]'}
+    combinational = frozenset({'address'})
+
+    def __init__(self):
+        super().__init__()
+        self.memory = [0] * 32768
+
+    def load(self, path: str):
+        with open(path, 'r') as f:
+            words = [int(line.strip(), 2) for line in f if line.strip()]
+        self.memory = words + [0] * (32768 - len(words))
+
+    def peek(self, index: Optional[int]) -> int:
+        return self.memory[index or 0]
+
+    def poke(self, index: Optional[int], value: int):
+        self.memory[index or 0] = value
+
+
+for chip_class in (DFF, Register, Bit, ARegister, DRegister, PC, Keyboard, ROM32K):
+    BUILTIN_CHIPS[chip_class.name] = chip_class
+
+
+# ============= HDL 解析 =============
+
+class HDLChip:
+    """一個 .hdl 檔：介面 (pin 名稱與寬度) 和零件清單"""
+
+    def __init__(self, name: str, inputs: List[Tuple[str, int]], outputs: List[Tuple[str, int]],
+                 parts: List[Tuple[str, List[Tuple]]], path: str):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.parts = parts  # (晶片名稱, [(pin, pin 範圍, 線路名稱, 線路範圍) ...])；範圍是 (lo, hi) 或 None
+        self.path = path
+
+
+class HDLParser:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'r', encoding='utf-8') as f:
+            self.tokens = TOKEN.findall(COMMENT.sub(' ', f.read()))
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self, expected: Optional[str] = None) -> str:
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise HDLError(f"{self.path}: expected '{expected or 'more input'}' but found '{token}'")
+        self.position += 1
+        return token
+
+    def parse(self) -> Optional[HDLChip]:
+        """BUILTIN 晶片回傳 None (使用內建版本)"""
+        self.next('CHIP')
+        name = self.next()
+        self.next('{')
+        inputs = outputs = []
+        parts = []
+        while self.peek() != '}':
+            keyword = self.next()
+            if keyword == 'IN':
+                inputs = self.pins()
+            elif keyword == 'OUT':
+                outputs = self.pins()
+            elif keyword == 'PARTS':
+                self.next(':')
+                while self.peek() not in ('}', 'BUILTIN', 'CLOCKED', None):
+                    parts.append(self.part())
+            elif keyword == 'BUILTIN':
+                return None
+            else:
+                raise HDLError(f"{self.path}: unexpected '{keyword}'")
+        self.next('}')
+        return HDLChip(name, inputs, outputs, parts, self.path)
+
+    def pins(self) -> List[Tuple[str, int]]:
+        pins = []
+        while True:
+            name = self.next()
+            width = 1
+            if self.peek() == '[':
+                self.next('[')
+                width = int(self.next())
+                self.next(']')
+            pins.append((name, width))
+            if self.next() == ';':
+                return pins
+
+    def subscript(self) -> Optional[Tuple[int, int]]:
+        if self.peek() != '[':
+            return None
+        self.next('[')
+        low = high = int(self.next())
+        if self.peek() == '..':
+            self.next('..')
+            high = int(self.next())
+        self.next(']')
+        return low, high
+
+    def part(self) -> Tuple[str, List[Tuple]]:
+        chip = self.next()
+        self.next('(')
+        connections = []
+        while True:
+            pin = self.next()
+            pin_range = self.subscript()
+            self.next('=')
+            signal = self.next()
+            signal_range = self.subscript()
+            connections.append((pin, pin_range, signal, signal_range))
+            if self.next() == ')':
+                break
+        self.next(';')
+        return chip, connections
+
+
+class ChipLibrary:
+    """依官方模擬器的規則找晶片：先找目錄中的 .hdl，沒有 (或是 BUILTIN) 才用內建晶片"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.chips: Dict[str, object] = {}
+
+    def get(self, name: str):
+        if name not in self.chips:
+            path = os.path.join(self.directory, name + '.hdl')
+            chip = HDLParser(path).parse() if os.path.exists(path) else None
+            if chip is None:
+                chip = BUILTIN_CHIPS.get(name)
+            if chip is None:
+                raise HDLError(f"chip {name} not found (no {name}.hdl and no built-in version)")
+            self.chips[name] = chip
+        return self.chips[name]
+
+
+# ============= Netlist =============
+
+def slice_ref(ref: Ref, low: int, width: int) -> Ref:
+    """取出 ref 中第 low 位元起 width 個位元"""
+    result = []
+    offset = 0
+    for net, start, length in ref:
+        begin, end = max(low, offset), min(low + width, offset + length)
+        if begin < end:
+            if net is None:
+                result.append((None, (start >> (begin - offset)) & mask(end - begin), end - begin))
+            else:
+                result.append((net, start + begin - offset, end - begin))
+        offset += length
+    return result
+
+
+class Node:
+    """netlist 中的一個內建晶片實例"""
+
+    def __init__(self, chip, state: Optional[ClockedChip], inputs: Dict[str, Ref], outputs: Dict[str, List[Binding]]):
+        self.chip = chip
+        self.state = state
+        self.inputs = inputs
+        self.outputs = outputs
+
+
+class Netlist:
+    """
+    把晶片展開成內建晶片的 netlist。chip 的 IN pin 直接使用上一層的線路 (不複製)，
+    OUT pin 則是「寫到上一層哪些線路」的清單，所以 out[0]=... 分段寫入也不需要額外的節點。
+    """
+
+    def __init__(self, library: ChipLibrary, top: str):
+        self.library = library
+        self.widths: List[int] = []
+        self.nodes: List[Node] = []
+        self.states: List[ClockedChip] = []
+        self.instances: Dict[str, List[ClockedChip]] = {}  # 晶片名稱 -> 時序晶片實例 (腳本的 RAM16K[0] 等)
+        chip = library.get(top)
+        self.top = chip
+        self.pins: Dict[str, Ref] = {}
+        in_refs = {pin: self.pin_net(pin, width) for pin, width in chip.inputs}
+        out_bindings = {pin: [(0, self.pin_net(pin, width))] for pin, width in chip.outputs}
+        self.instantiate(chip, in_refs, out_bindings, [top])
+
+    def new_net(self, width: int) -> int:
+        self.widths.append(width)
+        return len(self.widths) - 1
+
+    def pin_net(self, pin: str, width: int) -> Ref:
+        ref = [(self.new_net(width), 0, width)]
+        self.pins[pin] = ref
+        return ref
+
+    def instantiate(self, chip, in_refs: Dict[str, Ref], out_bindings: Dict[str, List[Binding]], stack: List[str]):
+        if not isinstance(chip, HDLChip):
+            state = chip() if chip.clocked else None
+            if state is not None:
+                self.states.append(state)
+                self.instances.setdefault(chip.name, []).append(state)
+            self.nodes.append(Node(chip, state, in_refs, out_bindings))
+            return
+
+        widths = dict(chip.inputs + chip.outputs)
+        internal: Dict[str, Ref] = {}
+        where = f"{chip.path}"
+
+        def range_of(name, subscript, width):
+            low, high = subscript if subscript else (0, width - 1)
+            if not 0 <= low <= high < width:
+                raise HDLError(f"{where}: {name}[{low}..{high}] is out of range (width {width})")
+            return low, high - low + 1
+
+        for part_name, connections in chip.parts:
+            if part_name in stack:
+                raise HDLError(f"{where}: {part_name} contains itself")
+            part = self.library.get(part_name)
+            part_inputs, part_outputs = dict(part.inputs), dict(part.outputs)
+            input_pieces: Dict[str, List[Tuple[int, Ref]]] = {}
+            bindings: Dict[str, List[Binding]] = {}
+            for pin, pin_range, signal, signal_range in connections:
+                if pin not in part_inputs and pin not in part_outputs:
+                    raise HDLError(f"{where}: {part_name} has no pin '{pin}'")
+                pin_low, width = range_of(pin, pin_range, part_inputs.get(pin) or part_outputs[pin])
+                if pin in part_inputs:
+                    if signal in ('true', 'false'):
+                        source = [(None, mask(width) if signal == 'true' else 0, width)]
+                    elif signal in in_refs:
+                        low, length = range_of(signal, signal_range, widths[signal])
+                        source = slice_ref(in_refs[signal], low, length)
+                    elif signal in out_bindings:
+                        raise HDLError(f"{where}: output pin '{signal}' cannot be used as an input")
+                    else:
+                        if signal not in internal:
+                            internal[signal] = [(self.new_net(width), 0, width)]
+                        signal_width = internal[signal][0][2]
+                        low, length = range_of(signal, signal_range, signal_width)
+                        source = slice_ref(internal[signal], low, length)
+                    if sum(segment[2] for segment in source) != width:
+                        raise HDLError(f"{where}: width mismatch in {part_name}({pin}={signal})")
+                    input_pieces.setdefault(pin, []).append((pin_low, source))
+                else:
+                    if signal in in_refs or signal in ('true', 'false'):
+                        raise HDLError(f"{where}: cannot write to '{signal}'")
+                    targets = bindings.setdefault(pin, [])
+                    if signal in out_bindings:
+                        low, length = range_of(signal, signal_range, widths[signal])
+                        if length != width:
+                            raise HDLError(f"{where}: width mismatch in {part_name}({pin}={signal})")
+                        for binding_low, ref in out_bindings[signal]:
+                            binding_width = sum(segment[2] for segment in ref)
+                            begin, end = max(low, binding_low), min(low + length, binding_low + binding_width)
+                            if begin < end:
+                                targets.append((pin_low + begin - low,
+                                                slice_ref(ref, begin - binding_low, end - begin)))
+                    else:
+                        if signal_range:
+                            raise HDLError(f"{where}: internal pin '{signal}' cannot be subscripted")
+                        if signal not in internal:
+                            internal[signal] = [(self.new_net(width), 0, width)]
+                        elif internal[signal][0][2] != width:
+                            raise HDLError(f"{where}: width mismatch for internal pin '{signal}'")
+                        targets.append((pin_low, internal[signal]))
+            part_refs = {}
+            for pin, width in part.inputs:
+                ref: Ref = []
+                covered = 0
+                for low, source in sorted(input_pieces.get(pin, []), key=lambda piece: piece[0]):
+                    if low > covered:
+                        ref.append((None, 0, low - covered))
+                    ref += source
+                    covered = low + sum(segment[2] for segment in source)
+                if covered < width:
+                    ref.append((None, 0, width - covered))  # 沒有連接的輸入是 false
+                part_refs[pin] = ref
+            self.instantiate(part, part_refs, bindings, stack + [part_name])
+
+    def schedule(self) -> List[Node]:
+        """組合邏輯的拓撲排序：讀某條線路的節點排在寫它的節點之後"""
+        writers: Dict[int, List[int]] = {}
+        for index, node in enumerate(self.nodes):
+            for bindings in node.outputs.values():
+                for _, ref in bindings:
+                    for net, _, _ in ref:
+                        writers.setdefault(net, []).append(index)
+        dependencies = []
+        for node in self.nodes:
+            depends = set()
+            for pin, ref in node.inputs.items():
+                if pin in node.chip.combinational:
+                    for net, _, _ in ref:
+                        if net is not None:
+                            depends.update(writers.get(net, ()))
+            dependencies.append(depends)
+        users: List[List[int]] = [[] for _ in self.nodes]
+        waiting = [len(depends) for depends in dependencies]
+        for index, depends in enumerate(dependencies):
+            for depend in depends:
+                users[depend].append(index)
+        ready = [index for index, count in enumerate(waiting) if count == 0]
+        order = []
+        while ready:
+            index = ready.pop()
+            order.append(index)
+            for user in users[index]:
+                waiting[user] -= 1
+                if waiting[user] == 0:
+                    ready.append(user)
+        if len(order) != len(self.nodes):
+            loop = sorted({self.nodes[i].chip.name for i, count in enumerate(waiting) if count})
+            raise HDLError(f"combinational loop through {', '.join(loop)}")
+        return [self.nodes[index] for index in order]
+
+
+# ============= 產生模擬程式 =============
+
+def read_expression(ref: Ref, widths: List[int]) -> str:
+    terms = []
+    offset = 0
+    for net, start, width in ref:
+        if net is None:
+            if start:
+                terms.append(str(start << offset))
+        else:
+            term = f"v[{net}]" if start == 0 and width == widths[net] else f"(v[{net}] >> {start} & {mask(width)})"
+            terms.append(f"{term} << {offset}" if offset else term)
+        offset += width
+    if not terms:
+        return '0'
+    return terms[0] if len(terms) == 1 else '(' + ' | '.join(terms) + ')'
+
+
+def write_statements(value: str, pin_width: int, bindings: List[Binding], widths: List[int]) -> List[str]:
+    """把輸出 pin 的值 (pin_width 位元) 寫到各段線路"""
+    lines = []
+    for pin_low, ref in bindings:
+        offset = pin_low
+        for net, start, width in ref:
+            if offset == 0 and width == pin_width:
+                piece = value
+            else:
+                piece = f"({value} >> {offset} & {mask(width)})" if offset else f"({value} & {mask(width)})"
+            if start == 0 and width == widths[net]:
+                lines.append(f"v[{net}] = {piece}")
+            else:
+                keep = mask(widths[net]) ^ (mask(width) << start)
+                lines.append(f"v[{net}] = v[{net}] & {keep} | {piece} << {start}")
+            offset += width
+    return lines
+
+
+def generate(netlist: Netlist) -> Tuple[Callable, Callable, int]:
+    """
+    產生 evaluate(v, s) (依拓撲順序計算全部的組合邏輯) 和 tick(v, s) (時序晶片取樣輸入)，
+    v 是線路的值，s 是時序晶片的實例。回傳 (evaluate, tick, 敘述數)。
+    """
+    widths = netlist.widths
+    state_index = {id(state): index for index, state in enumerate(netlist.states)}
+    functions = {}
+    evaluate_lines, tick_lines = [], []
+    for node in netlist.schedule():
+        chip = node.chip
+        inputs = {pin: f"({read_expression(node.inputs[pin], widths)})" for pin, _ in chip.inputs}
+        if node.state is not None:
+            inputs['state'] = f"s[{state_index[id(node.state)]}]"
+            if chip.inputs:
+                tick_lines.append(f"{inputs['state']}.tick({', '.join(inputs[pin] for pin, _ in chip.inputs)})")
+        if chip.function is not None:
+            name = f"f_{chip.name}"
+            functions[name] = chip.function
+            evaluate_lines.append(f"t = {name}({', '.join(inputs[pin] for pin, _ in chip.inputs)})")
+            for index, (pin, width) in enumerate(chip.outputs):
+                if node.outputs.get(pin):
+                    evaluate_lines.append(f"o = t[{index}]")
+                    evaluate_lines += write_statements('o', width, node.outputs[pin], widths)
+            continue
+        for pin, width in chip.outputs:
+            if node.outputs.get(pin):
+                expression = chip.expressions[pin].format(**inputs)
+                bindings = node.outputs[pin]
+                if len(bindings) == 1 and len(bindings[0][1]) == 1:
+                    evaluate_lines += write_statements(f"({expression})", width, bindings, widths)
+                else:
+                    evaluate_lines.append(f"o = {expression}")
+                    evaluate_lines += write_statements('o', width, bindings, widths)
+    source = ("def evaluate(v, s):\n" + ''.join(f"    {line}\n" for line in evaluate_lines) + "    pass\n"
+              "def tick(v, s):\n" + ''.join(f"    {line}\n" for line in tick_lines) + "    pass\n")
+    namespace = dict(functions)
+    exec(compile(source, f"<netlist {netlist.top.name}>", 'exec'), namespace)
+    return namespace['evaluate'], namespace['tick'], len(evaluate_lines)
+
+
+# ============= 模擬器 =============
+
+class HardwareSimulator:
+    """載入一個晶片並模擬：set 輸入、eval、tick / tock，讀取 pin 或內部狀態"""
+
+    def __init__(self, hdl_path: str):
+        directory, file_name = os.path.split(os.path.abspath(hdl_path))
+        self.netlist = Netlist(ChipLibrary(directory), os.path.splitext(file_name)[0])
+        self.evaluate_netlist, self.tick_netlist, self.statements = generate(self.netlist)
+        self.values = [0] * len(self.netlist.widths)
+        self.states = self.netlist.states
+        self.time = 0
+        self.half_cycle = False
+        self.eval()
+
+    def eval(self):
+        self.evaluate_netlist(self.values, self.states)
+
+    def tick(self):
+        self.eval()
+        self.tick_netlist(self.values, self.states)
+        self.eval()
+        self.half_cycle = True
+
+    def tock(self):
+        for state in self.states:
+            state.tock()
+        self.eval()
+        self.time += 1
+        self.half_cycle = False
+
+    def pin(self, name: str) -> Ref:
+        if name not in self.netlist.pins:
+            raise HDLError(f"{self.netlist.top.name} has no pin '{name}'")
+        return self.netlist.pins[name]
+
+    def get(self, name: str):
+        if name == 'time':
+            return f"{self.time}+" if self.half_cycle else str(self.time)
+        base, index = split_name(name)
+        if base in self.netlist.pins:
+            net = self.pin(base)[0][0]
+            value = self.values[net]
+            return value if index is None else value >> index & 1
+        return self.instance(base).peek(index)
+
+    def set(self, name: str, value: int):
+        base, index = split_name(name)
+        if base in dict(self.netlist.top.inputs):
+            net = self.pin(base)[0][0]
+            width = self.netlist.widths[net]
+            if index is None:
+                self.values[net] = value & mask(width)
+            else:
+                self.values[net] = self.values[net] & (mask(width) ^ (1 << index)) | (value & 1) << index
+        elif base in self.netlist.instances:
+            self.instance(base).poke(index, value & 0xFFFF)
+        else:
+            raise HDLError(f"cannot set '{name}'")
+
+    def instance(self, chip_name: str) -> ClockedChip:
+        if chip_name not in self.netlist.instances:
+            raise HDLError(f"no pin or built-in part named '{chip_name}'")
+        return self.netlist.instances[chip_name][0]
+
+    def press(self, key: int):
+        for keyboard in self.netlist.instances.get('Keyboard', []):
+            keyboard.value = keyboard.next = key
+
+
+def split_name(name: str) -> Tuple[str, Optional[int]]:
+    """RAM16K[5] -> ('RAM16K', 5)；DRegister[] -> ('DRegister', None)"""
+    if name.endswith(']') and '[' in name:
+        base, index = name[:-1].split('[', 1)
+        return base, int(index) if index else None
+    return name, None
+
+
+class HardwareTarget:
+    """給 TestRunner 用的介面：HardwareSimulator 的腳本指令 (eval、tick、tock、ROM32K load ...)"""
+
+    def __init__(self, hdl_path: str):
+        self.directory = os.path.dirname(os.path.abspath(hdl_path))
+        self.simulator = HardwareSimulator(hdl_path)
+
+    def get(self, name: str):
+        return self.simulator.get(name)
+
+    def set(self, name: str, value: int):
+        self.simulator.set(name, value)
+
+    def press(self, key: int):
+        self.simulator.press(key)
+
+    def step(self, command: str, count: int = 1) -> bool:
+        simulator = self.simulator
+        actions = {'eval': (simulator.eval,), 'tick': (simulator.tick,), 'tock': (simulator.tock,),
+                   'ticktock': (simulator.tick, simulator.tock)}
+        if command not in actions:
+            return False
+        for _ in range(count):
+            for action in actions[command]:
+                action()
+        return True
+
+    def command(self, tokens: List[str]) -> bool:
+        """"ROM32K load Xxx.hack" 這類對內建零件下的指令"""
+        if len(tokens) == 3 and tokens[1] == 'load' and tokens[0] in self.simulator.netlist.instances:
+            self.simulator.instance(tokens[0]).load(os.path.join(self.directory, tokens[2]))
+            return True
+        return False
+
+
+# ============= --verify =============
+
+def verify(hdl_path: str, vectors: int, seed: int = 0) -> bool:
+    """
+    和同名的內建晶片比較所有輸出 (只適用組合邏輯晶片)。
+    輸入總共不超過 20 位元時窮舉，否則取 vectors 組隨機輸入。
+    """
+    simulator = HardwareSimulator(hdl_path)
+    netlist = simulator.netlist
+    name = netlist.top.name
+    reference = BUILTIN_CHIPS.get(name)
+    if reference is None or reference.clocked or netlist.states:
+        print(f"Error: {name} is not a combinational chip with a built-in reference")
+        return False
+    inputs = netlist.top.inputs
+    total_bits = sum(width for _, width in inputs)
+    exhaustive = total_bits <= 20
+    count = 1 << total_bits if exhaustive else vectors
+    generator = random.Random(seed)
+    if exhaustive:
+        columns = {pin: [(n >> sum(w for _, w in inputs[:i])) & mask(width) for n in range(count)]
+                   for i, (pin, width) in enumerate(inputs)}
+    else:
+        columns = {pin: [generator.getrandbits(width) for _ in range(count)] for pin, width in inputs}
+
+    expected_evaluate = _reference_function(reference)
+
+    if np is not None:
+        values = [np.zeros(count, dtype=np.int64) for _ in netlist.widths]
+        for pin, _ in inputs:
+            values[netlist.pins[pin][0][0]] = np.array(columns[pin], dtype=np.int64)
+        simulator.evaluate_netlist(values, [])
+        actual = {pin: np.asarray(values[netlist.pins[pin][0][0]]) for pin, _ in netlist.top.outputs}
+        expected = expected_evaluate({pin: np.array(columns[pin], dtype=np.int64) for pin, _ in inputs})
+        mismatches = [int(np.nonzero(actual[pin] != expected[pin])[0].min(initial=count))
+                      for pin, _ in reference.outputs]
+        first = min(mismatches) if min(mismatches) < count else None
+    else:
+        first = None
+        for i in range(count):
+            for pin, _ in inputs:
+                simulator.set(pin, columns[pin][i])
+            simulator.eval()
+            expected = expected_evaluate({pin: columns[pin][i] for pin, _ in inputs})
+            if any(simulator.get(pin) != expected[pin] for pin, _ in reference.outputs):
+                first = i
+                break
+
+    mode = 'exhaustive' if exhaustive else f'random (seed {seed})'
+    engine = 'NumPy' if np is not None else 'Python'
+    if first is None:
+        print(f"{name}: {count} {mode} vector(s) match the built-in chip "
+              f"({len(netlist.nodes)} part(s), {simulator.statements} statement(s), {engine})")
+        return True
+    for pin, _ in inputs:
+        simulator.set(pin, columns[pin][first])
+    simulator.eval()
+    expected = expected_evaluate({pin: columns[pin][first] for pin, _ in inputs})
+    shown = ', '.join(f"{pin}={columns[pin][first]}" for pin, _ in inputs)
+    print(f"{name}: mismatch for {shown}")
+    for pin, _ in reference.outputs:
+        print(f"  {pin}: expected {expected[pin]}, got {simulator.get(pin)}")
+    return False
+
+
+def _reference_function(chip: BuiltinChip) -> Callable:
+    """內建晶片的運算式 -> 函數 (輸入 dict -> 輸出 dict)"""
+    if chip.function is not None:
+        return lambda inputs: dict(zip((pin for pin, _ in chip.outputs),
+                                       chip.function(*(inputs[pin] for pin, _ in chip.inputs))))
+    code = {pin: compile(expression.format(**{name: f"inputs[{name!r}]" for name, _ in chip.inputs}),
+                         f"<{chip.name}.{pin}>", 'eval')
+            for pin, expression in chip.expressions.items()}
+    return lambda inputs: {pin: eval(expression, {}, {'inputs': inputs}) for pin, expression in code.items()}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        usage="python HardwareSimulator.py <Chip.tst ...> | --verify [--vectors N] <Chip.hdl>")
+    arg_parser.add_argument('paths', nargs='+', help=".tst 腳本 (和 .cmp 比對)，或 --verify 的 .hdl")
+    arg_parser.add_argument('--verify', action='store_true',
+                            help="和內建的參考晶片比較 (組合邏輯晶片；少於 20 個輸入位元時窮舉)")
+    arg_parser.add_argument('--vectors', type=int, default=100_000,
+                            help="--verify 的隨機向量數 (預設 100000)")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    try:
+        if args.verify:
+            results = [verify(path, args.vectors, args.seed) for path in args.paths]
+            sys.exit(0 if all(results) else 1)
+        spec = importlib.util.spec_from_file_location('TestRunner', TEST_RUNNER)
+        test_runner = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(test_runner)
+    except (HDLError, OSError) as error:
+        print(f"Error: {error}")
+        sys.exit(1)
+
+    failed = 0
+    for script, status, message, elapsed in test_runner.run_tests(test_runner.find_scripts(args.paths)):
+        failed += status == 'FAIL'
+        print(f"{status} {os.path.relpath(script)} ({elapsed:.2f} s): {message}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,10 @@
 import sys
 import os
 import re
+import time
+import argparse
+from itertools import zip_longest
+from concurrent.futures import ProcessPoolExecutor
 
 # ==========================================
 # 1. 基礎定義 (關鍵字與符號)
@@ -26,6 +30,15 @@ XML_MAP = {
 
 OPS = {'+', '-', '*', '/', '&', '|', '<', '>', '='}
 
+UNARY_OPS = frozenset({'-', '~'})
+
+# 各文法結構的起始關鍵字
+CLASS_VAR_KEYWORDS = frozenset({'static', 'field'})
+SUBROUTINE_KEYWORDS = frozenset({'constructor', 'function', 'method'})
+
+# compile_term 中直接輸出的 token 類型
+CONSTANT_TYPES = frozenset({'INT_CONST', 'STRING_CONST', 'KEYWORD'})
+
 # ==========================================
 # 2. JackTokenizer (分詞器)
 # ==========================================
@@ -36,6 +49,14 @@ class JackTokenizer:
             content = f.read()
         
         self.tokens = self._tokenize(content)
+        # 每個 token 的類型在分詞時就決定好，相同字串只判斷一次
+        kinds = {}
+        self.token_types = []
+        for token in self.tokens:
+            kind = kinds.get(token)
+            if kind is None:
+                kind = kinds[token] = self._classify(token)
+            self.token_types.append(kind)
         self.current_token_idx = 0
         self.current_token = ""
         self.token_type = ""
@@ -54,30 +75,32 @@ class JackTokenizer:
         for match in matches:
             for group in match:
                 if group:
-                    tokens.append(group)
+                    # intern 之後，查表時字串比較可直接比對位址
+                    tokens.append(sys.intern(group))
         return tokens
 
     def has_more_tokens(self):
         return self.current_token_idx < len(self.tokens)
 
     def advance(self):
-        if self.has_more_tokens():
-            self.current_token = self.tokens[self.current_token_idx]
-            self.current_token_idx += 1
-            self._set_token_type()
-
-    def _set_token_type(self):
-        token = self.current_token
+        idx = self.current_token_idx
+        if idx < len(self.tokens):
+            self.current_token = self.tokens[idx]
+            self.token_type = self.token_types[idx]
+            self.current_token_idx = idx + 1
+
+    @staticmethod
+    def _classify(token):
         if token in KEYWORDS:
-            self.token_type = 'KEYWORD'
+            return 'KEYWORD'
         elif token in SYMBOLS:
-            self.token_type = 'SYMBOL'
+            return 'SYMBOL'
         elif token.isdigit():
-            self.token_type = 'INT_CONST'
+            return 'INT_CONST'
         elif token.startswith('"'):
-            self.token_type = 'STRING_CONST'
+            return 'STRING_CONST'
         else:
-            self.token_type = 'IDENTIFIER'
+            return 'IDENTIFIER'
 
     def string_val(self): return self.current_token[1:-1]
 
@@ -87,73 +110,102 @@ class JackTokenizer:
         return ""
 
 # ==========================================
-# 3. CompilationEngine (語法分析引擎)
+# 3. 語法樹節點 (AST)
+# ==========================================
+
+# Token 類型對應到 XML 標籤 (也是 Terminal 節點的 tag)
+TAG_MAP = {
+    'KEYWORD': 'keyword',
+    'SYMBOL': 'symbol',
+    'IDENTIFIER': 'identifier',
+    'INT_CONST': 'integerConstant',
+    'STRING_CONST': 'stringConstant'
+}
+
+class Node:
+    """非終結符號 (class, statements, expression ...)，children 依序排列"""
+    __slots__ = ('tag', 'children')
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.children = []
+
+class Terminal:
+    """終結符號 (token)，tag 為 keyword / symbol / identifier ..."""
+    __slots__ = ('tag', 'value')
+
+    def __init__(self, tag, value):
+        self.tag = tag
+        self.value = value
+
+# ==========================================
+# 4. CompilationEngine (語法分析引擎)
 # ==========================================
 
 class CompilationEngine:
-    def __init__(self, tokenizer, output_path):
-        # 確保父目錄存在
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        self.outfile = open(output_path, 'w', encoding='utf-8')
+    """
+    依文法建立語法樹 (AST)，本身不輸出任何東西；
+    XML 等輸出由後端 (write_xml ...) 走訪語法樹產生。
+    """
+    def __init__(self, tokenizer, output_path=None):
         self.tokenizer = tokenizer
-        self.indent_level = 0
-        
+        self.output_path = output_path
+        self.root = None
+        self._stack = []
+        # statement 關鍵字 -> 對應的編譯方法 (取代 if/elif 比較鏈)
+        self._statement_table = {
+            'let': self.compile_let,
+            'if': self.compile_if,
+            'while': self.compile_while,
+            'do': self.compile_do,
+            'return': self.compile_return,
+        }
+
         if self.tokenizer.has_more_tokens():
             self.tokenizer.advance()
 
     def close(self):
-        self.outfile.close()
-
-    def _write_tag(self, tag, value=None, is_terminal=False):
-        indent = '  ' * self.indent_level
-        if is_terminal:
-            val_escaped = XML_MAP.get(value, value)
-            self.outfile.write(f"{indent}<{tag}> {val_escaped} </{tag}>\n")
+        # 相容舊用法：有給 output_path 就輸出 XML
+        if self.output_path and self.root is not None:
+            write_xml(self.root, self.output_path)
+
+    def _begin(self, tag):
+        node = Node(tag)
+        if self._stack:
+            self._stack[-1].children.append(node)
         else:
-            if value == 'start':
-                self.outfile.write(f"{indent}<{tag}>\n")
-                self.indent_level += 1
-            elif value == 'end':
-                self.indent_level -= 1
-                indent = '  ' * self.indent_level
-                self.outfile.write(f"{indent}</{tag}>\n")
+            self.root = node
+        self._stack.append(node)
+
+    def _end(self):
+        self._stack.pop()
 
     def _process(self, expected_token=None):
-        curr_token = self.tokenizer.current_token
         curr_type = self.tokenizer.token_type
-        
-        tag_map = {
-            'KEYWORD': 'keyword',
-            'SYMBOL': 'symbol',
-            'IDENTIFIER': 'identifier',
-            'INT_CONST': 'integerConstant',
-            'STRING_CONST': 'stringConstant'
-        }
-        
-        tag = tag_map.get(curr_type)
         if curr_type == 'STRING_CONST':
             value = self.tokenizer.string_val()
         else:
-            value = curr_token
+            value = self.tokenizer.current_token
 
-        self._write_tag(tag, value, is_terminal=True)
+        self._stack[-1].children.append(Terminal(TAG_MAP.get(curr_type), value))
         self.tokenizer.advance()
 
     # --- Structure ---
     def compile_class(self):
-        self._write_tag('class', 'start')
+        self._begin('class')
         self._process('class')
         self._process()
         self._process('{')
-        while self.tokenizer.current_token in ['static', 'field']:
+        while self.tokenizer.current_token in CLASS_VAR_KEYWORDS:
             self.compile_class_var_dec()
-        while self.tokenizer.current_token in ['constructor', 'function', 'method']:
+        while self.tokenizer.current_token in SUBROUTINE_KEYWORDS:
             self.compile_subroutine()
         self._process('}')
-        self._write_tag('class', 'end')
+        self._end()
+        return self.root
 
     def compile_class_var_dec(self):
-        self._write_tag('classVarDec', 'start')
+        self._begin('classVarDec')
         self._process() 
         self._process()
         self._process()
@@ -161,10 +213,10 @@ class CompilationEngine:
             self._process(',')
             self._process()
         self._process(';')
-        self._write_tag('classVarDec', 'end')
+        self._end()
 
     def compile_subroutine(self):
-        self._write_tag('subroutineDec', 'start')
+        self._begin('subroutineDec')
         self._process()
         self._process()
         self._process()
@@ -172,10 +224,10 @@ class CompilationEngine:
         self.compile_parameter_list()
         self._process(')')
         self.compile_subroutine_body()
-        self._write_tag('subroutineDec', 'end')
+        self._end()
 
     def compile_parameter_list(self):
-        self._write_tag('parameterList', 'start')
+        self._begin('parameterList')
         if self.tokenizer.current_token != ')':
             self._process()
             self._process()
@@ -183,19 +235,19 @@ class CompilationEngine:
                 self._process(',')
                 self._process()
                 self._process()
-        self._write_tag('parameterList', 'end')
+        self._end()
 
     def compile_subroutine_body(self):
-        self._write_tag('subroutineBody', 'start')
+        self._begin('subroutineBody')
         self._process('{')
         while self.tokenizer.current_token == 'var':
             self.compile_var_dec()
         self.compile_statements()
         self._process('}')
-        self._write_tag('subroutineBody', 'end')
+        self._end()
 
     def compile_var_dec(self):
-        self._write_tag('varDec', 'start')
+        self._begin('varDec')
         self._process('var')
         self._process()
         self._process()
@@ -203,21 +255,20 @@ class CompilationEngine:
             self._process(',')
             self._process()
         self._process(';')
-        self._write_tag('varDec', 'end')
+        self._end()
 
     # --- Statements ---
     def compile_statements(self):
-        self._write_tag('statements', 'start')
-        while self.tokenizer.current_token in ['let', 'if', 'while', 'do', 'return']:
-            if self.tokenizer.current_token == 'let': self.compile_let()
-            elif self.tokenizer.current_token == 'if': self.compile_if()
-            elif self.tokenizer.current_token == 'while': self.compile_while()
-            elif self.tokenizer.current_token == 'do': self.compile_do()
-            elif self.tokenizer.current_token == 'return': self.compile_return()
-        self._write_tag('statements', 'end')
+        self._begin('statements')
+        dispatch = self._statement_table.get
+        compile_statement = dispatch(self.tokenizer.current_token)
+        while compile_statement:
+            compile_statement()
+            compile_statement = dispatch(self.tokenizer.current_token)
+        self._end()
 
     def compile_let(self):
-        self._write_tag('letStatement', 'start')
+        self._begin('letStatement')
         self._process('let')
         self._process()
         if self.tokenizer.current_token == '[':
@@ -227,10 +278,10 @@ class CompilationEngine:
         self._process('=')
         self.compile_expression()
         self._process(';')
-        self._write_tag('letStatement', 'end')
+        self._end()
 
     def compile_if(self):
-        self._write_tag('ifStatement', 'start')
+        self._begin('ifStatement')
         self._process('if')
         self._process('(')
         self.compile_expression()
@@ -243,10 +294,10 @@ class CompilationEngine:
             self._process('{')
             self.compile_statements()
             self._process('}')
-        self._write_tag('ifStatement', 'end')
+        self._end()
 
     def compile_while(self):
-        self._write_tag('whileStatement', 'start')
+        self._begin('whileStatement')
         self._process('while')
         self._process('(')
         self.compile_expression()
@@ -254,10 +305,10 @@ class CompilationEngine:
         self._process('{')
         self.compile_statements()
         self._process('}')
-        self._write_tag('whileStatement', 'end')
+        self._end()
 
     def compile_do(self):
-        self._write_tag('doStatement', 'start')
+        self._begin('doStatement')
         self._process('do')
         self._process()
         if self.tokenizer.current_token == '.':
@@ -267,31 +318,31 @@ class CompilationEngine:
         self.compile_expression_list()
         self._process(')')
         self._process(';')
-        self._write_tag('doStatement', 'end')
+        self._end()
 
     def compile_return(self):
-        self._write_tag('returnStatement', 'start')
+        self._begin('returnStatement')
         self._process('return')
         if self.tokenizer.current_token != ';':
             self.compile_expression()
         self._process(';')
-        self._write_tag('returnStatement', 'end')
+        self._end()
 
     # --- Expressions ---
     def compile_expression(self):
-        self._write_tag('expression', 'start')
+        self._begin('expression')
         self.compile_term()
         while self.tokenizer.current_token in OPS:
             self._process()
             self.compile_term()
-        self._write_tag('expression', 'end')
+        self._end()
 
     def compile_term(self):
-        self._write_tag('term', 'start')
+        self._begin('term')
         token = self.tokenizer.current_token
         type = self.tokenizer.token_type
         
-        if type in ['INT_CONST', 'STRING_CONST', 'KEYWORD']:
+        if type in CONSTANT_TYPES:
             self._process()
         elif type == 'IDENTIFIER':
             next_token = self.tokenizer.peek()
@@ -314,32 +365,137 @@ class CompilationEngine:
             self._process('(')
             self.compile_expression()
             self._process(')')
-        elif token in ['-', '~']:
+        elif token in UNARY_OPS:
             self._process()
             self.compile_term()
-        self._write_tag('term', 'end')
+        self._end()
 
     def compile_expression_list(self):
-        self._write_tag('expressionList', 'start')
+        self._begin('expressionList')
         if self.tokenizer.current_token != ')':
             self.compile_expression()
             while self.tokenizer.current_token == ',':
                 self._process(',')
                 self.compile_expression()
-        self._write_tag('expressionList', 'end')
+        self._end()
 
 # ==========================================
-# 4. 主程式 (修改後：新增 output 資料夾邏輯)
+# 5. 後端 (走訪語法樹的輸出器)
 # ==========================================
 
-def analyze_file(input_file, output_dir):
+def walk(node):
+    """前序走訪語法樹，依序產生每個 Node / Terminal"""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        if isinstance(current, Node):
+            stack.extend(reversed(current.children))
+
+def xml_lines(node, indent_level=0):
+    """語法樹 -> XML 行 (與原本串流輸出的格式相同)"""
+    indent = '  ' * indent_level
+    if isinstance(node, Terminal):
+        yield f"{indent}<{node.tag}> {XML_MAP.get(node.value, node.value)} </{node.tag}>\n"
+        return
+    yield f"{indent}<{node.tag}>\n"
+    for child in node.children:
+        yield from xml_lines(child, indent_level + 1)
+    yield f"{indent}</{node.tag}>\n"
+
+def token_xml_lines(node):
+    """語法樹 -> Tokenizer 測試用的 XxxT.xml 格式"""
+    yield "<tokens>\n"
+    for item in walk(node):
+        if isinstance(item, Terminal):
+            yield f"<{item.tag}> {XML_MAP.get(item.value, item.value)} </{item.tag}>\n"
+    yield "</tokens>\n"
+
+def write_xml(root, output_path, lines=xml_lines):
+    # 確保父目錄存在
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.writelines(lines(root))
+
+def parse_file(input_file):
+    """只做一次分詞與語法分析，回傳語法樹給各個後端共用"""
+    tokenizer = JackTokenizer(input_file)
+    engine = CompilationEngine(tokenizer)
+    return engine.compile_class()
+
+# ==========================================
+# 6. XML 比對器 (取代外部 TextComparer)
+# ==========================================
+
+XML_TOKEN_RE = re.compile(r'<[^>]*>|[^<]+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+def xml_tokens(lines):
+    """
+    逐行把 XML 切成 token (標籤或文字)，忽略所有空白。
+    產生 (token, 行號, 欄號)；lines 可以是檔案物件或 xml_lines() 的結果。
+    """
+    for line_no, line in enumerate(lines, 1):
+        for m in XML_TOKEN_RE.finditer(line):
+            text = m.group()
+            token = WHITESPACE_RE.sub('', text)
+            if token:
+                col = m.start() + len(text) - len(text.lstrip()) + 1
+                yield token, line_no, col
+
+def compare_xml(actual_lines, expected_lines):
+    """
+    兩邊同步一個 token 一個 token 比對，不必整份讀進記憶體。
+    相同回傳 None；否則回傳第一個差異 (actual, expected)，
+    各為 (token, 行號, 欄號)，檔案提早結束的一方為 None。
+    """
+    for actual, expected in zip_longest(xml_tokens(actual_lines), xml_tokens(expected_lines)):
+        if actual is None or expected is None or actual[0] != expected[0]:
+            return actual, expected
+    return None
+
+def format_divergence(name, divergence):
+    actual, expected = divergence
+    def describe(item):
+        if item is None:
+            return "<end of file>"
+        token, line_no, col = item
+        return f"'{token}' at line {line_no}, col {col}"
+    return f"{name}: generated {describe(actual)} != expected {describe(expected)}"
+
+def check_file(input_file, root):
+    """
+    和 .jack 同目錄下的參考答案比對 (Xxx.xml 與 XxxT.xml)。
+    回傳 (比對過的檔名, 失敗訊息) 的 list。
+    """
+    base = input_file[:-len('.jack')]
+    results = []
+    for suffix, lines in (('.xml', xml_lines), ('T.xml', token_xml_lines)):
+        expected_path = base + suffix
+        if not os.path.isfile(expected_path):
+            continue
+        with open(expected_path, 'r', encoding='utf-8') as expected:
+            divergence = compare_xml(lines(root), expected)
+        message = format_divergence(expected_path, divergence) if divergence else None
+        results.append((expected_path, message))
+    return results
+
+# ==========================================
+# 7. 主程式 (修改後：新增 output 資料夾邏輯)
+# ==========================================
+
+def analyze_file(input_file, output_dir, check=False):
     """
     input_file: 原始 .jack 檔案的完整路徑
     output_dir: 輸出的資料夾路徑
+    check: 是否和參考答案 XML 比對
+    回傳 (檔名, 花費秒數, 比對結果)，給 main 統計用
     """
     if not input_file.endswith('.jack'):
-        return
+        return None
     
+    start = time.perf_counter()
+
     # 取得原始檔名 (例如 Main.jack)
     base_name = os.path.basename(input_file)
     # 替換副檔名 (例如 Main.xml)
@@ -349,44 +505,101 @@ def analyze_file(input_file, output_dir):
     
     print(f"Compiling: {base_name} -> output/{xml_name}")
     
-    tokenizer = JackTokenizer(input_file)
-    engine = CompilationEngine(tokenizer, output_path)
-    engine.compile_class()
-    engine.close()
+    root = parse_file(input_file)
+    write_xml(root, output_path)
+    checks = check_file(input_file, root) if check else []
+
+    return base_name, time.perf_counter() - start, checks
+
+def analyze_files(input_files, output_dir, jobs=1, check=False):
+    """
+    分析多個檔案；jobs > 1 時用 process pool 平行處理，
+    每個 worker 自己寫出自己的 XML，回傳每個檔案的結果。
+    """
+    if jobs > 1 and len(input_files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(analyze_file, f, output_dir, check) for f in input_files]
+            return [future.result() for future in futures]
+    return [analyze_file(f, output_dir, check) for f in input_files]
+
+def print_timings(results, total, jobs):
+    print("\nTiming:")
+    for name, elapsed, _ in sorted(results, key=lambda r: -r[1]):
+        print(f"  {name:<24}{elapsed * 1000:8.2f} ms")
+    print(f"Total: {len(results)} files in {total * 1000:.2f} ms (jobs={jobs})")
+
+def print_checks(results):
+    """印出比對結果，回傳失敗的數量"""
+    passed = failed = 0
+    for _, _, checks in results:
+        for name, message in checks:
+            if message is None:
+                passed += 1
+            else:
+                failed += 1
+                print(f"FAIL {message}")
+    print(f"Check: {passed} passed, {failed} failed")
+    return failed
+
+def find_jack_dirs(path):
+    """目錄本身或其子目錄中含有 .jack 的資料夾 (略過 output)"""
+    jack_dirs = []
+    for dir_path, dir_names, file_names in os.walk(path):
+        dir_names[:] = sorted(d for d in dir_names if d != "output")
+        if any(f.endswith(".jack") for f in file_names):
+            jack_dirs.append(dir_path)
+    return jack_dirs
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python JackAnalyzer.py [file.jack|dir]")
-        return
-    
-    path = sys.argv[1]
+    arg_parser = argparse.ArgumentParser(
+        usage="python JackAnalyzer.py [--jobs N] [--check] [file.jack|dir ...]")
+    arg_parser.add_argument('paths', nargs='+')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help="平行處理的 process 數 (0 = CPU 核心數)")
+    arg_parser.add_argument('--check', action='store_true',
+                            help="和 .jack 旁邊的 Xxx.xml / XxxT.xml 參考答案比對")
+    args = arg_parser.parse_args()
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
     
     # 定義輸出資料夾名稱
     OUTPUT_FOLDER_NAME = "output"
 
-    if os.path.isdir(path):
-        # 如果輸入是目錄，在該目錄下建立 output 資料夾
-        output_dir = os.path.join(path, OUTPUT_FOLDER_NAME)
-        # exist_ok=True 表示如果資料夾已存在也不會報錯
-        os.makedirs(output_dir, exist_ok=True)
-        
-        print(f"Processing directory: {path}")
-        print(f"Output directory: {output_dir}\n")
-
-        for filename in os.listdir(path):
-            if filename.endswith(".jack"):
-                full_input_path = os.path.join(path, filename)
-                analyze_file(full_input_path, output_dir)
-                
-    elif os.path.isfile(path):
-        # 如果輸入是檔案，在該檔案所在目錄下建立 output 資料夾
-        dir_path = os.path.dirname(path)
-        output_dir = os.path.join(dir_path, OUTPUT_FOLDER_NAME)
-        os.makedirs(output_dir, exist_ok=True)
-        
-        analyze_file(path, output_dir)
-    else:
-        print("Invalid file or directory")
+    results = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            for jack_dir in find_jack_dirs(path):
+                # 如果輸入是目錄，在該目錄下建立 output 資料夾
+                output_dir = os.path.join(jack_dir, OUTPUT_FOLDER_NAME)
+                # exist_ok=True 表示如果資料夾已存在也不會報錯
+                os.makedirs(output_dir, exist_ok=True)
+
+                print(f"Processing directory: {jack_dir}")
+                print(f"Output directory: {output_dir}\n")
+
+                input_files = [os.path.join(jack_dir, filename)
+                               for filename in sorted(os.listdir(jack_dir))
+                               if filename.endswith(".jack")]
+                start = time.perf_counter()
+                dir_results = analyze_files(input_files, output_dir, jobs, args.check)
+                print_timings(dir_results, time.perf_counter() - start, jobs)
+                print()
+                results.extend(dir_results)
+
+        elif os.path.isfile(path):
+            # 如果輸入是檔案，在該檔案所在目錄下建立 output 資料夾
+            dir_path = os.path.dirname(path)
+            output_dir = os.path.join(dir_path, OUTPUT_FOLDER_NAME)
+            os.makedirs(output_dir, exist_ok=True)
+
+            result = analyze_file(path, output_dir, args.check)
+            if result:
+                results.append(result)
+        else:
+            print(f"Invalid file or directory: {path}")
+
+    if args.check and print_checks(results):
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
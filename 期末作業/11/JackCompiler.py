@@ -1,6 +1,12 @@
 import sys
 import os
 import re
+import io
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 # ==========================================
 # 1. 基礎定義
@@ -23,11 +29,62 @@ OP_MAP = {
     '&': 'and', '|': 'or', '<': 'lt', '>': 'gt', '=': 'eq'
 }
 
+# 預先拆好的運算子輸出: op -> (指令或函數名稱, 參數數量)；參數數量為 None 表示算術指令
+OP_TABLE = {
+    op: (cmd.split()[1], int(cmd.split()[2])) if cmd.startswith('call') else (cmd, None)
+    for op, cmd in OP_MAP.items()
+}
+
 # Unary 運算子
 UNARY_OP_MAP = {
     '-': 'neg', '~': 'not'
 }
 
+# 各文法結構的起始關鍵字
+CLASS_VAR_KEYWORDS = frozenset({'static', 'field'})
+SUBROUTINE_KEYWORDS = frozenset({'constructor', 'function', 'method'})
+STATEMENT_KEYWORDS = frozenset({'let', 'if', 'while', 'do', 'return'})
+TYPE_KEYWORDS = frozenset({'int', 'char', 'boolean'})
+
+# 錯誤復原 (panic mode) 的同步點：跳過 token 直到遇到這些 token 為止
+STATEMENT_SYNC = STATEMENT_KEYWORDS | SUBROUTINE_KEYWORDS | {'}'}
+MEMBER_SYNC = CLASS_VAR_KEYWORDS | SUBROUTINE_KEYWORDS
+
+# --string-pool: 每個 class 產生的字串常數初始化函數名稱 (Class._initStrings)
+STRING_POOL_INIT = '_initStrings'
+
+# Jack OS 的 API (--project 檢查呼叫用)：class -> {subroutine: (kind, 參數數量)}
+# method 的參數數量不含 this
+OS_API = {
+    'Math': {name: ('function', n) for name, n in {
+        'init': 0, 'abs': 1, 'multiply': 2, 'divide': 2, 'min': 2, 'max': 2, 'sqrt': 1}.items()},
+    'String': {
+        'new': ('constructor', 1), 'dispose': ('method', 0), 'length': ('method', 0),
+        'charAt': ('method', 1), 'setCharAt': ('method', 2), 'appendChar': ('method', 1),
+        'eraseLastChar': ('method', 0), 'intValue': ('method', 0), 'setInt': ('method', 1),
+        'backSpace': ('function', 0), 'doubleQuote': ('function', 0), 'newLine': ('function', 0)},
+    'Array': {'new': ('function', 1), 'dispose': ('method', 0)},
+    'Output': {name: ('function', n) for name, n in {
+        'init': 0, 'moveCursor': 2, 'printChar': 1, 'printString': 1, 'printInt': 1,
+        'println': 0, 'backSpace': 0}.items()},
+    'Screen': {name: ('function', n) for name, n in {
+        'init': 0, 'clearScreen': 0, 'setColor': 1, 'drawPixel': 2, 'drawLine': 4,
+        'drawRectangle': 4, 'drawCircle': 3}.items()},
+    'Keyboard': {name: ('function', n) for name, n in {
+        'init': 0, 'keyPressed': 0, 'readChar': 0, 'readLine': 1, 'readInt': 1}.items()},
+    'Memory': {name: ('function', n) for name, n in {
+        'init': 0, 'peek': 1, 'poke': 2, 'alloc': 1, 'deAlloc': 1}.items()},
+    'Sys': {name: ('function', n) for name, n in {
+        'init': 0, 'halt': 0, 'error': 1, 'wait': 1}.items()},
+}
+
+# --project 做 dead subroutine elimination 時的進入點
+ENTRY_POINTS = ('Main.main', 'Sys.init')
+
+# 編譯快取：編譯器輸出有變動時要改版本號，讓舊的快取全部失效
+COMPILER_VERSION = '11.4'
+CACHE_FILE_NAME = '.jackcache.json'
+
 # Kind 到 Segment 的映射
 KIND_TO_SEGMENT = {
     'STATIC': 'static',
@@ -42,40 +99,73 @@ KIND_TO_SEGMENT = {
 
 class JackTokenizer:
     def __init__(self, input_file):
+        self.input_file = input_file
         with open(input_file, 'r', encoding='utf-8') as f:
             content = f.read()
-        self.tokens = self._tokenize(content)
+        self.tokens, self.positions = self._tokenize(content)
+        # 每個 token 的類型在分詞時就決定好，相同字串只判斷一次
+        kinds = {}
+        self.token_types = []
+        for token in self.tokens:
+            kind = kinds.get(token)
+            if kind is None:
+                kind = kinds[token] = self._classify(token)
+            self.token_types.append(kind)
         self.current_token_idx = 0
         self.current_token = ""
         self.token_type = ""
 
     def _tokenize(self, content):
-        content = re.sub(r'/\*.*?\*/', ' ', content, flags=re.S)
-        content = re.sub(r'//.*', ' ', content)
+        # 註解換成等長的空白 (保留換行)，token 的行號、欄號才會正確
+        blank = lambda m: re.sub(r'[^\n]', ' ', m.group())
+        content = re.sub(r'/\*.*?\*/', blank, content, flags=re.S)
+        content = re.sub(r'//.*', blank, content)
         regex = r'([a-zA-Z_]\w*)|(\d+)|("[^"\n]*")|([{}()\[\].,;+\-*/&|<>=~])'
-        matches = re.findall(regex, content)
         tokens = []
-        for match in matches:
-            for group in match:
-                if group: tokens.append(group)
-        return tokens
+        positions = [] # 每個 token 的 (行, 欄)，錯誤訊息用
+        line, line_start, last = 1, 0, 0
+        for m in re.finditer(regex, content):
+            start = m.start()
+            newlines = content.count('\n', last, start)
+            if newlines:
+                line += newlines
+                line_start = content.rfind('\n', last, start) + 1
+            last = start
+            tokens.append(sys.intern(m.group(m.lastindex))) # intern: 查表時可直接比對位址
+            positions.append((line, start - line_start + 1))
+        return tokens, positions
 
     def has_more_tokens(self):
         return self.current_token_idx < len(self.tokens)
 
     def advance(self):
-        if self.has_more_tokens():
-            self.current_token = self.tokens[self.current_token_idx]
-            self.current_token_idx += 1
-            self._set_token_type()
-
-    def _set_token_type(self):
-        token = self.current_token
-        if token in KEYWORDS: self.token_type = 'KEYWORD'
-        elif token in SYMBOLS: self.token_type = 'SYMBOL'
-        elif token.isdigit(): self.token_type = 'INT_CONST'
-        elif token.startswith('"'): self.token_type = 'STRING_CONST'
-        else: self.token_type = 'IDENTIFIER'
+        idx = self.current_token_idx
+        if idx < len(self.tokens):
+            self.current_token = self.tokens[idx]
+            self.token_type = self.token_types[idx]
+            self.current_token_idx = idx + 1
+        else:
+            # 檔尾：current_token 變成空字串，任何比對都不會成立
+            self.current_token = ""
+            self.token_type = ""
+
+    def position(self):
+        """目前 token 的 (行, 欄)；到檔尾時回傳最後一個 token 的位置"""
+        if not self.positions:
+            return (1, 1)
+        return self.positions[max(self.current_token_idx - 1, 0)]
+
+    def at_class_end(self):
+        """目前 token 是否為檔案最後的 '}' (class 結尾)"""
+        return self.current_token == '}' and not self.has_more_tokens()
+
+    @staticmethod
+    def _classify(token):
+        if token in KEYWORDS: return 'KEYWORD'
+        elif token in SYMBOLS: return 'SYMBOL'
+        elif token.isdigit(): return 'INT_CONST'
+        elif token.startswith('"'): return 'STRING_CONST'
+        else: return 'IDENTIFIER'
 
     def string_val(self): return self.current_token[1:-1]
     def peek(self):
@@ -131,51 +221,170 @@ class SymbolTable:
 # 4. VMWriter (VM 輸出器 - Ch11 新增)
 # ==========================================
 
+# push / pop 指令字串的快取：(指令, segment, index) -> "push constant 0"
+# 同樣的指令 (push constant 0、pop temp 0、字元碼 ...) 只格式化一次
+_SEGMENT_COMMANDS = {}
+
 class VMWriter:
+    """
+    緩衝式 VM 輸出器：指令先累積在 buffer (list) 中，
+    每個 subroutine 結束時 (下一個 write_function 或 close) 才一次寫入檔案。
+    """
     def __init__(self, output_file):
-        self.outfile = open(output_file, 'w', encoding='utf-8')
+        # output_file 可以是檔案路徑，或已經開好的文字串流 (例如 --project 用的 io.StringIO)
+        self.owns_file = isinstance(output_file, str)
+        self.outfile = open(output_file, 'w', encoding='utf-8') if self.owns_file else output_file
+        self.buffer = []
+
+    def flush(self):
+        if self.buffer:
+            self.outfile.write('\n'.join(self.buffer) + '\n')
+            self.buffer.clear()
 
     def close(self):
-        self.outfile.close()
+        self.flush()
+        if self.owns_file:
+            self.outfile.close()
+
+    def _segment_command(self, command, segment, index):
+        key = (command, segment, index)
+        line = _SEGMENT_COMMANDS.get(key)
+        if line is None:
+            line = _SEGMENT_COMMANDS[key] = f"{command} {segment} {index}"
+        return line
 
     def write_push(self, segment, index):
-        self.outfile.write(f"push {segment} {index}\n")
+        self.buffer.append(self._segment_command('push', segment, index))
 
     def write_pop(self, segment, index):
-        self.outfile.write(f"pop {segment} {index}\n")
+        self.buffer.append(self._segment_command('pop', segment, index))
 
     def write_arithmetic(self, command):
-        self.outfile.write(f"{command}\n")
+        self.buffer.append(command)
 
     def write_label(self, label):
-        self.outfile.write(f"label {label}\n")
+        self.buffer.append(f"label {label}")
 
     def write_goto(self, label):
-        self.outfile.write(f"goto {label}\n")
+        self.buffer.append(f"goto {label}")
 
     def write_if(self, label):
-        self.outfile.write(f"if-goto {label}\n")
+        self.buffer.append(f"if-goto {label}")
 
     def write_call(self, name, n_args):
-        self.outfile.write(f"call {name} {n_args}\n")
+        self.buffer.append(f"call {name} {n_args}")
 
     def write_function(self, name, n_locals):
-        self.outfile.write(f"function {name} {n_locals}\n")
+        # 新的 subroutine 開始：把上一個 subroutine 的指令一次寫出
+        self.flush()
+        self.buffer.append(f"function {name} {n_locals}")
 
     def write_return(self):
-        self.outfile.write("return\n")
+        self.buffer.append("return")
+
+    def write_string(self, s):
+        # 字串常數: String.new(len) 之後逐字元 appendChar，整段一次加入 buffer
+        push = self._segment_command
+        lines = [push('push', 'constant', len(s)), "call String.new 1"]
+        for char in s:
+            lines.append(push('push', 'constant', ord(char)))
+            lines.append("call String.appendChar 2")
+        self.buffer.extend(lines)
+
+# --- 常數折疊 / 代數化簡 (--optimize) ---
+
+# x op c 時 c 為單位元素 (結果就是 x)；左邊版本只列可交換的運算子
+RIGHT_IDENTITY = {'+': 0, '-': 0, '*': 1, '/': 1, '|': 0, '&': -1}
+LEFT_IDENTITY = {'+': 0, '*': 1, '|': 0, '&': -1}
+
+# 把堆疊頂端的值乘 2 (VM 沒有 dup，借用 temp 1；pop/push 相鄰，不會被其他呼叫蓋掉)
+DOUBLE_TOP = ['pop temp 1', 'push temp 1', 'push temp 1', 'add']
+
+def to_int16(value):
+    value &= 0xFFFF
+    return value - 0x10000 if value & 0x8000 else value
+
+def constant_value(lines, start, end=None):
+    """lines[start:end] 若只是推入一個常數 (push constant c [neg|not])，回傳它的 16-bit 值，否則回傳 None"""
+    end = len(lines) if end is None else end
+    if not 0 < end - start <= 2 or not lines[start].startswith('push constant '):
+        return None
+    value = int(lines[start][14:])
+    if end - start == 1:
+        return value
+    if lines[start + 1] == 'neg':
+        return to_int16(-value)
+    if lines[start + 1] == 'not':
+        return to_int16(~value)
+    return None
+
+def constant_lines(value):
+    # push constant 只接受 0..32767，負數用 neg / not 組出來
+    if value >= 0:
+        return [f"push constant {value}"]
+    if value == -32768:
+        return ["push constant 32767", "not"]
+    return [f"push constant {-value}", "neg"]
+
+def fold_binary(op, a, b):
+    """編譯期計算 a op b；結果可能和執行期不同時 (除以 0、減法溢位的比較) 回傳 None"""
+    if op == '+': return to_int16(a + b)
+    if op == '-': return to_int16(a - b)
+    if op == '*': return to_int16(a * b)
+    if op == '&': return a & b
+    if op == '|': return a | b
+    if op == '=': return -1 if a == b else 0
+    if op == '/':
+        if b == 0 or a == -32768 or b == -32768:
+            return None
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+    # lt / gt 在 VM 翻譯器中是用 x - y 的正負判斷，溢位時結果和數學上的比較不同
+    if not -32768 <= a - b <= 32767:
+        return None
+    return (-1 if a < b else 0) if op == '<' else (-1 if a > b else 0)
 
 # ==========================================
 # 5. CompilationEngine (核心邏輯 - Ch11 修改)
 # ==========================================
 
+class JackSyntaxError(Exception):
+    """語法錯誤 (含行號、欄號)；由 CompilationEngine 接住後做 panic-mode 復原"""
+    def __init__(self, message, line, col):
+        super().__init__(message)
+        self.message = message
+        self.line = line
+        self.col = col
+
 class CompilationEngine:
-    def __init__(self, tokenizer, output_path):
+    def __init__(self, tokenizer, output_path, string_pool=False, optimize=False, project=None):
         self.tokenizer = tokenizer
         self.vm_writer = VMWriter(output_path)
         self.symbol_table = SymbolTable()
         self.class_name = ""
         self.label_counter = 0
+        self.source_name = os.path.basename(tokenizer.input_file)
+        self.errors = [] # 所有診斷訊息，格式: 檔名:行:欄: error: 訊息
+        # --string-pool: 字串常數 -> 存放它的 static index (None 表示不啟用)
+        self.string_pool = {} if string_pool else None
+        self.optimize = optimize # --optimize: 常數折疊與代數化簡
+        self.project = project   # --project: 全域的 ProjectIndex (None 表示逐檔編譯)
+        self.subroutine_kind = ""
+        # statement 關鍵字 -> 對應的編譯方法 (取代 if/elif 比較鏈)
+        self._statement_table = {
+            'let': self.compile_let,
+            'if': self.compile_if,
+            'while': self.compile_while,
+            'do': self.compile_do,
+            'return': self.compile_return,
+        }
+        # token 類型 -> compile_term 的處理方法；符號 '(' 與 unary op 另外處理
+        self._term_table = {
+            'INT_CONST': self._compile_int_const,
+            'STRING_CONST': self._compile_string_const,
+            'KEYWORD': self._compile_keyword_const,
+            'IDENTIFIER': self._compile_identifier_term,
+        }
         
         if self.tokenizer.has_more_tokens():
             self.tokenizer.advance()
@@ -184,11 +393,129 @@ class CompilationEngine:
         self.vm_writer.close()
 
     def _eat(self, token=None):
-        # 簡單的推進，如果有傳入 token 可以做檢查 (此處省略嚴格檢查)
+        # 推進一個 token；有傳入 token 時檢查是否相符，不符就丟出 JackSyntaxError
         val = self.tokenizer.current_token
+        if token is not None and val != token:
+            self._fail(f"'{token}'")
         self.tokenizer.advance()
         return val
 
+    def _eat_identifier(self, what='identifier'):
+        if self.tokenizer.token_type != 'IDENTIFIER':
+            self._fail(what)
+        return self._eat()
+
+    def _eat_type(self, allow_void=False):
+        token = self.tokenizer.current_token
+        if (self.tokenizer.token_type == 'IDENTIFIER' or token in TYPE_KEYWORDS
+                or (allow_void and token == 'void')):
+            return self._eat()
+        self._fail('type')
+
+    # --- Diagnostics / 錯誤復原 ---
+
+    def _fail(self, expected):
+        token = self.tokenizer.current_token
+        found = f"'{token}'" if token else "end of file"
+        raise JackSyntaxError(f"Expected {expected}, found {found}", *self.tokenizer.position())
+
+    def _error(self, message, position=None):
+        # 記錄一筆診斷訊息但不中斷分析 (例如未宣告的變數)
+        line, col = position or self.tokenizer.position()
+        self.errors.append(f"{self.source_name}:{line}:{col}: error: {message}")
+
+    def _report(self, error):
+        self._error(error.message, (error.line, error.col))
+
+    def _synchronize(self, stop_tokens, start_idx, after_semicolon=True):
+        """
+        panic mode：跳過 token 直到同步點。
+        - 跳過的 { ... } 區塊整個略過；跳完一個區塊且 after_semicolon 時視為 statement 結束
+        - after_semicolon 時遇到 ';' 會吃掉並停下 (下一個 statement 從它後面開始)
+        - 遇到 stop_tokens、多出來的 '}'、class 結尾或檔尾則停下不吃
+          (subroutine 關鍵字不會出現在區塊內，不論深度都停)
+        若錯誤發生後完全沒有前進，至少跳過一個 token，避免無窮迴圈。
+        """
+        tokenizer = self.tokenizer
+        depth = 0
+        while tokenizer.current_token and not tokenizer.at_class_end():
+            token = tokenizer.current_token
+            moved = tokenizer.current_token_idx != start_idx
+            if token in SUBROUTINE_KEYWORDS and token in stop_tokens and moved:
+                return
+            if token == '{':
+                depth += 1
+            elif token == '}':
+                if depth == 0 and moved:
+                    return
+                depth = max(depth - 1, 0)
+                if depth == 0 and after_semicolon:
+                    tokenizer.advance()
+                    return
+            elif depth == 0:
+                if after_semicolon and token == ';':
+                    tokenizer.advance()
+                    return
+                if token in stop_tokens and moved:
+                    return
+            tokenizer.advance()
+
+    def _compile_condition(self):
+        """
+        if / while 的 '(' expression ')'。條件裡的語法錯誤在這裡就地復原，後面的區塊照常分析；
+        交給 statement 層級復原的話會連區塊一起跳過，多報錯誤又漏掉區塊裡的錯誤
+        """
+        tokenizer = self.tokenizer
+        open_idx = tokenizer.current_token_idx - 1
+        self._eat('(')
+        buffer = self.vm_writer.buffer
+        start = len(buffer)
+        try:
+            self.compile_expression()
+            self._eat(')')
+        except JackSyntaxError as error:
+            if not self._skip_condition(open_idx):
+                raise
+            self._report(error)
+            # 有錯誤時不會寫出 .vm，條件換成常數只是讓後面照常編譯
+            del buffer[start:]
+            self.vm_writer.write_push('constant', 0)
+
+    def _skip_condition(self, open_idx):
+        """
+        跳到和 tokens[open_idx] 的 '(' 對應的 ')' 之後 (已經讀過的括號也要算)。
+        遇到 '{' 視為少了 ')'，停在 '{'；先遇到 '}'、';' 或檔尾則回傳 False
+        """
+        tokenizer = self.tokenizer
+        tokens, types = tokenizer.tokens, tokenizer.token_types
+        depth = 0
+        for i in range(open_idx, tokenizer.current_token_idx - 1):
+            if types[i] == 'SYMBOL' and tokens[i] in ('(', ')'):
+                depth += 1 if tokens[i] == '(' else -1
+        while tokenizer.current_token and not tokenizer.at_class_end():
+            token = tokenizer.current_token if tokenizer.token_type == 'SYMBOL' else None
+            if token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+                if depth <= 0:
+                    tokenizer.advance()
+                    return True
+            elif token == '{':
+                return True
+            elif token in ('}', ';'):
+                return False
+            tokenizer.advance()
+        return False
+
+    def _variable(self, name, position):
+        # 回傳 (segment, index)；未宣告的變數記錄錯誤並回傳 None
+        kind = self.symbol_table.kind_of(name)
+        if kind is None:
+            self._error(f"Undefined variable '{name}'", position)
+            return None
+        return KIND_TO_SEGMENT[kind], self.symbol_table.index_of(name)
+
     def _new_label(self):
         self.label_counter += 1
         return f"L{self.label_counter}"
@@ -196,28 +523,62 @@ class CompilationEngine:
     # --- Structure ---
 
     def compile_class(self):
-        self._eat('class')
-        self.class_name = self._eat() # ClassName
-        self._eat('{')
-        
-        while self.tokenizer.current_token in ['static', 'field']:
-            self.compile_class_var_dec()
-            
-        while self.tokenizer.current_token in ['constructor', 'function', 'method']:
-            self.compile_subroutine()
-            
-        self._eat('}')
+        tokenizer = self.tokenizer
+        try:
+            self._eat('class')
+            self.class_name = self._eat_identifier('class name') # ClassName
+            self._eat('{')
+        except JackSyntaxError as error:
+            self._report(error)
+            self._synchronize(MEMBER_SYNC, 0, after_semicolon=False)
+
+        # classVarDec* subroutineDec*：每個成員各自復原，一個錯誤不會中斷整個 class
+        while tokenizer.current_token and not tokenizer.at_class_end():
+            start_idx = tokenizer.current_token_idx
+            is_subroutine = tokenizer.current_token in SUBROUTINE_KEYWORDS
+            try:
+                if is_subroutine:
+                    self.compile_subroutine()
+                elif tokenizer.current_token in CLASS_VAR_KEYWORDS:
+                    self.compile_class_var_dec()
+                else:
+                    self._fail('class member declaration')
+            except JackSyntaxError as error:
+                # subroutine 出錯就直接跳到下一個 subroutine，不停在本體裡的 ';'
+                self._report(error)
+                self._synchronize(MEMBER_SYNC, start_idx, after_semicolon=not is_subroutine)
+
+        if self.string_pool:
+            self._write_string_pool()
+
+        try:
+            self._eat('}')
+        except JackSyntaxError as error:
+            self._report(error)
+
+    def _write_string_pool(self):
+        # Class._initStrings: 一次建好這個 class 用到的所有字串常數，存進各自的 static
+        self.vm_writer.write_function(f"{self.class_name}.{STRING_POOL_INIT}", 0)
+        for s, index in self.string_pool.items():
+            self.vm_writer.write_string(s)
+            self.vm_writer.write_pop('static', index)
+        self.vm_writer.write_push('constant', 0)
+        self.vm_writer.write_return()
 
     def compile_class_var_dec(self):
+        position = self.tokenizer.position()
         kind_str = self._eat() # static / field
         kind = kind_str.upper()
-        type = self._eat()     # int / char / ...
-        name = self._eat()     # varName
+        if kind == 'STATIC' and self.string_pool:
+            # 字串常數已經佔用了接在 static 變數後面的 index
+            self._error("Static variable declared after a string constant (--string-pool)", position)
+        type = self._eat_type()                        # int / char / ...
+        name = self._eat_identifier('variable name')   # varName
         self.symbol_table.define(name, type, kind)
         
         while self.tokenizer.current_token == ',':
             self._eat(',')
-            name = self._eat()
+            name = self._eat_identifier('variable name')
             self.symbol_table.define(name, type, kind)
         self._eat(';')
 
@@ -225,8 +586,9 @@ class CompilationEngine:
         self.symbol_table.start_subroutine()
         
         sub_type = self._eat() # constructor / function / method
-        return_type = self._eat()
-        sub_name = self._eat()
+        self.subroutine_kind = sub_type
+        return_type = self._eat_type(allow_void=True)
+        sub_name = self._eat_identifier('subroutine name')
         
         # Method 的第一個隱藏參數是 this
         if sub_type == 'method':
@@ -261,48 +623,63 @@ class CompilationEngine:
 
     def compile_parameter_list(self):
         if self.tokenizer.current_token != ')':
-            type = self._eat()
-            name = self._eat()
+            type = self._eat_type()
+            name = self._eat_identifier('parameter name')
             self.symbol_table.define(name, type, 'ARG')
             while self.tokenizer.current_token == ',':
                 self._eat(',')
-                type = self._eat()
-                name = self._eat()
+                type = self._eat_type()
+                name = self._eat_identifier('parameter name')
                 self.symbol_table.define(name, type, 'ARG')
 
     def compile_var_dec(self):
         self._eat('var')
-        type = self._eat()
-        name = self._eat()
+        type = self._eat_type()
+        name = self._eat_identifier('variable name')
         self.symbol_table.define(name, type, 'VAR')
         while self.tokenizer.current_token == ',':
             self._eat(',')
-            name = self._eat()
+            name = self._eat_identifier('variable name')
             self.symbol_table.define(name, type, 'VAR')
         self._eat(';')
 
     # --- Statements ---
 
     def compile_statements(self):
-        while self.tokenizer.current_token in ['let', 'if', 'while', 'do', 'return']:
-            if self.tokenizer.current_token == 'let': self.compile_let()
-            elif self.tokenizer.current_token == 'if': self.compile_if()
-            elif self.tokenizer.current_token == 'while': self.compile_while()
-            elif self.tokenizer.current_token == 'do': self.compile_do()
-            elif self.tokenizer.current_token == 'return': self.compile_return()
+        tokenizer = self.tokenizer
+        dispatch = self._statement_table.get
+        # statements 一定包在 { } 裡，遇到 '}' (或下一個 subroutine / 檔尾) 就結束
+        while tokenizer.current_token and tokenizer.current_token != '}':
+            compile_statement = dispatch(tokenizer.current_token)
+            if compile_statement is None and tokenizer.current_token in SUBROUTINE_KEYWORDS:
+                return
+            start_idx = tokenizer.current_token_idx
+            keyword = tokenizer.current_token
+            try:
+                if compile_statement is None:
+                    self._fail('statement')
+                compile_statement()
+            except JackSyntaxError as error:
+                # panic mode：記錄錯誤，跳到下一個 statement 繼續分析
+                self._report(error)
+                self._synchronize(STATEMENT_SYNC, start_idx)
+                if keyword == 'if' and tokenizer.current_token == 'else':
+                    # 上面只跳過了 then 區塊：else { ... } 也屬於同一個 if，一起跳過
+                    self._synchronize(STATEMENT_SYNC, tokenizer.current_token_idx)
 
     def compile_let(self):
         self._eat('let')
-        var_name = self._eat()
+        position = self.tokenizer.position()
+        var_name = self._eat_identifier('variable name')
+        variable = self._variable(var_name, position)
         is_array = False
         
         # 處理陣列賦值: let a[i] = x
         if self.tokenizer.current_token == '[':
             is_array = True
             # Push array base address
-            kind = self.symbol_table.kind_of(var_name)
-            index = self.symbol_table.index_of(var_name)
-            self.vm_writer.write_push(KIND_TO_SEGMENT[kind], index)
+            if variable:
+                self.vm_writer.write_push(*variable)
             
             self._eat('[')
             self.compile_expression() # 計算 index
@@ -321,19 +698,17 @@ class CompilationEngine:
             self.vm_writer.write_pop('that', 0)    # 寫入
         else:
             # 一般變數賦值
-            kind = self.symbol_table.kind_of(var_name)
-            index = self.symbol_table.index_of(var_name)
-            if kind:
-                self.vm_writer.write_pop(KIND_TO_SEGMENT[kind], index)
+            if variable:
+                self.vm_writer.write_pop(*variable)
 
     def compile_if(self):
+        if self.optimize:
+            return self._compile_if_optimized()
         l1 = self._new_label()
         l2 = self._new_label()
         
         self._eat('if')
-        self._eat('(')
-        self.compile_expression()
-        self._eat(')')
+        self._compile_condition()
         
         self.vm_writer.write_arithmetic('not')
         self.vm_writer.write_if(l1) # 如果條件不成立，跳到 L1 (else/end)
@@ -354,15 +729,15 @@ class CompilationEngine:
         self.vm_writer.write_label(l2)
 
     def compile_while(self):
+        if self.optimize:
+            return self._compile_while_optimized()
         l1 = self._new_label()
         l2 = self._new_label()
         
         self.vm_writer.write_label(l1)
         
         self._eat('while')
-        self._eat('(')
-        self.compile_expression()
-        self._eat(')')
+        self._compile_condition()
         
         self.vm_writer.write_arithmetic('not')
         self.vm_writer.write_if(l2) # 條件假，跳出迴圈
@@ -377,13 +752,16 @@ class CompilationEngine:
     def compile_do(self):
         self._eat('do')
         # Do 語句其實就是一個表達式呼叫，但我們會丟棄回傳值
+        if self.tokenizer.token_type != 'IDENTIFIER' or self.tokenizer.peek() not in ('(', '.'):
+            self._fail('subroutine call')
         self.compile_term() # 這會處理函數呼叫邏輯
         self._eat(';')
         self.vm_writer.write_pop('temp', 0) # 丟棄 void 函數預設回傳的 0
 
     def compile_return(self):
         self._eat('return')
-        if self.tokenizer.current_token != ';':
+        # 少了 ';' 直接遇到 '}' 時回報 Expected ';'，不是 Expected expression
+        if self.tokenizer.current_token not in (';', '}'):
             self.compile_expression()
         else:
             self.vm_writer.write_push('constant', 0) # void return 0
@@ -393,94 +771,278 @@ class CompilationEngine:
     # --- Expressions ---
 
     def compile_expression(self):
+        # 記下左右運算元在 buffer 中的起點，--optimize 時用來折疊
+        buffer = self.vm_writer.buffer
+        lhs_start = len(buffer)
         self.compile_term()
-        while self.tokenizer.current_token in OP_MAP:
+        while self.tokenizer.current_token in OP_TABLE:
             op = self._eat()
+            rhs_start = len(buffer)
             self.compile_term()
+            if self.optimize and self._fold_binary_op(op, lhs_start, rhs_start):
+                continue
+            command, n_args = OP_TABLE[op]
             # 輸出運算指令 (Postfix)
-            if op in OP_MAP:
-                cmd = OP_MAP[op]
-                if cmd.startswith('call'):
-                    # 處理 Math.multiply / Math.divide
-                    parts = cmd.split()
-                    self.vm_writer.write_call(parts[1], int(parts[2]))
-                else:
-                    self.vm_writer.write_arithmetic(cmd)
+            if n_args is None:
+                self.vm_writer.write_arithmetic(command)
+            else:
+                # 處理 Math.multiply / Math.divide
+                self.vm_writer.write_call(command, n_args)
 
     def compile_term(self):
+        compile_typed_term = self._term_table.get(self.tokenizer.token_type)
+        if compile_typed_term:
+            compile_typed_term()
+            return
+
         token = self.tokenizer.current_token
-        type = self.tokenizer.token_type
-        
-        if type == 'INT_CONST':
-            val = self._eat()
-            self.vm_writer.write_push('constant', val)
-            
-        elif type == 'STRING_CONST':
-            s = self.tokenizer.string_val()
-            self._eat()
-            self.vm_writer.write_push('constant', len(s))
-            self.vm_writer.write_call('String.new', 1)
-            for char in s:
-                self.vm_writer.write_push('constant', ord(char))
-                self.vm_writer.write_call('String.appendChar', 2)
-                
-        elif type == 'KEYWORD':
-            val = self._eat()
-            if val == 'true':
-                self.vm_writer.write_push('constant', 1) # 1
-                self.vm_writer.write_arithmetic('neg')   # -1
-            elif val in ['false', 'null']:
-                self.vm_writer.write_push('constant', 0)
-            elif val == 'this':
-                self.vm_writer.write_push('pointer', 0)
-                
-        elif type == 'IDENTIFIER':
-            # 需要 Lookahead 來判斷是 變數 / 陣列 / 函數呼叫
-            name = self._eat()
-            next_token = self.tokenizer.current_token
-            
-            if next_token == '[': # Array: a[i]
-                self._eat('[')
-                
-                # Push array base
-                kind = self.symbol_table.kind_of(name)
-                idx = self.symbol_table.index_of(name)
-                self.vm_writer.write_push(KIND_TO_SEGMENT[kind], idx)
-                
-                self.compile_expression() # index
-                self._eat(']')
-                
-                self.vm_writer.write_arithmetic('add')
-                self.vm_writer.write_pop('pointer', 1) # that = arr + i
-                self.vm_writer.write_push('that', 0)
-                
-            elif next_token == '(' or next_token == '.': # Function Call
-                self._compile_subroutine_call(name)
-                
-            else: # Simple Variable
-                kind = self.symbol_table.kind_of(name)
-                idx = self.symbol_table.index_of(name)
-                if kind:
-                    self.vm_writer.write_push(KIND_TO_SEGMENT[kind], idx)
-                    
-        elif token == '(':
+        if token == '(':
             self._eat('(')
             self.compile_expression()
             self._eat(')')
             
         elif token in UNARY_OP_MAP:
             op = self._eat()
+            start = len(self.vm_writer.buffer)
             self.compile_term()
-            self.vm_writer.write_arithmetic(UNARY_OP_MAP[op])
+            if not (self.optimize and self._fold_unary_op(UNARY_OP_MAP[op], start)):
+                self.vm_writer.write_arithmetic(UNARY_OP_MAP[op])
+
+        else:
+            self._fail('expression')
+
+    # --- Optimizer (--optimize) ---
+
+    def _fold_binary_op(self, op, lhs_start, rhs_start):
+        """
+        buffer[lhs_start:rhs_start] 是左運算元、buffer[rhs_start:] 是右運算元。
+        能化簡時直接改寫 buffer 並回傳 True，否則回傳 False 由呼叫端照常輸出運算指令。
+        """
+        buffer = self.vm_writer.buffer
+        a = constant_value(buffer, lhs_start, rhs_start)
+        b = constant_value(buffer, rhs_start)
+        if a is not None and b is not None:
+            value = fold_binary(op, a, b)
+            if value is None:
+                return False
+            buffer[lhs_start:] = constant_lines(value)
+            return True
+
+        # x + 0, x * 1, ... -> x；0 + x, 1 * x, ... -> x
+        if b is not None and RIGHT_IDENTITY.get(op) == b:
+            del buffer[rhs_start:]
+            return True
+        if a is not None and LEFT_IDENTITY.get(op) == a:
+            del buffer[lhs_start:rhs_start]
+            return True
+
+        # x * 2^k -> 重複 k 次 x + x，不呼叫 Math.multiply
+        if op == '*':
+            if b is not None and b > 1 and b & (b - 1) == 0:
+                del buffer[rhs_start:]
+                self._write_doubling(lhs_start, b.bit_length() - 1)
+                return True
+            if a is not None and a > 1 and a & (a - 1) == 0:
+                del buffer[lhs_start:rhs_start]
+                self._write_doubling(lhs_start, a.bit_length() - 1)
+                return True
+        return False
+
+    def _write_doubling(self, start, times):
+        buffer = self.vm_writer.buffer
+        if len(buffer) - start == 1 and buffer[start].startswith('push '):
+            # 運算元只是一個 push (沒有副作用)：第一次直接再 push 一次
+            buffer.extend((buffer[start], 'add'))
+            times -= 1
+        for _ in range(times):
+            buffer.extend(DOUBLE_TOP)
+
+    def _compile_if_optimized(self):
+        """
+        if (cond) {A} else {B}  ->  cond; [not]; if-goto ELSE; A; goto END; label ELSE; B; label END
+        沒有 else 時不輸出 goto END；A 以 return 結尾時也不需要 goto END。
+        條件是常數 true / false 時不輸出判斷，只保留會執行到的那個分支。
+        (和 Jack 規格一樣假設條件是 boolean：true = -1、false = 0)
+        """
+        buffer = self.vm_writer.buffer
+        self._eat('if')
+        cond_start = len(buffer)
+        self._compile_condition()
+
+        condition = self._constant_condition(cond_start)
+        else_label = self._new_label()
+        if condition is None:
+            self._write_jump_if_false(else_label)
+        else:
+            del buffer[cond_start:]
+
+        then_start = len(buffer)
+        self._eat('{')
+        self.compile_statements()
+        self._eat('}')
+        if condition == 0:
+            del buffer[then_start:]
+
+        if self.tokenizer.current_token != 'else':
+            if condition is None:
+                self.vm_writer.write_label(else_label)
+            return
+
+        self._eat('else')
+        end_label = self._new_label()
+        if condition is None:
+            if len(buffer) == then_start or buffer[-1] != 'return':
+                self.vm_writer.write_goto(end_label)
+            self.vm_writer.write_label(else_label)
+        else_start = len(buffer)
+        self._eat('{')
+        self.compile_statements()
+        self._eat('}')
+        if condition is None:
+            self.vm_writer.write_label(end_label)
+        elif condition != 0:
+            del buffer[else_start:]
+
+    def _compile_while_optimized(self):
+        """
+        條件放到迴圈底部，每一圈少執行 not 與 goto:
+            goto COND; label BODY; body; label COND; cond; if-goto BODY
+        條件先編譯再從 buffer 搬到 body 後面。while (true) 只剩 goto BODY；while (false) 整個省略。
+        """
+        buffer = self.vm_writer.buffer
+        self._eat('while')
+        cond_start = len(buffer)
+        self._compile_condition()
+
+        condition = self._constant_condition(cond_start)
+        condition_lines = buffer[cond_start:]
+        del buffer[cond_start:]
+        body_label = self._new_label()
+        cond_label = self._new_label()
+        if condition is None:
+            self.vm_writer.write_goto(cond_label)
+        self.vm_writer.write_label(body_label)
+
+        self._eat('{')
+        self.compile_statements()
+        self._eat('}')
+
+        if condition is None:
+            self.vm_writer.write_label(cond_label)
+            buffer.extend(condition_lines)
+            self._write_jump_if_true(body_label)
+        elif condition != 0:
+            self.vm_writer.write_goto(body_label)
+        else:
+            del buffer[cond_start:]
 
-    def _compile_subroutine_call(self, first_name):
+    def _constant_condition(self, start):
+        # 只折疊 true (-1) / false (0)；其他常數照常輸出判斷
+        value = constant_value(self.vm_writer.buffer, start)
+        return value if value in (0, -1) else None
+
+    def _write_jump_if_false(self, label):
+        # 條件在 buffer 尾端：~x 為假 <=> x 為真；x = 0 為假 <=> x 不為 0，都不需要 not
+        buffer = self.vm_writer.buffer
+        if buffer[-1] == 'not':
+            buffer.pop()
+        elif buffer[-2:] == ['push constant 0', 'eq']:
+            del buffer[-2:]
+        else:
+            buffer.append('not')
+        self.vm_writer.write_if(label)
+
+    def _write_jump_if_true(self, label):
+        # ~(x = 0) 為真 <=> x 不為 0
+        buffer = self.vm_writer.buffer
+        if buffer[-3:] == ['push constant 0', 'eq', 'not']:
+            del buffer[-3:]
+        self.vm_writer.write_if(label)
+
+    def _fold_unary_op(self, command, start):
+        buffer = self.vm_writer.buffer
+        value = constant_value(buffer, start)
+        if value is not None:
+            buffer[start:] = constant_lines(to_int16(-value if command == 'neg' else ~value))
+            return True
+        # ~~x、--x 互相抵銷
+        if buffer[-1] == command and len(buffer) > start:
+            buffer.pop()
+            return True
+        return False
+
+    def _compile_int_const(self):
+        val = self._eat()
+        self.vm_writer.write_push('constant', val)
+
+    def _compile_string_const(self):
+        s = self.tokenizer.string_val()
+        self._eat()
+        if self.string_pool is None:
+            self.vm_writer.write_string(s)
+            return
+
+        # String pool: 同一個字串常數只在 Class._initStrings 建構一次，之後直接 push static。
+        # static 初值為 0，第一次用到時才呼叫初始化函數 (此時 OS 已經初始化完成)
+        index = self.string_pool.get(s)
+        if index is None:
+            index = self.symbol_table.var_count('STATIC') + len(self.string_pool)
+            self.string_pool[s] = index
+        ready = self._new_label()
+        self.vm_writer.write_push('static', index)
+        self.vm_writer.write_if(ready)
+        self.vm_writer.write_call(f"{self.class_name}.{STRING_POOL_INIT}", 0)
+        self.vm_writer.write_pop('temp', 0)
+        self.vm_writer.write_label(ready)
+        self.vm_writer.write_push('static', index)
+
+    def _compile_keyword_const(self):
+        val = self._eat()
+        if val == 'true':
+            self.vm_writer.write_push('constant', 1) # 1
+            self.vm_writer.write_arithmetic('neg')   # -1
+        elif val == 'false' or val == 'null':
+            self.vm_writer.write_push('constant', 0)
+        elif val == 'this':
+            self.vm_writer.write_push('pointer', 0)
+
+    def _compile_identifier_term(self):
+        # 需要 Lookahead 來判斷是 變數 / 陣列 / 函數呼叫
+        position = self.tokenizer.position()
+        name = self._eat()
+        next_token = self.tokenizer.current_token
+        
+        if next_token == '[': # Array: a[i]
+            self._eat('[')
+            
+            # Push array base
+            variable = self._variable(name, position)
+            if variable:
+                self.vm_writer.write_push(*variable)
+            
+            self.compile_expression() # index
+            self._eat(']')
+            
+            self.vm_writer.write_arithmetic('add')
+            self.vm_writer.write_pop('pointer', 1) # that = arr + i
+            self.vm_writer.write_push('that', 0)
+            
+        elif next_token == '(' or next_token == '.': # Function Call
+            self._compile_subroutine_call(name, position)
+            
+        else: # Simple Variable
+            variable = self._variable(name, position)
+            if variable:
+                self.vm_writer.write_push(*variable)
+
+    def _compile_subroutine_call(self, first_name, position=None):
         # 這裡處理 foo() 或 Class.foo() 或 var.method()
+        # call_kind: 'function' = Class.foo()、'method' = var.method()、'implicit' = this.foo()
         n_args = 0
-        full_func_name = ""
         
         if self.tokenizer.current_token == '.':
             self._eat('.')
-            sub_name = self._eat()
+            sub_name = self._eat_identifier('subroutine name')
             
             # 檢查 first_name 是 類別名 還是 變數名
             kind = self.symbol_table.kind_of(first_name)
@@ -492,22 +1054,52 @@ class CompilationEngine:
                 
                 # 取得變數的型別 (Class Name)
                 class_type = self.symbol_table.type_of(first_name)
-                full_func_name = f"{class_type}.{sub_name}"
                 n_args = 1 # 已經 push 了一個 this
+                call_kind = 'method'
             else:
                 # 是類別 (e.g., Math.abs()) -> Function Call
-                full_func_name = f"{first_name}.{sub_name}"
+                class_type = first_name
+                call_kind = 'function'
         else:
-            # 隱式 Method Call (e.g., draw()) -> this.draw()
-            self.vm_writer.write_push('pointer', 0) # push this
-            full_func_name = f"{self.class_name}.{first_name}"
-            n_args = 1
+            class_type, sub_name = self.class_name, first_name
+            callee = self.project.lookup(class_type, sub_name) if self.project else None
+            if callee and callee[0] != 'method':
+                # --project 已知是同 class 的 function / constructor：直接呼叫，不 push this
+                call_kind = 'function'
+            else:
+                # 隱式 Method Call (e.g., draw()) -> this.draw()
+                self.vm_writer.write_push('pointer', 0) # push this
+                n_args = 1
+                call_kind = 'implicit'
             
         self._eat('(')
         n_args += self.compile_expression_list()
         self._eat(')')
         
-        self.vm_writer.write_call(full_func_name, n_args)
+        if self.project:
+            n_params = n_args - 1 if call_kind != 'function' else n_args
+            self._check_call(class_type, sub_name, call_kind, n_params, position)
+        self.vm_writer.write_call(f"{class_type}.{sub_name}", n_args)
+
+    def _check_call(self, class_name, sub_name, call_kind, n_args, position):
+        # --project: 用全域索引檢查被呼叫的 subroutine 是否存在、種類與參數數量是否相符
+        full_name = f"{class_name}.{sub_name}"
+        if call_kind == 'function' and not self.project.has_class(class_name):
+            self._error(f"Unknown class or variable '{class_name}'", position)
+            return
+        callee = self.project.lookup(class_name, sub_name)
+        if callee is None:
+            self._error(f"Undefined subroutine '{full_name}'", position)
+            return
+        kind, n_params = callee
+        if call_kind == 'function' and kind == 'method':
+            self._error(f"Method '{full_name}' called without an object", position)
+        elif call_kind == 'method' and kind != 'method':
+            self._error(f"{kind.capitalize()} '{full_name}' called as a method", position)
+        elif call_kind == 'implicit' and self.subroutine_kind == 'function':
+            self._error(f"Method '{full_name}' called from a function", position)
+        if n_args != n_params:
+            self._error(f"'{full_name}' expects {n_params} argument(s), got {n_args}", position)
 
     def compile_expression_list(self):
         count = 0
@@ -521,30 +1113,320 @@ class CompilationEngine:
         return count
 
 # ==========================================
-# 6. 主程式
+# 6. 專案索引 (--project)
 # ==========================================
 
-def analyze_file(input_file, output_dir):
-    if not input_file.endswith('.jack'): return
-    
+class ProjectIndex:
+    """
+    整個目錄一起編譯時，先掃過所有 .jack 建立全域索引：
+    class -> {subroutine: (kind, 參數數量)}，並加入 OS 的 API。
+    掃描用的 tokenizer 會保留下來，正式編譯時直接沿用，不必再分詞一次。
+    """
+    def __init__(self, jack_files):
+        self.classes = {name: dict(subroutines) for name, subroutines in OS_API.items()}
+        self.tokenizers = {}
+        for jack_file in jack_files:
+            tokenizer = JackTokenizer(jack_file)
+            self.tokenizers[jack_file] = tokenizer
+            self._scan(tokenizer.tokens)
+
+    def _scan(self, tokens):
+        # 只看 class 名稱與 subroutine 宣告；語法錯誤留給正式編譯時回報
+        if len(tokens) < 2 or tokens[0] != 'class':
+            return
+        subroutines = self.classes[tokens[1]] = {} # 專案內的同名 class 取代 OS 的版本
+        depth = 0
+        for i, token in enumerate(tokens):
+            if token == '{':
+                depth += 1
+            elif token == '}':
+                depth -= 1
+            elif depth == 1 and token in SUBROUTINE_KEYWORDS and tokens[i + 3:i + 4] == ['(']:
+                params = tokens[i + 4:tokens.index(')', i + 4)] if ')' in tokens[i + 4:] else []
+                n_params = params.count(',') + 1 if params else 0
+                subroutines[tokens[i + 2]] = (token, n_params)
+
+    def has_class(self, class_name):
+        return class_name in self.classes
+
+    def lookup(self, class_name, sub_name):
+        """回傳 (kind, 參數數量)；找不到時回傳 None"""
+        return self.classes.get(class_name, {}).get(sub_name)
+
+def function_blocks(lines):
+    """把 VM 指令依 function 切開: [(function 名稱, [指令...])]"""
+    blocks = []
+    for line in lines:
+        if line.startswith('function '):
+            blocks.append((line.split()[1], []))
+        if blocks:
+            blocks[-1][1].append(line)
+    return blocks
+
+def reachable_functions(blocks, entry_points=ENTRY_POINTS):
+    """從進入點沿著 call 指令走訪 call graph，回傳走得到的 function 名稱"""
+    calls = {name: [line.split()[1] for line in body if line.startswith('call ')]
+             for name, body in blocks}
+    reachable = set()
+    pending = [name for name in entry_points if name in calls]
+    while pending:
+        name = pending.pop()
+        if name in reachable:
+            continue
+        reachable.add(name)
+        pending.extend(callee for callee in calls.get(name, ()) if callee not in reachable)
+    return reachable
+
+# ==========================================
+# 7. 編譯快取 (build cache)
+# ==========================================
+
+def source_digest(content, options):
+    """快取的 key：原始碼內容 + 編譯器版本 + 編譯選項"""
+    h = hashlib.sha1(f"{COMPILER_VERSION}|{options}|".encode('utf-8'))
+    h.update(content)
+    return h.hexdigest()
+
+class BuildCache:
+    """
+    存在 output/ 旁邊的 .jackcache.json，記錄每個 .jack 上次成功編譯時的
+    key 以及原始檔 / 輸出檔的 (mtime, size)。
+    - 原始檔的 mtime 和 size 都沒變、輸出檔也還在：只需要兩次 stat 就能跳過
+    - mtime 變了但內容一樣 (例如 touch、git checkout)：重新算 hash 後跳過
+    """
+    def __init__(self, source_dir, options):
+        self.path = os.path.join(source_dir, CACHE_FILE_NAME)
+        self.options = options
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == COMPILER_VERSION:
+                self.entries = data.get('entries', {})
+        except (OSError, ValueError):
+            pass  # 沒有快取或快取損壞：全部重新編譯
+
+    def is_fresh(self, name, source_paths, output_paths):
+        """
+        name 的輸出是否還是最新的。source_paths 的內容全部參與 key 的計算
+        (一般模式只有自己；--project 是整個目錄)。
+        """
+        entry = self.entries.get(name)
+        if entry is None or entry['options'] != self.options:
+            return False
+        try:
+            outputs = [file_stamp(path) for path in output_paths]
+            if outputs != entry['outputs']:
+                return False
+            sources = [file_stamp(path) for path in source_paths]
+        except OSError:
+            return False
+        if sources == entry['sources']:
+            return True
+        if self.key(source_paths) != entry['key']:
+            return False
+        entry['sources'] = sources
+        self.dirty = True
+        return True
+
+    def key(self, source_paths):
+        h = hashlib.sha1()
+        for path in source_paths:
+            with open(path, 'rb') as f:
+                h.update(source_digest(f.read(), self.options).encode('ascii'))
+        return h.hexdigest()
+
+    def snapshot(self, source_paths):
+        """編譯前先記下原始檔的狀態；編譯途中檔案被改過的話，下次會因為 mtime 不同而重新檢查"""
+        return [file_stamp(path) for path in source_paths], self.key(source_paths)
+
+    def update(self, name, snapshot, output_paths):
+        sources, key = snapshot
+        self.entries[name] = {
+            'options': self.options,
+            'key': key,
+            'sources': sources,
+            'outputs': [file_stamp(path) for path in output_paths],
+        }
+        self.dirty = True
+
+    def discard(self, name):
+        if self.entries.pop(name, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if self.dirty:
+            write_file_atomic(self.path, json.dumps(
+                {'version': COMPILER_VERSION, 'entries': self.entries}, indent=1, sort_keys=True))
+            self.dirty = False
+
+def file_stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+# ==========================================
+# 8. 主程式
+# ==========================================
+
+def analyze_file(input_file, output_dir, string_pool=False, optimize=False):
+    """
+    編譯單一檔案，回傳 (檔名, 花費秒數, 診斷訊息)，給 main 統計用。
+    .vm 先寫到暫存檔，成功才 os.replace 成正式檔名；有錯誤時不保留 .vm。
+    """
+    if not input_file.endswith('.jack'): return None
+
+    start = time.perf_counter()
     base_name = os.path.basename(input_file)
     vm_name = base_name.replace('.jack', '.vm')
     output_path = os.path.join(output_dir, vm_name)
+    tmp_path = output_path + '.tmp'
     
     print(f"Compiling: {base_name} -> output/{vm_name}")
     
     tokenizer = JackTokenizer(input_file)
-    engine = CompilationEngine(tokenizer, output_path)
+    engine = CompilationEngine(tokenizer, tmp_path, string_pool, optimize)
     engine.compile_class()
     engine.close()
 
+    if engine.errors:
+        os.remove(tmp_path)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    else:
+        os.replace(tmp_path, output_path)
+    return base_name, time.perf_counter() - start, engine.errors
+
+def analyze_files(input_files, output_dir, jobs=1, string_pool=False, optimize=False):
+    """
+    編譯多個檔案；jobs > 1 時用 process pool 平行處理 (各個 class 互相獨立)，
+    每個 worker 自己寫出自己的 .vm，回傳每個檔案的結果。
+    """
+    if jobs > 1 and len(input_files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(analyze_file, f, output_dir, string_pool, optimize)
+                       for f in input_files]
+            return [future.result() for future in futures]
+    return [analyze_file(f, output_dir, string_pool, optimize) for f in input_files]
+
+def analyze_files_cached(input_files, output_dir, cache, jobs=1, string_pool=False, optimize=False):
+    """
+    先用 BuildCache 挑出內容或選項有變的檔案，只編譯這些；
+    回傳 (編譯結果, 跳過的檔案數)。cache 為 None 時全部重新編譯。
+    """
+    if cache is None:
+        return analyze_files(input_files, output_dir, jobs, string_pool, optimize), 0
+
+    def output_of(input_file):
+        return os.path.join(output_dir, os.path.basename(input_file).replace('.jack', '.vm'))
+
+    stale = [f for f in input_files
+             if not cache.is_fresh(os.path.basename(f), [f], [output_of(f)])]
+    snapshots = [cache.snapshot([f]) for f in stale]
+    results = analyze_files(stale, output_dir, jobs, string_pool, optimize)
+    for input_file, snapshot, (name, _, errors) in zip(stale, snapshots, results):
+        if errors:
+            cache.discard(name)
+        else:
+            cache.update(name, snapshot, [output_of(input_file)])
+    cache.save()
+    return results, len(input_files) - len(stale)
+
+def print_timings(results, total, jobs):
+    print("\nTiming:")
+    for name, elapsed, _ in sorted(results, key=lambda r: -r[1]):
+        print(f"  {name:<24}{elapsed * 1000:8.2f} ms")
+    print(f"Total: {len(results)} files in {total * 1000:.2f} ms (jobs={jobs})")
+
+def write_file_atomic(path, text):
+    """先寫到暫存檔再 os.replace，不會留下寫到一半的檔案"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def analyze_project(input_dir, output_dir, string_pool=False, optimize=False, cache=None):
+    """
+    --project: 整個目錄一起編譯。先建立 ProjectIndex 檢查跨 class 的呼叫，
+    全部編譯完後再移除從 Main.main / Sys.init 走不到的 subroutine，最後才寫出 .vm。
+    回傳錯誤數量 (有錯誤時不寫出任何 .vm，並刪掉上次編譯的 .vm)。
+    每個 class 的輸出都和其他 class 有關，所以快取以整個目錄為單位：任何一個檔案變了就全部重編。
+    """
+    jack_files = sorted(os.path.join(input_dir, f) for f in os.listdir(input_dir) if f.endswith('.jack'))
+    output_paths = [os.path.join(output_dir, os.path.basename(f).replace('.jack', '.vm')) for f in jack_files]
+    if cache is not None:
+        if cache.is_fresh('--project', jack_files, output_paths):
+            print(f"Up to date: {len(jack_files)} file(s)")
+            return 0
+        snapshot = cache.snapshot(jack_files)
+    project = ProjectIndex(jack_files)
+
+    outputs = {}
+    error_count = 0
+    for jack_file in jack_files:
+        base_name = os.path.basename(jack_file)
+        print(f"Compiling: {base_name}")
+        stream = io.StringIO()
+        engine = CompilationEngine(project.tokenizers[jack_file], stream, string_pool, optimize, project)
+        engine.compile_class()
+        engine.close()
+        for message in engine.errors:
+            print(message)
+        error_count += len(engine.errors)
+        outputs[base_name.replace('.jack', '.vm')] = stream.getvalue().splitlines()
+    if error_count:
+        # 上次編譯留下的 .vm 也刪掉，以免後續工具執行舊的程式
+        for path in output_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        if cache is not None:
+            cache.discard('--project')
+            cache.save()
+        return error_count
+
+    # Dead subroutine elimination：沒有進入點 (例如只是函式庫) 時全部保留
+    blocks = {vm_name: function_blocks(lines) for vm_name, lines in outputs.items()}
+    all_blocks = [block for class_blocks in blocks.values() for block in class_blocks]
+    reachable = reachable_functions(all_blocks)
+    removed = []
+    for vm_name, class_blocks in blocks.items():
+        if reachable:
+            removed += [(name, len(body)) for name, body in class_blocks if name not in reachable]
+            class_blocks = [(name, body) for name, body in class_blocks if name in reachable]
+        write_file_atomic(os.path.join(output_dir, vm_name),
+                          ''.join(line + '\n' for _, body in class_blocks for line in body))
+
+    if removed:
+        print(f"\nRemoved {len(removed)} unreachable subroutine(s), "
+              f"{sum(n for _, n in removed)} VM command(s):")
+        for name, n in removed:
+            print(f"  {name} ({n})")
+    if cache is not None:
+        cache.update('--project', snapshot, output_paths)
+        cache.save()
+    return 0
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python JackCompiler.py [file.jack|dir]")
-        return
-    
-    path = sys.argv[1]
+    arg_parser = argparse.ArgumentParser(
+        usage="python JackCompiler.py [-O] [--string-pool] [--project] [--jobs N] [--no-cache] [file.jack|dir]")
+    arg_parser.add_argument('path')
+    arg_parser.add_argument('--string-pool', action='store_true',
+                            help="相同的字串常數只建構一次，存在 static 中重複使用")
+    arg_parser.add_argument('-O', '--optimize', action='store_true',
+                            help="常數折疊、代數化簡、乘以 2 的次方改成加法、if/while 分支化簡")
+    arg_parser.add_argument('--project', action='store_true',
+                            help="整個目錄一起編譯：檢查跨 class 呼叫、移除用不到的 subroutine")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help="平行編譯的 process 數 (0 = CPU 核心數；--project 時不使用)")
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help=f"不使用 {CACHE_FILE_NAME} 編譯快取，全部重新編譯")
+    args = arg_parser.parse_args()
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    path = args.path
     OUTPUT_FOLDER_NAME = "output"
+    error_count = 0
+    options = f"string_pool={args.string_pool},optimize={args.optimize},project={args.project}"
 
     if os.path.isdir(path):
         output_dir = os.path.join(path, OUTPUT_FOLDER_NAME)
@@ -552,17 +1434,48 @@ def main():
         print(f"Processing directory: {path}")
         print(f"Output directory: {output_dir}\n")
 
-        for filename in os.listdir(path):
-            if filename.endswith(".jack"):
-                analyze_file(os.path.join(path, filename), output_dir)
+        cache = None if args.no_cache else BuildCache(path, options)
+        if args.project:
+            error_count += analyze_project(path, output_dir, args.string_pool, args.optimize, cache)
+        else:
+            input_files = [os.path.join(path, filename) for filename in sorted(os.listdir(path))
+                           if filename.endswith(".jack")]
+            start = time.perf_counter()
+            results, skipped = analyze_files_cached(input_files, output_dir, cache, jobs,
+                                                    args.string_pool, args.optimize)
+            # 錯誤復原後一次列出全部診斷訊息
+            for _, _, errors in results:
+                for message in errors:
+                    print(message)
+                error_count += len(errors)
+            if skipped:
+                print(f"Up to date: {skipped} file(s)")
+            if results:
+                print_timings(results, time.perf_counter() - start, jobs)
                 
+    elif args.project:
+        print("--project requires a directory")
+        sys.exit(1)
     elif os.path.isfile(path):
         dir_path = os.path.dirname(path)
         output_dir = os.path.join(dir_path, OUTPUT_FOLDER_NAME)
         os.makedirs(output_dir, exist_ok=True)
-        analyze_file(path, output_dir)
+        if path.endswith('.jack'):
+            cache = None if args.no_cache else BuildCache(dir_path, options)
+            results, skipped = analyze_files_cached([path], output_dir, cache,
+                                                    string_pool=args.string_pool, optimize=args.optimize)
+            for _, _, errors in results:
+                for message in errors:
+                    print(message)
+                error_count += len(errors)
+            if skipped:
+                print(f"Up to date: {os.path.basename(path)}")
     else:
         print("Invalid file or directory")
 
+    if error_count:
+        print(f"\n{error_count} error(s)")
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
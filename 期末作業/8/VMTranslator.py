@@ -1,5 +1,7 @@
 import os
 import sys
+import io
+import argparse
 
 class Parser:
     """解析 VM 指令"""
@@ -15,8 +17,12 @@ class Parser:
     C_CALL = 8
     
     def __init__(self, input_file):
-        with open(input_file, 'r') as f:
-            self.lines = f.readlines()
+        # input_file 可以是檔案路徑，或已經在記憶體中的 VM 指令行 (例如 JackToolchain 直接接編譯器的輸出)
+        if isinstance(input_file, str):
+            with open(input_file, 'r') as f:
+                self.lines = f.readlines()
+        else:
+            self.lines = list(input_file)
         self.current_command = ""
         self.current_line = -1
         
@@ -82,11 +88,13 @@ class CodeWriter:
     """生成組合語言代碼"""
     
     def __init__(self, output_file):
-        self.output = open(output_file, 'w')
+        # output_file 可以是檔案路徑，或已經開好的文字串流 (例如計算 ROM 大小用的 io.StringIO)
+        self.output = open(output_file, 'w') if isinstance(output_file, str) else output_file
         self.current_file = ""
         self.label_counter = 0
         self.current_function = ""
         self.call_counter = 0
+        self.inlined_calls = {}  # --inline: function -> 被內嵌的呼叫次數
         
     def set_file_name(self, file_name):
         self.current_file = os.path.splitext(os.path.basename(file_name))[0]
@@ -299,6 +307,11 @@ class CodeWriter:
         # (return_label)
         self.output.write(f"({return_label})\n")
     
+    def write_inline_comment(self, function_name, num_args):
+        """--inline: 標記接下來是內嵌展開的 function 本體"""
+        self.output.write(f"// inline call {function_name} {num_args}\n")
+        self.inlined_calls[function_name] = self.inlined_calls.get(function_name, 0) + 1
+    
     def write_return(self):
         self.output.write("// return\n")
         
@@ -348,61 +361,317 @@ class CodeWriter:
         self.output.close()
 
 
-def translate_file(input_file, code_writer):
-    parser = Parser(input_file)
-    code_writer.set_file_name(input_file)
-    
+def write_command(code_writer, cmd_type, arg1=None, arg2=None):
+    """把一個已解析的 VM 指令交給 CodeWriter"""
+    if cmd_type == Parser.C_ARITHMETIC:
+        code_writer.write_arithmetic(arg1)
+    elif cmd_type in [Parser.C_PUSH, Parser.C_POP]:
+        command = 'push' if cmd_type == Parser.C_PUSH else 'pop'
+        code_writer.write_push_pop(command, arg1, arg2)
+    elif cmd_type == Parser.C_LABEL:
+        code_writer.write_label(arg1)
+    elif cmd_type == Parser.C_GOTO:
+        code_writer.write_goto(arg1)
+    elif cmd_type == Parser.C_IF:
+        code_writer.write_if(arg1)
+    elif cmd_type == Parser.C_FUNCTION:
+        code_writer.write_function(arg1, arg2)
+    elif cmd_type == Parser.C_CALL:
+        code_writer.write_call(arg1, arg2)
+    elif cmd_type == Parser.C_RETURN:
+        code_writer.write_return()
+
+
+def parse_command(parser):
+    """目前指令的 (類型, arg1, arg2)；沒有的參數為 None"""
+    cmd_type = parser.command_type()
+    arg1 = parser.arg1() if cmd_type not in (None, Parser.C_RETURN) else None
+    arg2 = parser.arg2() if cmd_type in (Parser.C_PUSH, Parser.C_POP,
+                                         Parser.C_FUNCTION, Parser.C_CALL) else None
+    return cmd_type, arg1, arg2
+
+
+def read_commands(parser):
+    """讀出全部指令的 (類型, arg1, arg2)，略過空行"""
+    commands = []
     while parser.has_more_commands():
         parser.advance()
-        cmd_type = parser.command_type()
+        command = parse_command(parser)
+        if command[0] is not None:
+            commands.append(command)
+    return commands
+
+
+def translate_file(input_file, code_writer, skip_functions=frozenset(), inliner=None):
+    """
+    翻譯一個 .vm 檔。
+    skip_functions 中的 function 整段略過 (None 代表第一個 function 之前的指令)；
+    有 inliner 時，可以內嵌的 call 直接展開成 function 本體。
+    """
+    code_writer.set_file_name(input_file)
+    translate_commands(read_commands(Parser(input_file)), code_writer, skip_functions, inliner)
+
+
+def translate_commands(commands, code_writer, skip_functions=frozenset(), inliner=None):
+    """翻譯已解析好的指令 (類型, arg1, arg2)；static 的名稱用 code_writer 目前的檔名"""
+    current_function = None
+    
+    for cmd_type, arg1, arg2 in commands:
+        if cmd_type == Parser.C_FUNCTION:
+            current_function = arg1
+        if current_function in skip_functions:
+            continue
         
-        if cmd_type == Parser.C_ARITHMETIC:
-            code_writer.write_arithmetic(parser.arg1())
-        elif cmd_type in [Parser.C_PUSH, Parser.C_POP]:
-            command = 'push' if cmd_type == Parser.C_PUSH else 'pop'
-            code_writer.write_push_pop(command, parser.arg1(), parser.arg2())
-        elif cmd_type == Parser.C_LABEL:
-            code_writer.write_label(parser.arg1())
-        elif cmd_type == Parser.C_GOTO:
-            code_writer.write_goto(parser.arg1())
-        elif cmd_type == Parser.C_IF:
-            code_writer.write_if(parser.arg1())
-        elif cmd_type == Parser.C_FUNCTION:
-            code_writer.write_function(parser.arg1(), parser.arg2())
-        elif cmd_type == Parser.C_CALL:
-            code_writer.write_call(parser.arg1(), parser.arg2())
-        elif cmd_type == Parser.C_RETURN:
-            code_writer.write_return()
+        if cmd_type == Parser.C_CALL and inliner:
+            expansion = inliner.expand(arg1, arg2, code_writer.current_file)
+            if expansion is not None:
+                code_writer.write_inline_comment(arg1, arg2)
+                for command in expansion:
+                    write_command(code_writer, *command)
+                continue
+        write_command(code_writer, cmd_type, arg1, arg2)
+
+
+# ============= Whole-program analysis (--prune / --inline) =============
+
+class VMFunction:
+    """一個 function 的 VM 指令: [(類型, arg1, arg2)]，不含開頭的 function 指令"""
+    
+    def __init__(self, name, file_name, num_locals):
+        self.name = name
+        self.file_name = file_name
+        self.num_locals = num_locals
+        self.commands = []
+
+
+def read_functions(vm_files):
+    """讀入所有 .vm，回傳 {function 名稱: VMFunction}"""
+    functions = {}
+    for vm_file in vm_files:
+        parser = Parser(vm_file)
+        file_name = os.path.splitext(os.path.basename(vm_file))[0]
+        current = None
+        while parser.has_more_commands():
+            parser.advance()
+            command = parse_command(parser)
+            if command[0] == Parser.C_FUNCTION:
+                current = functions[command[1]] = VMFunction(command[1], file_name, command[2])
+            elif command[0] is not None and current is not None:
+                current.commands.append(command)
+    return functions
+
+
+# ============= Dead function elimination (--prune) =============
+
+# call graph 的進入點：bootstrap 呼叫 Sys.init，Sys.init 再呼叫 Main.main
+ENTRY_POINTS = ('Sys.init', 'Main.main')
+
+def call_graph(functions, inliner=None):
+    """{function: 呼叫到的 function 集合}；會被內嵌的呼叫不算在內"""
+    calls = {}
+    for name, function in functions.items():
+        calls[name] = {
+            arg1 for cmd_type, arg1, arg2 in function.commands
+            if cmd_type == Parser.C_CALL
+            and not (inliner and inliner.expand(arg1, arg2, function.file_name) is not None)
+        }
+    return calls
+
+def reachable_functions(calls, entry_points=ENTRY_POINTS):
+    """從進入點沿著 call graph 走訪，回傳走得到的 function 名稱"""
+    reachable = set()
+    pending = [name for name in entry_points if name in calls]
+    while pending:
+        name = pending.pop()
+        if name not in reachable:
+            reachable.add(name)
+            pending.extend(calls.get(name, ()))
+    return reachable
+
+def rom_words(asm_text):
+    """組合語言佔用的 ROM 大小 (指令數，不含註解與 label)"""
+    count = 0
+    for line in asm_text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//') and not line.startswith('('):
+            count += 1
+    return count
+
+def prune_report(vm_files, functions, removed, inliner=None):
+    """印出被移除的 function 原本會佔用的 VM 指令數與 ROM 大小"""
+    stream = io.StringIO()
+    writer = CodeWriter(stream)
+    kept = (set(functions) - removed) | {None}
+    for vm_file in vm_files:
+        translate_file(vm_file, writer, kept, inliner)
+    saved_words = rom_words(stream.getvalue())
+    
+    # VM 指令數含開頭的 function 指令
+    sizes = {name: len(functions[name].commands) + 1 for name in removed}
+    print(f"Pruned {len(removed)} unreachable function(s): "
+          f"{sum(sizes.values())} VM command(s), {saved_words} ROM word(s)")
+    for name in sorted(removed):
+        print(f"  {name} ({sizes[name]})")
+
+
+# ============= Inlining (--inline) =============
+
+# 預設只內嵌本體 (不含 function / return) 不超過這麼多個 VM 指令的 function
+INLINE_LIMIT = 12
+
+BINARY_COMMANDS = {'add', 'sub', 'eq', 'gt', 'lt', 'and', 'or'}
+
+class Inliner:
+    """
+    把小的 leaf function (不呼叫別的 function、沒有分支、最後一個指令才 return)
+    直接展開在呼叫端，省下 call / return 的 frame 建立與還原。
+    展開時 argument / local 改放到 callee 沒用到的 temp，
+    callee 會改到 pointer 0 / 1 (this / that) 時先存起來、結束後還原。
+    """
+    
+    def __init__(self, functions, limit=INLINE_LIMIT):
+        self.functions = functions
+        self.bodies = {}
+        for name, function in functions.items():
+            info = self._analyze(function, limit)
+            if info is not None:
+                self.bodies[name] = info
+    
+    @staticmethod
+    def _analyze(function, limit):
+        """可以內嵌時回傳 (用到的 temp, 寫入的 pointer, 最大 argument index, 是否用到 static)"""
+        commands = function.commands
+        if not commands or commands[-1][0] != Parser.C_RETURN or len(commands) - 1 > limit:
+            return None
+        
+        depth = 0  # 模擬堆疊深度，確認 return 時只剩回傳值
+        used_temps = set()
+        pointers = set()
+        max_arg = -1
+        uses_static = False
+        for cmd_type, segment, index in commands[:-1]:
+            if cmd_type == Parser.C_ARITHMETIC:
+                depth -= 1 if segment in BINARY_COMMANDS else 0
+            elif cmd_type in (Parser.C_PUSH, Parser.C_POP):
+                depth += 1 if cmd_type == Parser.C_PUSH else -1
+                if segment == 'temp':
+                    used_temps.add(index)
+                elif segment == 'argument':
+                    max_arg = max(max_arg, index)
+                elif segment == 'static':
+                    uses_static = True
+                elif segment == 'pointer' and cmd_type == Parser.C_POP:
+                    pointers.add(index)
+            else:
+                return None  # label / goto / if-goto / call / 中途 return
+            if depth < 0:
+                return None
+        if depth != 1:
+            return None
+        return used_temps, pointers, max_arg, uses_static
+    
+    def expand(self, name, num_args, caller_file):
+        """回傳取代 call name num_args 的 VM 指令；不能內嵌時回傳 None"""
+        info = self.bodies.get(name)
+        if info is None:
+            return None
+        used_temps, pointers, max_arg, uses_static = info
+        function = self.functions[name]
+        # static 依檔名命名，只能內嵌到同一個檔案
+        if (uses_static and caller_file != function.file_name) or max_arg >= num_args:
+            return None
+        free = [i for i in range(8) if i not in used_temps]
+        if num_args + function.num_locals + len(pointers) > len(free):
+            return None
+        arg_slots = free[:num_args]
+        local_slots = free[num_args:num_args + function.num_locals]
+        save_slots = dict(zip(sorted(pointers), free[num_args + function.num_locals:]))
+        
+        # 呼叫端已經把參數 push 好：依相反順序 pop 到 temp
+        expansion = [(Parser.C_POP, 'temp', slot) for slot in reversed(arg_slots)]
+        for slot in local_slots:
+            expansion += [(Parser.C_PUSH, 'constant', 0), (Parser.C_POP, 'temp', slot)]
+        for pointer, slot in save_slots.items():
+            expansion += [(Parser.C_PUSH, 'pointer', pointer), (Parser.C_POP, 'temp', slot)]
+        
+        for cmd_type, segment, index in function.commands[:-1]:
+            if segment == 'argument':
+                segment, index = 'temp', arg_slots[index]
+            elif segment == 'local':
+                segment, index = 'temp', local_slots[index]
+            expansion.append((cmd_type, segment, index))
+        
+        # 回傳值留在堆疊頂端，還原 pointer 的 push / pop 不影響它
+        for pointer, slot in save_slots.items():
+            expansion += [(Parser.C_PUSH, 'temp', slot), (Parser.C_POP, 'pointer', pointer)]
+        return expansion
 
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python VMTranslator.py <input.vm or directory>")
-        sys.exit(1)
+    arg_parser = argparse.ArgumentParser(
+        usage="python VMTranslator.py [--prune] [--inline [--inline-limit N]] <input.vm or directory>")
+    arg_parser.add_argument('input_path')
+    arg_parser.add_argument('--prune', action='store_true',
+                            help="不翻譯從 Sys.init / Main.main 呼叫不到的 function，並回報省下的大小")
+    arg_parser.add_argument('--inline', action='store_true',
+                            help="把小的 leaf function 直接展開在呼叫端")
+    arg_parser.add_argument('--inline-limit', type=int, default=INLINE_LIMIT,
+                            help=f"可內嵌的 function 本體最多幾個 VM 指令 (預設 {INLINE_LIMIT})")
+    args = arg_parser.parse_args()
     
-    input_path = sys.argv[1]
+    input_path = args.input_path
     
     if os.path.isfile(input_path):
         # 單一檔案
         output_file = input_path.replace('.vm', '.asm')
-        code_writer = CodeWriter(output_file)
-        translate_file(input_path, code_writer)
-        code_writer.close()
+        vm_files = [input_path]
+        bootstrap = False
     elif os.path.isdir(input_path):
         # 目錄
         output_file = os.path.join(input_path, os.path.basename(input_path) + '.asm')
-        code_writer = CodeWriter(output_file)
-        code_writer.write_init()
-        
-        vm_files = [f for f in os.listdir(input_path) if f.endswith('.vm')]
-        for vm_file in sorted(vm_files):
-            translate_file(os.path.join(input_path, vm_file), code_writer)
-        
-        code_writer.close()
+        vm_files = [os.path.join(input_path, f) for f in sorted(os.listdir(input_path)) if f.endswith('.vm')]
+        bootstrap = True
     else:
         print("Error: Invalid input path")
         sys.exit(1)
     
+    # --prune / --inline 需要先讀入整個程式
+    functions = read_functions(vm_files) if args.prune or args.inline else {}
+    inliner = Inliner(functions, args.inline_limit) if args.inline else None
+    
+    # --prune: 建好 call graph (內嵌掉的呼叫不算)，翻譯時略過走不到的 function
+    removed = set()
+    if args.prune:
+        reachable = reachable_functions(call_graph(functions, inliner))
+        if reachable:
+            removed = set(functions) - reachable
+        else:
+            print("No Sys.init or Main.main found, nothing pruned")
+    
+    code_writer = CodeWriter(output_file)
+    if bootstrap:
+        code_writer.write_init()
+    for vm_file in vm_files:
+        translate_file(vm_file, code_writer, removed, inliner)
+    code_writer.close()
+    
+    if code_writer.inlined_calls:
+        print(f"Inlined {sum(code_writer.inlined_calls.values())} call(s):")
+        for name, count in sorted(code_writer.inlined_calls.items()):
+            print(f"  {name} x{count}")
+    if removed:
+        prune_report(vm_files, functions, removed, inliner)
+    if args.prune or args.inline:
+        # 和不加任何選項的翻譯結果比較 ROM 大小
+        baseline = CodeWriter(io.StringIO())
+        if bootstrap:
+            baseline.write_init()
+        for vm_file in vm_files:
+            translate_file(vm_file, baseline)
+        with open(output_file) as f:
+            words = rom_words(f.read())
+        print(f"ROM: {rom_words(baseline.output.getvalue())} -> {words} word(s)")
+    
     print(f"Translation completed: {output_file}")
 
 
@@ -6,8 +6,24 @@ Jack Compiler - Nand2Tetris Chapter 10 & 11
 import os
 import sys
 import re
+import json
+import time
+import hashlib
+import argparse
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
+
+# 各文法結構的起始關鍵字
+CLASS_VAR_KEYWORDS = frozenset({'static', 'field'})
+SUBROUTINE_KEYWORDS = frozenset({'constructor', 'function', 'method'})
+STATEMENT_KEYWORDS = frozenset({'let', 'if', 'while', 'do', 'return'})
+TYPE_KEYWORDS = frozenset({'int', 'char', 'boolean'})
+
+# 錯誤復原 (panic mode) 的同步點：跳過 token 直到遇到這些 token 為止
+STATEMENT_SYNC = STATEMENT_KEYWORDS | SUBROUTINE_KEYWORDS | {'}'}
+MEMBER_SYNC = CLASS_VAR_KEYWORDS | SUBROUTINE_KEYWORDS
 
 # ============= Tokenizer =============
 
@@ -28,14 +44,17 @@ class JackTokenizer:
     SYMBOLS = {'{', '}', '(', ')', '[', ']', '.', ',', ';', '+', '-', '*', 
                '/', '&', '|', '<', '>', '=', '~'}
     
-    def __init__(self, input_text: str):
+    def __init__(self, input_text: str, source_name: str = "<input>"):
+        self.source_name = source_name
         self.tokens = []
+        self.positions = []  # 每個 token 的 (行, 欄)，錯誤訊息用
         self.current = 0
         self._tokenize(input_text)
     
     def _tokenize(self, text: str):
         # 移除註解
         text = self._remove_comments(text)
+        self._line_starts = [0] + [m.end() for m in re.finditer(r'\n', text)]
         
         i = 0
         while i < len(text):
@@ -49,13 +68,13 @@ class JackTokenizer:
                 j = i + 1
                 while j < len(text) and text[j] != '"':
                     j += 1
-                self.tokens.append((TokenType.STRING_CONST, text[i+1:j]))
+                self._add((TokenType.STRING_CONST, text[i+1:j]), i)
                 i = j + 1
                 continue
             
             # 符號
             if text[i] in self.SYMBOLS:
-                self.tokens.append((TokenType.SYMBOL, text[i]))
+                self._add((TokenType.SYMBOL, text[i]), i)
                 i += 1
                 continue
             
@@ -64,7 +83,7 @@ class JackTokenizer:
                 j = i
                 while j < len(text) and text[j].isdigit():
                     j += 1
-                self.tokens.append((TokenType.INT_CONST, int(text[i:j])))
+                self._add((TokenType.INT_CONST, int(text[i:j])), i)
                 i = j
                 continue
             
@@ -73,21 +92,29 @@ class JackTokenizer:
                 j = i
                 while j < len(text) and (text[j].isalnum() or text[j] == '_'):
                     j += 1
-                word = text[i:j]
+                word = sys.intern(text[i:j])  # intern: 查表時可直接比對位址
                 if word in self.KEYWORDS:
-                    self.tokens.append((TokenType.KEYWORD, word))
+                    self._add((TokenType.KEYWORD, word), i)
                 else:
-                    self.tokens.append((TokenType.IDENTIFIER, word))
+                    self._add((TokenType.IDENTIFIER, word), i)
                 i = j
                 continue
             
             i += 1
     
+    def _add(self, token, start: int):
+        """加入 token 並記錄它在原始碼中的 (行, 欄)"""
+        line = bisect_right(self._line_starts, start)
+        self.tokens.append(token)
+        self.positions.append((line, start - self._line_starts[line - 1] + 1))
+    
     def _remove_comments(self, text: str) -> str:
+        # 註解換成等長的空白 (保留換行)，token 的行號、欄號才會正確
+        blank = lambda m: re.sub(r'[^\n]', ' ', m.group())
         # 移除 // 註解
-        text = re.sub(r'//.*', '', text)
+        text = re.sub(r'//.*', blank, text)
         # 移除 /* */ 註解
-        text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
+        text = re.sub(r'/\*.*?\*/', blank, text, flags=re.DOTALL)
         return text
     
     def has_more_tokens(self) -> bool:
@@ -96,11 +123,26 @@ class JackTokenizer:
     def advance(self):
         self.current += 1
     
-    def token_type(self) -> TokenType:
-        return self.tokens[self.current][0]
+    def token_type(self) -> Optional[TokenType]:
+        # 檔尾回傳 None
+        if self.current < len(self.tokens):
+            return self.tokens[self.current][0]
+        return None
     
     def token_value(self):
-        return self.tokens[self.current][1]
+        if self.current < len(self.tokens):
+            return self.tokens[self.current][1]
+        return None
+    
+    def position(self):
+        """目前 token 的 (行, 欄)；到檔尾時回傳最後一個 token 的位置"""
+        if not self.positions:
+            return (1, 1)
+        return self.positions[min(self.current, len(self.positions) - 1)]
+    
+    def at_class_end(self) -> bool:
+        """目前 token 是否為檔案最後的 '}' (class 結尾)"""
+        return self.current == len(self.tokens) - 1 and self.token_value() == '}'
     
     def peek(self, offset=1):
         idx = self.current + offset
@@ -116,6 +158,14 @@ class SymbolKind(Enum):
     ARG = "argument"
     VAR = "local"
 
+# 符號種類對應到 VM 記憶體區段
+SEGMENT_MAP = {
+    SymbolKind.STATIC: "static",
+    SymbolKind.FIELD: "this",
+    SymbolKind.ARG: "argument",
+    SymbolKind.VAR: "local"
+}
+
 class SymbolTable:
     def __init__(self):
         self.class_scope = {}
@@ -198,18 +248,218 @@ class VMWriter:
     def write_return(self):
         self.output.append("return")
     
+    def write_string(self, s: str):
+        # 字串常數: String.new(len) 之後逐字元 appendChar
+        self.output.append(f"push constant {len(s)}")
+        self.output.append("call String.new 1")
+        for char in s:
+            self.output.append(f"push constant {ord(char)}")
+            self.output.append("call String.appendChar 2")
+    
     def get_output(self) -> str:
         return '\n'.join(self.output)
 
+# ============= Optimizer =============
+
+# x op c 時 c 為單位元素 (結果就是 x)；左邊版本只列可交換的運算子
+RIGHT_IDENTITY = {'+': 0, '-': 0, '*': 1, '/': 1, '|': 0, '&': -1}
+LEFT_IDENTITY = {'+': 0, '*': 1, '|': 0, '&': -1}
+
+# 把堆疊頂端的值乘 2 (VM 沒有 dup，借用 temp 1；pop/push 相鄰，不會被其他呼叫蓋掉)
+DOUBLE_TOP = ['pop temp 1', 'push temp 1', 'push temp 1', 'add']
+
+def to_int16(value: int) -> int:
+    value &= 0xFFFF
+    return value - 0x10000 if value & 0x8000 else value
+
+def constant_value(lines: List[str], start: int, end: Optional[int] = None) -> Optional[int]:
+    """lines[start:end] 若只是推入一個常數 (push constant c [neg|not])，回傳它的 16-bit 值"""
+    end = len(lines) if end is None else end
+    if not 0 < end - start <= 2 or not lines[start].startswith('push constant '):
+        return None
+    value = int(lines[start][14:])
+    if end - start == 1:
+        return value
+    if lines[start + 1] == 'neg':
+        return to_int16(-value)
+    if lines[start + 1] == 'not':
+        return to_int16(~value)
+    return None
+
+def constant_lines(value: int) -> List[str]:
+    """推入 16-bit 常數的指令 (push constant 只接受 0..32767，負數用 neg / not 組出來)"""
+    if value >= 0:
+        return [f"push constant {value}"]
+    if value == -32768:
+        return ["push constant 32767", "not"]
+    return [f"push constant {-value}", "neg"]
+
+def fold_binary(op: str, a: int, b: int) -> Optional[int]:
+    """編譯期計算 a op b；結果可能和執行期不同時 (除以 0、減法溢位的比較) 回傳 None"""
+    if op == '+':
+        return to_int16(a + b)
+    if op == '-':
+        return to_int16(a - b)
+    if op == '*':
+        return to_int16(a * b)
+    if op == '&':
+        return a & b
+    if op == '|':
+        return a | b
+    if op == '=':
+        return -1 if a == b else 0
+    if op == '/':
+        if b == 0 or a == -32768 or b == -32768:
+            return None
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+    # lt / gt 在 VM 翻譯器中是用 x - y 的正負判斷，溢位時結果和數學上的比較不同
+    if not -32768 <= a - b <= 32767:
+        return None
+    if op == '<':
+        return -1 if a < b else 0
+    return -1 if a > b else 0
+
+# ============= Project Index =============
+
+# Jack OS 的 API (--project 檢查呼叫用)：class -> {subroutine: (kind, 參數數量)}
+# method 的參數數量不含 this
+OS_API: Dict[str, Dict[str, Tuple[str, int]]] = {
+    'Math': {name: ('function', n) for name, n in {
+        'init': 0, 'abs': 1, 'multiply': 2, 'divide': 2, 'min': 2, 'max': 2, 'sqrt': 1}.items()},
+    'String': {
+        'new': ('constructor', 1), 'dispose': ('method', 0), 'length': ('method', 0),
+        'charAt': ('method', 1), 'setCharAt': ('method', 2), 'appendChar': ('method', 1),
+        'eraseLastChar': ('method', 0), 'intValue': ('method', 0), 'setInt': ('method', 1),
+        'backSpace': ('function', 0), 'doubleQuote': ('function', 0), 'newLine': ('function', 0)},
+    'Array': {'new': ('function', 1), 'dispose': ('method', 0)},
+    'Output': {name: ('function', n) for name, n in {
+        'init': 0, 'moveCursor': 2, 'printChar': 1, 'printString': 1, 'printInt': 1,
+        'println': 0, 'backSpace': 0}.items()},
+    'Screen': {name: ('function', n) for name, n in {
+        'init': 0, 'clearScreen': 0, 'setColor': 1, 'drawPixel': 2, 'drawLine': 4,
+        'drawRectangle': 4, 'drawCircle': 3}.items()},
+    'Keyboard': {name: ('function', n) for name, n in {
+        'init': 0, 'keyPressed': 0, 'readChar': 0, 'readLine': 1, 'readInt': 1}.items()},
+    'Memory': {name: ('function', n) for name, n in {
+        'init': 0, 'peek': 1, 'poke': 2, 'alloc': 1, 'deAlloc': 1}.items()},
+    'Sys': {name: ('function', n) for name, n in {
+        'init': 0, 'halt': 0, 'error': 1, 'wait': 1}.items()},
+}
+
+# --project 做 dead subroutine elimination 時的進入點
+ENTRY_POINTS = ('Main.main', 'Sys.init')
+
+class ProjectIndex:
+    """
+    整個目錄一起編譯時，先掃過所有 .jack 建立全域索引：
+    class -> {subroutine: (kind, 參數數量)}，並加入 OS 的 API。
+    掃描用的 tokenizer 會保留下來，正式編譯時直接沿用，不必再分詞一次。
+    """
+    
+    def __init__(self, jack_files: List[str]):
+        self.classes = {name: dict(subroutines) for name, subroutines in OS_API.items()}
+        self.tokenizers: Dict[str, JackTokenizer] = {}
+        for jack_file in jack_files:
+            with open(jack_file, 'r') as f:
+                tokenizer = JackTokenizer(f.read(), os.path.basename(jack_file))
+            self.tokenizers[jack_file] = tokenizer
+            self._scan(tokenizer.tokens)
+    
+    def _scan(self, tokens):
+        # 只看 class 名稱與 subroutine 宣告；語法錯誤留給正式編譯時回報
+        if len(tokens) < 2 or tokens[0] != (TokenType.KEYWORD, 'class'):
+            return
+        subroutines = self.classes[tokens[1][1]] = {}  # 專案內的同名 class 取代 OS 的版本
+        depth = 0
+        for i, (token_type, value) in enumerate(tokens):
+            if token_type == TokenType.SYMBOL and value == '{':
+                depth += 1
+            elif token_type == TokenType.SYMBOL and value == '}':
+                depth -= 1
+            elif (depth == 1 and token_type == TokenType.KEYWORD
+                    and value in SUBROUTINE_KEYWORDS
+                    and tokens[i + 3:i + 4] == [(TokenType.SYMBOL, '(')]):
+                n_params = 0
+                for param in tokens[i + 4:]:
+                    if param[0] == TokenType.SYMBOL and param[1] == ')':
+                        break
+                    if n_params == 0 or param == (TokenType.SYMBOL, ','):
+                        n_params += 1
+                subroutines[tokens[i + 2][1]] = (value, n_params)
+    
+    def has_class(self, class_name: str) -> bool:
+        return class_name in self.classes
+    
+    def lookup(self, class_name: str, sub_name: str) -> Optional[Tuple[str, int]]:
+        """回傳 (kind, 參數數量)；找不到時回傳 None"""
+        return self.classes.get(class_name, {}).get(sub_name)
+
+def function_blocks(lines: List[str]) -> List[Tuple[str, List[str]]]:
+    """把 VM 指令依 function 切開: [(function 名稱, [指令...])]"""
+    blocks = []
+    for line in lines:
+        if line.startswith('function '):
+            blocks.append((line.split()[1], []))
+        if blocks:
+            blocks[-1][1].append(line)
+    return blocks
+
+def reachable_functions(blocks: List[Tuple[str, List[str]]], entry_points=ENTRY_POINTS) -> Set[str]:
+    """從進入點沿著 call 指令走訪 call graph，回傳走得到的 function 名稱"""
+    calls = {name: [line.split()[1] for line in body if line.startswith('call ')]
+             for name, body in blocks}
+    reachable = set()
+    pending = [name for name in entry_points if name in calls]
+    while pending:
+        name = pending.pop()
+        if name in reachable:
+            continue
+        reachable.add(name)
+        pending.extend(callee for callee in calls.get(name, ()) if callee not in reachable)
+    return reachable
+
 # ============= Compilation Engine =============
 
+class JackSyntaxError(Exception):
+    """語法錯誤 (含行號、欄號)，由 CompilationEngine 接住後做 panic-mode 復原"""
+    
+    def __init__(self, message: str, line: int, col: int):
+        super().__init__(message)
+        self.message = message
+        self.line = line
+        self.col = col
+
 class CompilationEngine:
-    def __init__(self, tokenizer: JackTokenizer):
+    # 二元運算子 -> VM 算術指令 (* / 改呼叫 OS)
+    BINARY_OPS = {'+': 'add', '-': 'sub', '*': None, '/': None,
+                  '&': 'and', '|': 'or', '<': 'lt', '>': 'gt', '=': 'eq'}
+    UNARY_OPS = {'-': 'neg', '~': 'not'}
+    KEYWORD_CONSTANTS = frozenset({'true', 'false', 'null', 'this'})
+    # --string-pool: 每個 class 的字串常數初始化函數 (Class._initStrings)
+    STRING_POOL_INIT = '_initStrings'
+    
+    def __init__(self, tokenizer: JackTokenizer, string_pool: bool = False,
+                 optimize: bool = False, project: Optional[ProjectIndex] = None):
         self.tokenizer = tokenizer
         self.symbol_table = SymbolTable()
         self.vm_writer = VMWriter()
         self.class_name = ""
         self.label_counter = 0
+        self.errors: List[str] = []  # 診斷訊息，格式: 檔名:行:欄: error: 訊息
+        # --string-pool: 字串常數 -> 存放它的 static index (None 表示不啟用)
+        self.string_pool: Optional[Dict[str, int]] = {} if string_pool else None
+        self.optimize = optimize  # --optimize: 常數折疊與代數化簡
+        self.project = project    # --project: 全域的 ProjectIndex (None 表示逐檔編譯)
+        self.subroutine_kind = ""
+        # statement 關鍵字 -> 編譯方法 (取代逐一比較的 if/elif)
+        self._statement_table = {
+            'let': self.compile_let,
+            'if': self.compile_if,
+            'while': self.compile_while,
+            'do': self.compile_do,
+            'return': self.compile_return,
+        }
     
     def _get_label(self, prefix: str) -> str:
         label = f"{prefix}_{self.label_counter}"
@@ -218,45 +468,189 @@ class CompilationEngine:
     
     def _expect(self, expected):
         value = self.tokenizer.token_value()
-        if value != expected:
-            raise Exception(f"Expected {expected}, got {value}")
+        if value != expected or self.tokenizer.token_type() == TokenType.STRING_CONST:
+            self._fail(f"'{expected}'")
         self.tokenizer.advance()
     
-    def compile_class(self):
-        self._expect('class')
-        self.class_name = self.tokenizer.token_value()
+    def _expect_identifier(self, what: str = "identifier") -> str:
+        if self.tokenizer.token_type() != TokenType.IDENTIFIER:
+            self._fail(what)
+        name = self.tokenizer.token_value()
         self.tokenizer.advance()
-        self._expect('{')
+        return name
+    
+    def _expect_type(self, allow_void: bool = False) -> str:
+        value = self.tokenizer.token_value()
+        if not (self.tokenizer.token_type() == TokenType.IDENTIFIER
+                or (self.tokenizer.token_type() == TokenType.KEYWORD
+                    and (value in TYPE_KEYWORDS or (allow_void and value == 'void')))):
+            self._fail("type")
+        self.tokenizer.advance()
+        return value
+    
+    # ----- 診斷訊息與錯誤復原 -----
+    
+    def _fail(self, expected: str):
+        """丟出 JackSyntaxError，交給最近的復原點處理"""
+        token_type = self.tokenizer.token_type()
+        if token_type is None:
+            found = "end of file"
+        elif token_type == TokenType.STRING_CONST:
+            found = f'"{self.tokenizer.token_value()}"'
+        else:
+            found = f"'{self.tokenizer.token_value()}'"
+        raise JackSyntaxError(f"Expected {expected}, found {found}", *self.tokenizer.position())
+    
+    def _error(self, message: str, position=None):
+        """記錄一筆診斷訊息但不中斷分析 (例如未宣告的變數)"""
+        line, col = position or self.tokenizer.position()
+        self.errors.append(f"{self.tokenizer.source_name}:{line}:{col}: error: {message}")
+    
+    def _report(self, error: JackSyntaxError):
+        self._error(error.message, (error.line, error.col))
+    
+    def _synchronize(self, stop_tokens, start_idx: int, after_semicolon: bool = True):
+        """
+        panic mode：跳過 token 直到同步點。
+        - 跳過的 { ... } 區塊整個略過；跳完一個區塊且 after_semicolon 時視為 statement 結束
+        - after_semicolon 時遇到 ';' 會吃掉並停下
+        - 遇到 stop_tokens、多出來的 '}'、class 結尾或檔尾則停下不吃
+        若錯誤發生後完全沒有前進，至少跳過一個 token，避免無窮迴圈。
+        """
+        tokenizer = self.tokenizer
+        depth = 0
+        while tokenizer.has_more_tokens() and not tokenizer.at_class_end():
+            moved = tokenizer.current != start_idx
+            if tokenizer.token_type() in (TokenType.KEYWORD, TokenType.SYMBOL):
+                token = tokenizer.token_value()
+                if token in SUBROUTINE_KEYWORDS and token in stop_tokens and moved:
+                    return
+                if token == '{':
+                    depth += 1
+                elif token == '}':
+                    if depth == 0 and moved:
+                        return
+                    depth = max(depth - 1, 0)
+                    if depth == 0 and after_semicolon:
+                        tokenizer.advance()
+                        return
+                elif depth == 0:
+                    if after_semicolon and token == ';':
+                        tokenizer.advance()
+                        return
+                    if token in stop_tokens and moved:
+                        return
+            tokenizer.advance()
+    
+    def _compile_condition(self):
+        """
+        if / while 的 '(' expression ')'。條件裡的語法錯誤在這裡就地復原，後面的區塊照常編譯；
+        交給 statement 層級復原的話會連區塊一起跳過，多報錯誤又漏掉區塊裡的錯誤
+        """
+        open_idx = self.tokenizer.current
+        self._expect('(')
+        output = self.vm_writer.output
+        start = len(output)
+        try:
+            self.compile_expression()
+            self._expect(')')
+        except JackSyntaxError as error:
+            if not self._skip_condition(open_idx):
+                raise
+            self._report(error)
+            # 有錯誤時不會寫出 .vm，條件換成常數只是讓後面照常編譯
+            del output[start:]
+            self.vm_writer.write_push("constant", 0)
+    
+    def _skip_condition(self, open_idx: int) -> bool:
+        """
+        跳到和 tokens[open_idx] 的 '(' 對應的 ')' 之後 (已經讀過的括號也要算)。
+        遇到 '{' 視為少了 ')'，停在 '{'；先遇到 '}'、';' 或檔尾則回傳 False
+        """
+        tokenizer = self.tokenizer
+        depth = 0
+        for token_type, value in tokenizer.tokens[open_idx:tokenizer.current]:
+            if token_type == TokenType.SYMBOL and value in ('(', ')'):
+                depth += 1 if value == '(' else -1
+        while tokenizer.has_more_tokens() and not tokenizer.at_class_end():
+            token = tokenizer.token_value() if tokenizer.token_type() == TokenType.SYMBOL else None
+            if token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+                if depth <= 0:
+                    tokenizer.advance()
+                    return True
+            elif token == '{':
+                return True
+            elif token in ('}', ';'):
+                return False
+            tokenizer.advance()
+        return False
+    
+    def compile_class(self):
+        tokenizer = self.tokenizer
+        try:
+            self._expect('class')
+            self.class_name = self._expect_identifier("class name")
+            self._expect('{')
+        except JackSyntaxError as error:
+            self._report(error)
+            self._synchronize(MEMBER_SYNC, 0, after_semicolon=False)
         
-        # classVarDec*
-        while self.tokenizer.token_value() in ['static', 'field']:
-            self.compile_class_var_dec()
+        # classVarDec* subroutineDec*：每個成員各自復原，一個錯誤不會中斷整個 class
+        while tokenizer.has_more_tokens() and not tokenizer.at_class_end():
+            start_idx = tokenizer.current
+            is_subroutine = tokenizer.token_value() in SUBROUTINE_KEYWORDS
+            try:
+                if is_subroutine:
+                    self.compile_subroutine()
+                elif tokenizer.token_value() in CLASS_VAR_KEYWORDS:
+                    self.compile_class_var_dec()
+                else:
+                    self._fail("class member declaration")
+            except JackSyntaxError as error:
+                # subroutine 出錯就直接跳到下一個 subroutine，不停在本體裡的 ';'
+                self._report(error)
+                self._synchronize(MEMBER_SYNC, start_idx, after_semicolon=not is_subroutine)
         
-        # subroutineDec*
-        while self.tokenizer.token_value() in ['constructor', 'function', 'method']:
-            self.compile_subroutine()
+        if self.string_pool:
+            self._write_string_pool()
         
-        self._expect('}')
+        try:
+            self._expect('}')
+        except JackSyntaxError as error:
+            self._report(error)
+    
+    def _write_string_pool(self):
+        """Class._initStrings: 一次建好這個 class 用到的所有字串常數，存進各自的 static"""
+        self.vm_writer.write_function(f"{self.class_name}.{self.STRING_POOL_INIT}", 0)
+        for s, index in self.string_pool.items():
+            self.vm_writer.write_string(s)
+            self.vm_writer.write_pop("static", index)
+        self.vm_writer.write_push("constant", 0)
+        self.vm_writer.write_return()
     
     def compile_class_var_dec(self):
+        position = self.tokenizer.position()
         kind_str = self.tokenizer.token_value()
         kind = SymbolKind.STATIC if kind_str == 'static' else SymbolKind.FIELD
+        if kind == SymbolKind.STATIC and self.string_pool:
+            # 字串常數已經佔用了接在 static 變數後面的 index
+            self._error("Static variable declared after a string constant (--string-pool)", position)
         self.tokenizer.advance()
         
-        type_ = self.tokenizer.token_value()
-        self.tokenizer.advance()
+        type_ = self._expect_type()
         
         # varName
-        name = self.tokenizer.token_value()
+        name = self._expect_identifier("variable name")
         self.symbol_table.define(name, type_, kind)
-        self.tokenizer.advance()
         
         # (',' varName)*
         while self.tokenizer.token_value() == ',':
             self.tokenizer.advance()
-            name = self.tokenizer.token_value()
+            name = self._expect_identifier("variable name")
             self.symbol_table.define(name, type_, kind)
-            self.tokenizer.advance()
         
         self._expect(';')
     
@@ -264,13 +658,12 @@ class CompilationEngine:
         self.symbol_table.start_subroutine()
         
         subroutine_type = self.tokenizer.token_value()  # constructor|function|method
+        self.subroutine_kind = subroutine_type
         self.tokenizer.advance()
         
-        return_type = self.tokenizer.token_value()  # void|type
-        self.tokenizer.advance()
+        return_type = self._expect_type(allow_void=True)  # void|type
         
-        subroutine_name = self.tokenizer.token_value()
-        self.tokenizer.advance()
+        subroutine_name = self._expect_identifier("subroutine name")
         
         # method 需要將 this 加入參數
         if subroutine_type == 'method':
@@ -312,54 +705,57 @@ class CompilationEngine:
         if self.tokenizer.token_value() == ')':
             return
         
-        type_ = self.tokenizer.token_value()
-        self.tokenizer.advance()
-        name = self.tokenizer.token_value()
+        type_ = self._expect_type()
+        name = self._expect_identifier("parameter name")
         self.symbol_table.define(name, type_, SymbolKind.ARG)
-        self.tokenizer.advance()
         
         while self.tokenizer.token_value() == ',':
             self.tokenizer.advance()
-            type_ = self.tokenizer.token_value()
-            self.tokenizer.advance()
-            name = self.tokenizer.token_value()
+            type_ = self._expect_type()
+            name = self._expect_identifier("parameter name")
             self.symbol_table.define(name, type_, SymbolKind.ARG)
-            self.tokenizer.advance()
     
     def compile_var_dec(self):
         self._expect('var')
-        type_ = self.tokenizer.token_value()
-        self.tokenizer.advance()
+        type_ = self._expect_type()
         
-        name = self.tokenizer.token_value()
+        name = self._expect_identifier("variable name")
         self.symbol_table.define(name, type_, SymbolKind.VAR)
-        self.tokenizer.advance()
         
         while self.tokenizer.token_value() == ',':
             self.tokenizer.advance()
-            name = self.tokenizer.token_value()
+            name = self._expect_identifier("variable name")
             self.symbol_table.define(name, type_, SymbolKind.VAR)
-            self.tokenizer.advance()
         
         self._expect(';')
     
     def compile_statements(self):
-        while self.tokenizer.token_value() in ['let', 'if', 'while', 'do', 'return']:
-            if self.tokenizer.token_value() == 'let':
-                self.compile_let()
-            elif self.tokenizer.token_value() == 'if':
-                self.compile_if()
-            elif self.tokenizer.token_value() == 'while':
-                self.compile_while()
-            elif self.tokenizer.token_value() == 'do':
-                self.compile_do()
-            elif self.tokenizer.token_value() == 'return':
-                self.compile_return()
+        tokenizer = self.tokenizer
+        dispatch = self._statement_table.get
+        # statements 一定包在 { } 裡，遇到 '}' (或下一個 subroutine / 檔尾) 就結束
+        while tokenizer.has_more_tokens() and tokenizer.token_value() != '}':
+            value = tokenizer.token_value()
+            compile_statement = dispatch(value) if tokenizer.token_type() == TokenType.KEYWORD else None
+            if compile_statement is None and value in SUBROUTINE_KEYWORDS:
+                return
+            start_idx = tokenizer.current
+            try:
+                if compile_statement is None:
+                    self._fail("statement")
+                compile_statement()
+            except JackSyntaxError as error:
+                # panic mode：記錄錯誤，跳到下一個 statement 繼續編譯
+                self._report(error)
+                self._synchronize(STATEMENT_SYNC, start_idx)
+                if (compile_statement == self.compile_if and tokenizer.token_type() == TokenType.KEYWORD
+                        and tokenizer.token_value() == 'else'):
+                    # 上面只跳過了 then 區塊：else { ... } 也屬於同一個 if，一起跳過
+                    self._synchronize(STATEMENT_SYNC, tokenizer.current)
     
     def compile_let(self):
         self._expect('let')
-        var_name = self.tokenizer.token_value()
-        self.tokenizer.advance()
+        position = self.tokenizer.position()
+        var_name = self._expect_identifier("variable name")
         
         # 處理陣列
         is_array = False
@@ -370,7 +766,7 @@ class CompilationEngine:
             self._expect(']')
             
             # 計算陣列地址
-            self._push_variable(var_name)
+            self._push_variable(var_name, position)
             self.vm_writer.write_arithmetic("add")
         
         self._expect('=')
@@ -383,13 +779,13 @@ class CompilationEngine:
             self.vm_writer.write_push("temp", 0)
             self.vm_writer.write_pop("that", 0)
         else:
-            self._pop_variable(var_name)
+            self._pop_variable(var_name, position)
     
     def compile_if(self):
+        if self.optimize:
+            return self._compile_if_optimized()
         self._expect('if')
-        self._expect('(')
-        self.compile_expression()
-        self._expect(')')
+        self._compile_condition()
         
         label_true = self._get_label("IF_TRUE")
         label_false = self._get_label("IF_FALSE")
@@ -417,6 +813,8 @@ class CompilationEngine:
             self.vm_writer.write_label(label_false)
     
     def compile_while(self):
+        if self.optimize:
+            return self._compile_while_optimized()
         self._expect('while')
         
         label_start = self._get_label("WHILE_EXP")
@@ -424,9 +822,7 @@ class CompilationEngine:
         
         self.vm_writer.write_label(label_start)
         
-        self._expect('(')
-        self.compile_expression()
-        self._expect(')')
+        self._compile_condition()
         
         self.vm_writer.write_arithmetic("not")
         self.vm_writer.write_if(label_end)
@@ -440,6 +836,10 @@ class CompilationEngine:
     
     def compile_do(self):
         self._expect('do')
+        next_token = self.tokenizer.peek()
+        if (self.tokenizer.token_type() != TokenType.IDENTIFIER
+                or not next_token or next_token[1] not in ('.', '(')):
+            self._fail("subroutine call")
         self.compile_subroutine_call()
         self._expect(';')
         self.vm_writer.write_pop("temp", 0)  # 丟棄返回值
@@ -447,7 +847,9 @@ class CompilationEngine:
     def compile_return(self):
         self._expect('return')
         
-        if self.tokenizer.token_value() != ';':
+        # 少了 ';' 直接遇到 '}' 時回報 Expected ';'，不是 Expected expression
+        if (self.tokenizer.token_type() != TokenType.SYMBOL
+                or self.tokenizer.token_value() not in (';', '}')):
             self.compile_expression()
         else:
             self.vm_writer.write_push("constant", 0)
@@ -456,16 +858,20 @@ class CompilationEngine:
         self.vm_writer.write_return()
     
     def compile_expression(self):
+        # 記下左右運算元在輸出中的起點，--optimize 時用來折疊
+        output = self.vm_writer.output
+        lhs_start = len(output)
         self.compile_term()
         
-        ops = {'+': 'add', '-': 'sub', '*': None, '/': None,
-               '&': 'and', '|': 'or', '<': 'lt', '>': 'gt', '=': 'eq'}
-        
+        ops = self.BINARY_OPS
         while self.tokenizer.token_value() in ops:
             op = self.tokenizer.token_value()
             self.tokenizer.advance()
+            rhs_start = len(output)
             self.compile_term()
             
+            if self.optimize and self._fold_binary_op(op, lhs_start, rhs_start):
+                continue
             if op == '*':
                 self.vm_writer.write_call("Math.multiply", 2)
             elif op == '/':
@@ -484,15 +890,14 @@ class CompilationEngine:
         
         # stringConstant
         elif token_type == TokenType.STRING_CONST:
-            self.vm_writer.write_push("constant", len(value))
-            self.vm_writer.write_call("String.new", 1)
-            for char in value:
-                self.vm_writer.write_push("constant", ord(char))
-                self.vm_writer.write_call("String.appendChar", 2)
+            if self.string_pool is None:
+                self.vm_writer.write_string(value)
+            else:
+                self._push_pooled_string(value)
             self.tokenizer.advance()
         
         # keywordConstant
-        elif value in ['true', 'false', 'null', 'this']:
+        elif value in self.KEYWORD_CONSTANTS:
             if value == 'true':
                 self.vm_writer.write_push("constant", 0)
                 self.vm_writer.write_arithmetic("not")
@@ -509,18 +914,18 @@ class CompilationEngine:
             self._expect(')')
         
         # unaryOp term
-        elif value in ['-', '~']:
-            op = value
+        elif value in self.UNARY_OPS:
             self.tokenizer.advance()
+            start = len(self.vm_writer.output)
             self.compile_term()
-            if op == '-':
-                self.vm_writer.write_arithmetic("neg")
-            else:
-                self.vm_writer.write_arithmetic("not")
+            command = self.UNARY_OPS[value]
+            if not (self.optimize and self._fold_unary_op(command, start)):
+                self.vm_writer.write_arithmetic(command)
         
         # varName | varName[expression] | subroutineCall
         elif token_type == TokenType.IDENTIFIER:
             next_token = self.tokenizer.peek()
+            position = self.tokenizer.position()
             
             # 陣列存取
             if next_token and next_token[1] == '[':
@@ -529,7 +934,7 @@ class CompilationEngine:
                 self._expect('[')
                 self.compile_expression()
                 self._expect(']')
-                self._push_variable(var_name)
+                self._push_variable(var_name, position)
                 self.vm_writer.write_arithmetic("add")
                 self.vm_writer.write_pop("pointer", 1)
                 self.vm_writer.write_push("that", 0)
@@ -540,40 +945,232 @@ class CompilationEngine:
             
             # 變數
             else:
-                self._push_variable(value)
+                self._push_variable(value, position)
                 self.tokenizer.advance()
+        
+        else:
+            self._fail("expression")
+    
+    def _fold_binary_op(self, op: str, lhs_start: int, rhs_start: int) -> bool:
+        """
+        output[lhs_start:rhs_start] 是左運算元、output[rhs_start:] 是右運算元。
+        能化簡時直接改寫 output 並回傳 True，否則回傳 False 由呼叫端照常輸出運算指令。
+        """
+        output = self.vm_writer.output
+        a = constant_value(output, lhs_start, rhs_start)
+        b = constant_value(output, rhs_start)
+        if a is not None and b is not None:
+            value = fold_binary(op, a, b)
+            if value is None:
+                return False
+            output[lhs_start:] = constant_lines(value)
+            return True
+        
+        # x + 0, x * 1, ... -> x；0 + x, 1 * x, ... -> x
+        if b is not None and RIGHT_IDENTITY.get(op) == b:
+            del output[rhs_start:]
+            return True
+        if a is not None and LEFT_IDENTITY.get(op) == a:
+            del output[lhs_start:rhs_start]
+            return True
+        
+        # x * 2^k -> 重複 k 次 x + x，不呼叫 Math.multiply
+        if op == '*':
+            if b is not None and b > 1 and b & (b - 1) == 0:
+                del output[rhs_start:]
+                self._write_doubling(lhs_start, b.bit_length() - 1)
+                return True
+            if a is not None and a > 1 and a & (a - 1) == 0:
+                del output[lhs_start:rhs_start]
+                self._write_doubling(lhs_start, a.bit_length() - 1)
+                return True
+        return False
+    
+    def _write_doubling(self, start: int, times: int):
+        output = self.vm_writer.output
+        if len(output) - start == 1 and output[start].startswith('push '):
+            # 運算元只是一個 push (沒有副作用)：第一次直接再 push 一次
+            output.extend((output[start], 'add'))
+            times -= 1
+        for _ in range(times):
+            output.extend(DOUBLE_TOP)
+    
+    def _compile_if_optimized(self):
+        """
+        if (cond) {A} else {B}  ->  cond; [not]; if-goto IF_ELSE; A; goto IF_END; label IF_ELSE; B; label IF_END
+        省掉 if-goto IF_TRUE; goto IF_FALSE 的雙重跳躍；沒有 else 或 A 以 return 結尾時不輸出 goto IF_END。
+        條件是常數 true / false 時不輸出判斷，只保留會執行到的那個分支。
+        (和 Jack 規格一樣假設條件是 boolean：true = -1、false = 0)
+        """
+        output = self.vm_writer.output
+        self._expect('if')
+        cond_start = len(output)
+        self._compile_condition()
+        
+        condition = self._constant_condition(cond_start)
+        label_else = self._get_label("IF_ELSE")
+        if condition is None:
+            self._write_jump_if_false(label_else)
+        else:
+            del output[cond_start:]
+        
+        then_start = len(output)
+        self._expect('{')
+        self.compile_statements()
+        self._expect('}')
+        if condition == 0:
+            del output[then_start:]
+        
+        if self.tokenizer.token_value() != 'else':
+            if condition is None:
+                self.vm_writer.write_label(label_else)
+            return
+        
+        self.tokenizer.advance()
+        label_end = self._get_label("IF_END")
+        if condition is None:
+            if len(output) == then_start or output[-1] != 'return':
+                self.vm_writer.write_goto(label_end)
+            self.vm_writer.write_label(label_else)
+        else_start = len(output)
+        self._expect('{')
+        self.compile_statements()
+        self._expect('}')
+        if condition is None:
+            self.vm_writer.write_label(label_end)
+        elif condition != 0:
+            del output[else_start:]
+    
+    def _compile_while_optimized(self):
+        """
+        條件放到迴圈底部，每一圈少執行 not 與 goto:
+            goto WHILE_COND; label WHILE_BODY; body; label WHILE_COND; cond; if-goto WHILE_BODY
+        條件先編譯再從輸出搬到 body 後面。while (true) 只剩 goto WHILE_BODY；while (false) 整個省略。
+        """
+        output = self.vm_writer.output
+        self._expect('while')
+        cond_start = len(output)
+        self._compile_condition()
+        
+        condition = self._constant_condition(cond_start)
+        condition_lines = output[cond_start:]
+        del output[cond_start:]
+        label_body = self._get_label("WHILE_BODY")
+        label_cond = self._get_label("WHILE_COND")
+        if condition is None:
+            self.vm_writer.write_goto(label_cond)
+        self.vm_writer.write_label(label_body)
+        
+        self._expect('{')
+        self.compile_statements()
+        self._expect('}')
+        
+        if condition is None:
+            self.vm_writer.write_label(label_cond)
+            output.extend(condition_lines)
+            self._write_jump_if_true(label_body)
+        elif condition != 0:
+            self.vm_writer.write_goto(label_body)
+        else:
+            del output[cond_start:]
+    
+    def _constant_condition(self, start: int) -> Optional[int]:
+        """條件是常數 true (-1) / false (0) 時回傳它的值；其他常數照常輸出判斷"""
+        value = constant_value(self.vm_writer.output, start)
+        return value if value in (0, -1) else None
+    
+    def _write_jump_if_false(self, label: str):
+        # 條件在輸出尾端：~x 為假 <=> x 為真；x = 0 為假 <=> x 不為 0，都不需要 not
+        output = self.vm_writer.output
+        if output[-1] == 'not':
+            output.pop()
+        elif output[-2:] == ['push constant 0', 'eq']:
+            del output[-2:]
+        else:
+            output.append('not')
+        self.vm_writer.write_if(label)
+    
+    def _write_jump_if_true(self, label: str):
+        # ~(x = 0) 為真 <=> x 不為 0
+        output = self.vm_writer.output
+        if output[-3:] == ['push constant 0', 'eq', 'not']:
+            del output[-3:]
+        self.vm_writer.write_if(label)
+    
+    def _fold_unary_op(self, command: str, start: int) -> bool:
+        output = self.vm_writer.output
+        value = constant_value(output, start)
+        if value is not None:
+            output[start:] = constant_lines(to_int16(-value if command == 'neg' else ~value))
+            return True
+        # ~~x、--x 互相抵銷
+        if output[-1] == command and len(output) > start:
+            output.pop()
+            return True
+        return False
     
     def compile_subroutine_call(self):
+        position = self.tokenizer.position()
         name = self.tokenizer.token_value()
         self.tokenizer.advance()
         
         n_args = 0
         
+        # call_kind: 'function' = Class.f()、'method' = obj.m()、'implicit' = m() (this.m())
         # method call: object.method() 或 method()
         if self.tokenizer.token_value() == '.':
             self.tokenizer.advance()
-            method_name = self.tokenizer.token_value()
-            self.tokenizer.advance()
+            method_name = self._expect_identifier("subroutine name")
             
             # 檢查是否為變數（物件）
             if self.symbol_table.kind_of(name) is not None:
                 self._push_variable(name)
                 n_args = 1
                 class_name = self.symbol_table.type_of(name)
-                full_name = f"{class_name}.{method_name}"
+                call_kind = 'method'
             else:
-                full_name = f"{name}.{method_name}"
+                class_name = name
+                call_kind = 'function'
         else:
-            # 當前類別的 method
-            self.vm_writer.write_push("pointer", 0)
-            n_args = 1
-            full_name = f"{self.class_name}.{name}"
+            class_name, method_name = self.class_name, name
+            callee = self.project.lookup(class_name, method_name) if self.project else None
+            if callee and callee[0] != 'method':
+                # --project 已知是同類別的 function / constructor：直接呼叫，不 push this
+                call_kind = 'function'
+            else:
+                # 當前類別的 method
+                self.vm_writer.write_push("pointer", 0)
+                n_args = 1
+                call_kind = 'implicit'
         
         self._expect('(')
         n_args += self.compile_expression_list()
         self._expect(')')
         
-        self.vm_writer.write_call(full_name, n_args)
+        if self.project:
+            n_params = n_args if call_kind == 'function' else n_args - 1
+            self._check_call(class_name, method_name, call_kind, n_params, position)
+        self.vm_writer.write_call(f"{class_name}.{method_name}", n_args)
+    
+    def _check_call(self, class_name: str, sub_name: str, call_kind: str, n_args: int, position):
+        """--project: 用全域索引檢查被呼叫的 subroutine 是否存在、種類與參數數量是否相符"""
+        full_name = f"{class_name}.{sub_name}"
+        if call_kind == 'function' and not self.project.has_class(class_name):
+            self._error(f"Unknown class or variable '{class_name}'", position)
+            return
+        callee = self.project.lookup(class_name, sub_name)
+        if callee is None:
+            self._error(f"Undefined subroutine '{full_name}'", position)
+            return
+        kind, n_params = callee
+        if call_kind == 'function' and kind == 'method':
+            self._error(f"Method '{full_name}' called without an object", position)
+        elif call_kind == 'method' and kind != 'method':
+            self._error(f"{kind.capitalize()} '{full_name}' called as a method", position)
+        elif call_kind == 'implicit' and self.subroutine_kind == 'function':
+            self._error(f"Method '{full_name}' called from a function", position)
+        if n_args != n_params:
+            self._error(f"'{full_name}' expects {n_params} argument(s), got {n_args}", position)
     
     def compile_expression_list(self) -> int:
         n_args = 0
@@ -589,74 +1186,332 @@ class CompilationEngine:
         
         return n_args
     
-    def _push_variable(self, name: str):
+    def _push_pooled_string(self, s: str):
+        """
+        String pool: 同一個字串常數只在 Class._initStrings 建構一次，之後直接 push static。
+        static 初值為 0，第一次用到時才呼叫初始化函數 (此時 OS 已經初始化完成)。
+        """
+        index = self.string_pool.get(s)
+        if index is None:
+            index = self.symbol_table.var_count(SymbolKind.STATIC) + len(self.string_pool)
+            self.string_pool[s] = index
+        ready = self._get_label("STRING_READY")
+        self.vm_writer.write_push("static", index)
+        self.vm_writer.write_if(ready)
+        self.vm_writer.write_call(f"{self.class_name}.{self.STRING_POOL_INIT}", 0)
+        self.vm_writer.write_pop("temp", 0)
+        self.vm_writer.write_label(ready)
+        self.vm_writer.write_push("static", index)
+    
+    def _push_variable(self, name: str, position=None):
         kind = self.symbol_table.kind_of(name)
+        if kind is None:
+            self._error(f"Undefined variable '{name}'", position)
+            return
         index = self.symbol_table.index_of(name)
-        
-        segment_map = {
-            SymbolKind.STATIC: "static",
-            SymbolKind.FIELD: "this",
-            SymbolKind.ARG: "argument",
-            SymbolKind.VAR: "local"
-        }
-        
-        self.vm_writer.write_push(segment_map[kind], index)
+        self.vm_writer.write_push(SEGMENT_MAP[kind], index)
     
-    def _pop_variable(self, name: str):
+    def _pop_variable(self, name: str, position=None):
         kind = self.symbol_table.kind_of(name)
+        if kind is None:
+            self._error(f"Undefined variable '{name}'", position)
+            return
         index = self.symbol_table.index_of(name)
-        
-        segment_map = {
-            SymbolKind.STATIC: "static",
-            SymbolKind.FIELD: "this",
-            SymbolKind.ARG: "argument",
-            SymbolKind.VAR: "local"
+        self.vm_writer.write_pop(SEGMENT_MAP[kind], index)
+
+# ============= Build Cache =============
+
+# 編譯器輸出有變動時要改版本號，讓舊的快取全部失效
+COMPILER_VERSION = '9.4'
+CACHE_FILE_NAME = '.jackcache.json'
+
+Stamp = List[int]
+
+def file_stamp(path: str) -> Stamp:
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+def source_digest(content: bytes, options: str) -> str:
+    """快取的 key：原始碼內容 + 編譯器版本 + 編譯選項"""
+    h = hashlib.sha1(f"{COMPILER_VERSION}|{options}|".encode('utf-8'))
+    h.update(content)
+    return h.hexdigest()
+
+class BuildCache:
+    """
+    存在 .jack 檔旁邊的 .jackcache.json，記錄每個 .jack 上次成功編譯時的
+    key 以及原始檔 / 輸出檔的 (mtime, size)。
+    - 原始檔的 mtime 和 size 都沒變、輸出檔也還在：只需要兩次 stat 就能跳過
+    - mtime 變了但內容一樣 (例如 touch、git checkout)：重新算 hash 後跳過
+    """
+    
+    def __init__(self, source_dir: str, options: str):
+        self.path = os.path.join(source_dir, CACHE_FILE_NAME)
+        self.options = options
+        self.entries: Dict[str, dict] = {}
+        self.dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == COMPILER_VERSION:
+                self.entries = data.get('entries', {})
+        except (OSError, ValueError):
+            pass  # 沒有快取或快取損壞：全部重新編譯
+    
+    def is_fresh(self, name: str, source_paths: List[str], output_paths: List[str]) -> bool:
+        """
+        name 的輸出是否還是最新的。source_paths 的內容全部參與 key 的計算
+        (一般模式只有自己；--project 是整個目錄)。
+        """
+        entry = self.entries.get(name)
+        if entry is None or entry['options'] != self.options:
+            return False
+        try:
+            if [file_stamp(path) for path in output_paths] != entry['outputs']:
+                return False
+            sources = [file_stamp(path) for path in source_paths]
+        except OSError:
+            return False
+        if sources == entry['sources']:
+            return True
+        if self.key(source_paths) != entry['key']:
+            return False
+        entry['sources'] = sources
+        self.dirty = True
+        return True
+    
+    def key(self, source_paths: List[str]) -> str:
+        h = hashlib.sha1()
+        for path in source_paths:
+            with open(path, 'rb') as f:
+                h.update(source_digest(f.read(), self.options).encode('ascii'))
+        return h.hexdigest()
+    
+    def snapshot(self, source_paths: List[str]) -> Tuple[List[Stamp], str]:
+        """編譯前先記下原始檔的狀態；編譯途中檔案被改過的話，下次會因為 mtime 不同而重新檢查"""
+        return [file_stamp(path) for path in source_paths], self.key(source_paths)
+    
+    def update(self, name: str, snapshot: Tuple[List[Stamp], str], output_paths: List[str]):
+        sources, key = snapshot
+        self.entries[name] = {
+            'options': self.options,
+            'key': key,
+            'sources': sources,
+            'outputs': [file_stamp(path) for path in output_paths],
         }
-        
-        self.vm_writer.write_pop(segment_map[kind], index)
+        self.dirty = True
+    
+    def discard(self, name: str):
+        if self.entries.pop(name, None) is not None:
+            self.dirty = True
+    
+    def save(self):
+        if self.dirty:
+            write_file_atomic(self.path, json.dumps(
+                {'version': COMPILER_VERSION, 'entries': self.entries}, indent=1, sort_keys=True))
+            self.dirty = False
 
 # ============= Main Compiler =============
 
-def compile_file(jack_file: str):
-    """編譯單一 .jack 檔案"""
+def write_file_atomic(path: str, text: str):
+    """先寫到暫存檔再 os.replace，不會留下寫到一半的檔案"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def compile_file(jack_file: str, string_pool: bool = False,
+                 optimize: bool = False) -> Tuple[str, float, List[str]]:
+    """
+    編譯單一 .jack 檔案，回傳 (檔名, 花費秒數, 診斷訊息)。
+    有錯誤時不寫出 .vm，並刪掉上次編譯留下的 .vm，以免後續工具執行舊的程式。
+    """
+    start = time.perf_counter()
     with open(jack_file, 'r') as f:
         content = f.read()
     
-    tokenizer = JackTokenizer(content)
-    engine = CompilationEngine(tokenizer)
+    tokenizer = JackTokenizer(content, os.path.basename(jack_file))
+    engine = CompilationEngine(tokenizer, string_pool, optimize)
     engine.compile_class()
     
     vm_file = jack_file.replace('.jack', '.vm')
-    with open(vm_file, 'w') as f:
-        f.write(engine.vm_writer.get_output())
+    if engine.errors:
+        if os.path.exists(vm_file):
+            os.remove(vm_file)
+    else:
+        write_file_atomic(vm_file, engine.vm_writer.get_output())
+        print(f"Compiled: {jack_file} -> {vm_file}")
+    return os.path.basename(jack_file), time.perf_counter() - start, engine.errors
+
+def compile_files(jack_files: List[str], jobs: int = 1, string_pool: bool = False,
+                  optimize: bool = False) -> List[Tuple[str, float, List[str]]]:
+    """
+    編譯多個檔案；jobs > 1 時用 process pool 平行處理 (各個類別互相獨立)，
+    每個 worker 自己寫出自己的 .vm，回傳每個檔案的結果。
+    """
+    if jobs > 1 and len(jack_files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(compile_file, f, string_pool, optimize) for f in jack_files]
+            return [future.result() for future in futures]
+    return [compile_file(f, string_pool, optimize) for f in jack_files]
+
+def compile_files_cached(jack_files: List[str], cache: Optional[BuildCache], jobs: int = 1,
+                         string_pool: bool = False,
+                         optimize: bool = False) -> Tuple[List[Tuple[str, float, List[str]]], int]:
+    """
+    先用 BuildCache 挑出內容或選項有變的檔案，只編譯這些；
+    回傳 (編譯結果, 跳過的檔案數)。cache 為 None 時全部重新編譯。
+    """
+    if cache is None:
+        return compile_files(jack_files, jobs, string_pool, optimize), 0
     
-    print(f"Compiled: {jack_file} -> {vm_file}")
+    stale = [f for f in jack_files
+             if not cache.is_fresh(os.path.basename(f), [f], [f.replace('.jack', '.vm')])]
+    snapshots = [cache.snapshot([f]) for f in stale]
+    results = compile_files(stale, jobs, string_pool, optimize)
+    for jack_file, snapshot, (name, _, errors) in zip(stale, snapshots, results):
+        if errors:
+            cache.discard(name)
+        else:
+            cache.update(name, snapshot, [jack_file.replace('.jack', '.vm')])
+    cache.save()
+    return results, len(jack_files) - len(stale)
+
+def report(results: List[Tuple[str, float, List[str]]]) -> int:
+    """錯誤復原後一次列出全部診斷訊息，回傳錯誤數量"""
+    error_count = 0
+    for _, _, errors in results:
+        for message in errors:
+            print(message)
+        error_count += len(errors)
+    return error_count
+
+def print_timings(results: List[Tuple[str, float, List[str]]], total: float, jobs: int):
+    print("\nTiming:")
+    for name, elapsed, _ in sorted(results, key=lambda r: -r[1]):
+        print(f"  {name:<24}{elapsed * 1000:8.2f} ms")
+    print(f"Total: {len(results)} files in {total * 1000:.2f} ms (jobs={jobs})")
+
+def compile_project(directory: str, string_pool: bool = False, optimize: bool = False,
+                    cache: Optional[BuildCache] = None) -> int:
+    """
+    --project: 整個目錄一起編譯。先建立 ProjectIndex 檢查跨類別的呼叫，
+    全部編譯完後再移除從 Main.main / Sys.init 走不到的 subroutine，最後才寫出 .vm。
+    回傳錯誤數量 (有錯誤時不寫出任何 .vm，並刪掉上次編譯的 .vm)。
+    每個類別的輸出都和其他類別有關，所以快取以整個目錄為單位：任何一個檔案變了就全部重編。
+    """
+    jack_files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.jack'))
+    vm_files = [f.replace('.jack', '.vm') for f in jack_files]
+    if cache is not None:
+        if cache.is_fresh('--project', jack_files, vm_files):
+            print(f"Up to date: {len(jack_files)} file(s)")
+            return 0
+        snapshot = cache.snapshot(jack_files)
+    project = ProjectIndex(jack_files)
+    
+    outputs: Dict[str, List[str]] = {}
+    error_count = 0
+    for jack_file in jack_files:
+        engine = CompilationEngine(project.tokenizers[jack_file], string_pool, optimize, project)
+        engine.compile_class()
+        for message in engine.errors:
+            print(message)
+        error_count += len(engine.errors)
+        outputs[jack_file] = engine.vm_writer.output
+    if error_count:
+        # 上次編譯留下的 .vm 也刪掉，以免後續工具執行舊的程式
+        for path in vm_files:
+            if os.path.exists(path):
+                os.remove(path)
+        if cache is not None:
+            cache.discard('--project')
+            cache.save()
+        return error_count
+    
+    # Dead subroutine elimination：沒有進入點 (例如只是函式庫) 時全部保留
+    blocks = {jack_file: function_blocks(lines) for jack_file, lines in outputs.items()}
+    reachable = reachable_functions([block for class_blocks in blocks.values() for block in class_blocks])
+    removed: List[Tuple[str, int]] = []
+    for jack_file, class_blocks in blocks.items():
+        if reachable:
+            removed += [(name, len(body)) for name, body in class_blocks if name not in reachable]
+            class_blocks = [(name, body) for name, body in class_blocks if name in reachable]
+        vm_file = jack_file.replace('.jack', '.vm')
+        write_file_atomic(vm_file, '\n'.join(line for _, body in class_blocks for line in body))
+        print(f"Compiled: {jack_file} -> {vm_file}")
+    
+    if removed:
+        print(f"\nRemoved {len(removed)} unreachable subroutine(s), "
+              f"{sum(n for _, n in removed)} VM command(s):")
+        for name, n in removed:
+            print(f"  {name} ({n})")
+    if cache is not None:
+        cache.update('--project', snapshot, vm_files)
+        cache.save()
+    return 0
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python JackCompiler.py <file.jack | directory>")
-        sys.exit(1)
+    arg_parser = argparse.ArgumentParser(
+        usage="python JackCompiler.py [-O] [--string-pool] [--project] [--jobs N] [--no-cache] <file.jack | directory>")
+    arg_parser.add_argument('path')
+    arg_parser.add_argument('--string-pool', action='store_true',
+                            help="相同的字串常數只建構一次，存在 static 中重複使用")
+    arg_parser.add_argument('-O', '--optimize', action='store_true',
+                            help="常數折疊、代數化簡、乘以 2 的次方改成加法、if/while 分支化簡")
+    arg_parser.add_argument('--project', action='store_true',
+                            help="整個目錄一起編譯：檢查跨類別呼叫、移除用不到的 subroutine")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help="平行編譯的 process 數 (0 = CPU 核心數；--project 時不使用)")
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help=f"不使用 {CACHE_FILE_NAME} 編譯快取，全部重新編譯")
+    args = arg_parser.parse_args()
+    
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    path = args.path
+    error_count = 0
+    options = f"string_pool={args.string_pool},optimize={args.optimize},project={args.project}"
     
-    path = sys.argv[1]
+    if args.project and not os.path.isdir(path):
+        print("Error: --project requires a directory")
+        sys.exit(1)
     
     if os.path.isfile(path):
         if path.endswith('.jack'):
-            compile_file(path)
+            cache = None if args.no_cache else BuildCache(os.path.dirname(path), options)
+            results, skipped = compile_files_cached([path], cache, string_pool=args.string_pool,
+                                                    optimize=args.optimize)
+            error_count += report(results)
+            if skipped:
+                print(f"Up to date: {path}")
         else:
             print("Error: File must have .jack extension")
     
     elif os.path.isdir(path):
-        jack_files = [f for f in os.listdir(path) if f.endswith('.jack')]
+        jack_files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith('.jack')]
         if not jack_files:
             print(f"No .jack files found in {path}")
             sys.exit(1)
         
-        for jack_file in jack_files:
-            compile_file(os.path.join(path, jack_file))
+        cache = None if args.no_cache else BuildCache(path, options)
+        if args.project:
+            error_count += compile_project(path, args.string_pool, args.optimize, cache)
+        else:
+            start = time.perf_counter()
+            results, skipped = compile_files_cached(jack_files, cache, jobs, args.string_pool,
+                                                    args.optimize)
+            error_count += report(results)
+            if skipped:
+                print(f"Up to date: {skipped} file(s)")
+            if results:
+                print_timings(results, time.perf_counter() - start, jobs)
     
     else:
         print(f"Error: {path} is not a valid file or directory")
         sys.exit(1)
+    
+    if error_count:
+        print(f"\n{error_count} error(s)")
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
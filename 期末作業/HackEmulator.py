@@ -0,0 +1,649 @@
+#!/usr/bin/env python3
+"""
+Hack Emulator - Nand2Tetris 第 5 章的電腦 (CPU + ROM + RAM) 模擬器
+執行 .hack (或直接組譯 .asm) 程式，可以用 --profile 統計每個 function 執行了多少指令。
+--jit 把 ROM 切成 basic block，每個 block 產生一個 Python 函數 (compile()) 並快取，
+省掉逐個指令的解碼與分派。
+不需要視窗：螢幕 (SCREEN) 可以存成 PNG / PBM，鍵盤 (KBD) 由腳本依 cycle 輸入，
+方便跑 Pong 這類圖形程式並保存畫面做回歸比對。
+
+function 的範圍來自 Assembler 的 SymbolTable：
+- 名稱有 '.' 但沒有 '$' 的標籤 (Main.main、ball.new ...) 是 function 的進入點，
+  到下一個進入點之前的指令都屬於這個 function
+  (LOOP_math.multiply 這種「前綴_function 名稱」的輔助標籤併入該 function)
+- 跳到進入點算一次 call；跳到 Foo$ret.N (或官方工具的 RET_ADDRESS_CALLn) 算一次 return
+"""
+
+import os
+import re
+import sys
+import zlib
+import struct
+import argparse
+import importlib.util
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np  # 選用：有的話 Screen.pixels() 回傳 NumPy 陣列，轉換也比較快
+except ImportError:
+    np = None
+
+TOOLCHAIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name: str, relative_path: str):
+    """用檔案路徑載入各章的程式 (它們不是 package，不能直接 import)"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(TOOLCHAIN_DIR, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+hack_assembler = load_module('assembler', os.path.join('6', 'assembler.py'))
+
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+SCREEN_WIDTH = 512
+SCREEN_HEIGHT = 256
+
+RETURN_LABEL = re.compile(r'.*\$ret\.\d+|RET_ADDRESS_CALL\d+')
+
+
+# ============= CPU =============
+
+class HackError(Exception):
+    """程式執行時的錯誤 (M 的位址超出 RAM 範圍)"""
+
+
+# ALU：comp 欄位的 6 個控制位元 (zx nx zy ny f no) -> 計算函數 (x = D, y = A 或 M)
+ALU_FUNCTIONS = {
+    0b101010: lambda x, y: 0,
+    0b111111: lambda x, y: 1,
+    0b111010: lambda x, y: 0xFFFF,
+    0b001100: lambda x, y: x,
+    0b110000: lambda x, y: y,
+    0b001101: lambda x, y: x ^ 0xFFFF,
+    0b110001: lambda x, y: y ^ 0xFFFF,
+    0b001111: lambda x, y: -x & 0xFFFF,
+    0b110011: lambda x, y: -y & 0xFFFF,
+    0b011111: lambda x, y: (x + 1) & 0xFFFF,
+    0b110111: lambda x, y: (y + 1) & 0xFFFF,
+    0b001110: lambda x, y: (x - 1) & 0xFFFF,
+    0b110010: lambda x, y: (y - 1) & 0xFFFF,
+    0b000010: lambda x, y: (x + y) & 0xFFFF,
+    0b010011: lambda x, y: (x - y) & 0xFFFF,
+    0b000111: lambda x, y: (y - x) & 0xFFFF,
+    0b000000: lambda x, y: x & y,
+    0b010101: lambda x, y: x | y,
+}
+
+
+def alu(bits: int):
+    """表上沒有的控制位元組合：照 ALU 的電路一步一步算"""
+    def compute(x, y):
+        if bits & 0b100000: x = 0
+        if bits & 0b010000: x ^= 0xFFFF
+        if bits & 0b001000: y = 0
+        if bits & 0b000100: y ^= 0xFFFF
+        out = (x + y) & 0xFFFF if bits & 0b000010 else x & y
+        return out ^ 0xFFFF if bits & 0b000001 else out
+    return compute
+
+
+# jump 欄位 (j1 j2 j3) -> 結果 < 0、= 0、> 0 時是否跳躍
+JUMP_CONDITIONS = [(bool(j & 4), bool(j & 2), bool(j & 1)) for j in range(8)]
+
+# C 指令解碼結果：(計算函數, 讀 M?, 寫 A?, 寫 D?, 寫 M?, jump 欄位)
+Decoded = Tuple[object, bool, bool, bool, bool, int]
+
+
+def decode(word: int) -> Optional[Decoded]:
+    """A 指令回傳 None"""
+    if not word & 0x8000:
+        return None
+    comp = (word >> 6) & 0x3F
+    function = ALU_FUNCTIONS.get(comp) or alu(comp)
+    return (function, uses_m(word), bool(word & 0x20), bool(word & 0x10), bool(word & 0x08),
+            word & 7)
+
+
+def uses_m(word: int) -> bool:
+    """
+    C 指令是否讀 M：a 位元是 1，而且 comp 真的用到 y (zy = 0)。
+    zy = 1 的 comp (0、D、D+1 ...) 不管 y，這時不讀 RAM，A 超出範圍也不算錯
+    """
+    return bool(word & 0x1000) and not word & 0x0200
+
+
+class HackComputer:
+    """ROM (程式)、RAM 和 CPU 的 A、D、PC 暫存器"""
+
+    def __init__(self, rom: List[int]):
+        self.rom = rom
+        self.decoded = [decode(word) for word in rom]
+        self.ram = [0] * RAM_SIZE
+        self.a = self.d = self.pc = 0
+        self.cycles = 0
+        self.halted = False
+        self.blocks: Dict[int, Tuple[object, int, bool]] = {}  # --jit: 起點 PC -> compile_block 的結果
+
+    def reset(self):
+        self.a = self.d = self.pc = 0
+        self.halted = False
+
+    def run(self, max_cycles: int, profiler: Optional['ExecutionProfiler'] = None) -> int:
+        """
+        執行最多 max_cycles 個指令，回傳實際執行的數量。
+        PC 超出 ROM，或遇到跳回自己的無窮迴圈 (@X / 0;JMP，程式結束的慣用寫法) 時停止。
+        """
+        rom, decoded, ram = self.rom, self.decoded, self.ram
+        a, d, pc = self.a, self.d, self.pc
+        rom_size = len(rom)
+        counts = profiler.pc_counts if profiler else None
+        executed = 0
+        try:
+            while executed < max_cycles:
+                if pc >= rom_size:
+                    self.halted = True
+                    break
+                executed += 1
+                if counts is not None:
+                    counts[pc] += 1
+                instruction = decoded[pc]
+                if instruction is None:
+                    a = rom[pc]
+                    pc += 1
+                    continue
+                function, use_m, dest_a, dest_d, dest_m, jump = instruction
+                out = function(d, ram[a] if use_m else a)
+                if dest_m:
+                    ram[a] = out
+                if jump:
+                    negative, zero, positive = JUMP_CONDITIONS[jump]
+                    if (zero if out == 0 else negative if out & 0x8000 else positive):
+                        # PC 載入的是這個時脈開始時 A 暫存器的值 (dest 的 A 在時脈結束才寫入)
+                        target = a
+                        if dest_a: a = out
+                        if dest_d: d = out
+                        if jump == 7 and target == pc - 1 and rom[target] == target:
+                            self.halted = True
+                            pc = target
+                            break
+                        if profiler:
+                            profiler.on_jump(pc, target, self.cycles + executed)
+                        pc = target
+                        continue
+                if dest_a: a = out
+                if dest_d: d = out
+                pc += 1
+        except IndexError:
+            # 只有 ram[a] 會超出範圍 (A >= 32768)：停在這個指令上，它不算執行過
+            self.a, self.d, self.pc = a, d, pc
+            self.cycles += executed - 1
+            raise HackError(f"PC={pc}: RAM address {a} is out of range (0..{RAM_SIZE - 1})") from None
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        return executed
+
+    def run_jit(self, max_cycles: int) -> int:
+        """
+        和 run() 相同的結果，但以 block 為單位執行 JIT 產生的函數 (compile_block)。
+        剩下的指令數可能不夠跑完下一個 block 時，改用 run() 逐個指令執行到剛好 max_cycles。
+        """
+        blocks, ram = self.blocks, self.ram
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        while True:
+            block = blocks.get(pc)
+            if block is None:
+                block = blocks[pc] = compile_block(self.rom, pc)
+            function, length, halts = block
+            if function is None or executed + length > max_cycles:
+                break
+            pc, a, d, count = function(ram, a, d)
+            executed += count
+            if halts and count == length:
+                self.halted = True
+                break
+            if count == 0:
+                # block 的第一個指令就存取超出範圍的 M：交給 run() 丟出 HackError
+                break
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        if not self.halted:
+            executed += self.run(max_cycles - executed)
+        return executed
+
+
+# ============= JIT (--jit) =============
+
+# comp 欄位 -> Python 運算式 ({x} = D, {y} = A 或 M)
+COMP_EXPRESSIONS = {
+    0b101010: '0',
+    0b111111: '1',
+    0b111010: '65535',
+    0b001100: '{x}',
+    0b110000: '{y}',
+    0b001101: '{x} ^ 65535',
+    0b110001: '{y} ^ 65535',
+    0b001111: '-{x} & 65535',
+    0b110011: '-{y} & 65535',
+    0b011111: '({x} + 1) & 65535',
+    0b110111: '({y} + 1) & 65535',
+    0b001110: '({x} - 1) & 65535',
+    0b110010: '({y} - 1) & 65535',
+    0b000010: '({x} + {y}) & 65535',
+    0b010011: '({x} - {y}) & 65535',
+    0b000111: '({y} - {x}) & 65535',
+    0b000000: '{x} & {y}',
+    0b010101: '{x} | {y}',
+}
+
+# jump 欄位 -> 跳躍條件 (out 是 16 位元無號數，>= 32768 代表負數)
+JUMP_EXPRESSIONS = {
+    1: '0 < out < 32768',
+    2: 'out == 0',
+    3: 'out < 32768',
+    4: 'out >= 32768',
+    5: 'out != 0',
+    6: 'out == 0 or out >= 32768',
+    7: 'True',
+}
+
+
+# 一個 block 最多幾個指令 (避免很長的直線程式碼產生過大的函數)
+MAX_BLOCK_LENGTH = 512
+
+
+def compile_block(rom: List[int], start: int) -> Tuple[object, int, bool]:
+    """
+    把從 start 開始的程式碼翻成 Python 函數 block(ram, a, d) -> (下一個 PC, a, d, 執行的指令數)。
+    條件跳躍沒跳時直接接著執行後面的指令，遇到無條件跳躍 (或 ROM 結尾) 才結束，
+    所以一個 block 可以跨過好幾個條件跳躍 (superblock)。
+    回傳 (函數, 最多執行的指令數, 最後的跳躍是否為程式結尾的無窮迴圈)；start 超出 ROM 時函數為 None。
+    A 暫存器的值在 block 內已知時 (剛執行過 @X)，直接把常數寫進運算式，離開 block 時才寫回 a。
+    """
+    if start >= len(rom):
+        return None, 0, True
+    lines = ['def block(ram, a, d):']
+    namespace: Dict[str, object] = {}
+    known_a: Optional[int] = None
+    halts = False
+    pc = start
+    while pc < len(rom) and pc - start < MAX_BLOCK_LENGTH:
+        word = rom[pc]
+        pc += 1
+        if not word & 0x8000:
+            known_a = word
+            continue
+
+        comp = (word >> 6) & 0x3F
+        use_m, dest_a, dest_d, dest_m, jump = uses_m(word), word & 0x20, word & 0x10, word & 0x08, word & 7
+        address = 'a' if known_a is None else str(known_a)
+        if known_a is None and (use_m or dest_m):
+            # A 不是 @X 的常數時可能超出 RAM：停在這個指令前離開 block，由 run() 回報錯誤
+            lines.append(f'    if a >= {RAM_SIZE}:')
+            lines.append(f'        return {pc - 1}, a, d, {pc - 1 - start}')
+        y = f'ram[{address}]' if use_m else address
+        if comp in COMP_EXPRESSIONS:
+            expression = COMP_EXPRESSIONS[comp].format(x='d', y=y)
+        else:
+            namespace[f'alu_{comp}'] = alu(comp)
+            expression = f'alu_{comp}(d, {y})'
+
+        targets = (['ram[' + address + ']'] if dest_m else []) + (['a'] if dest_a else []) + \
+                  (['d'] if dest_d else [])
+        jump_target = address
+        if jump:
+            lines.append(f'    out = {expression}')
+            # 跳到的是這個指令執行前的 A；dest 有 A 時 a 會被覆寫，所以先記下來
+            if dest_a and address == 'a':
+                lines.append('    target = a')
+                jump_target = 'target'
+            for target in targets:
+                lines.append(f'    {target} = out')
+        elif targets:
+            lines.append(f'    {" = ".join(targets)} = {expression}')
+        if dest_a:
+            known_a = None
+        if not jump:
+            continue
+
+        exit_a = 'a' if known_a is None else str(known_a)
+        exit_line = f'return {jump_target}, {exit_a}, d, {pc - start}'
+        if jump == 7:
+            # 和 run() 相同：@X 緊接著無條件跳回 X 就是程式結尾
+            halts = jump_target == str(pc - 2) and rom[pc - 2] == pc - 2
+            lines.append(f'    {exit_line}')
+            break
+        lines.append(f'    if {JUMP_EXPRESSIONS[jump]}:')
+        lines.append(f'        {exit_line}')
+    else:
+        exit_a = 'a' if known_a is None else str(known_a)
+        lines.append(f'    return {pc}, {exit_a}, d, {pc - start}')
+
+    exec(compile('\n'.join(lines), f'<block {start}>', 'exec'), namespace)
+    return namespace['block'], pc - start, halts
+
+
+# ============= 載入程式 =============
+
+def assemble(asm_file: str) -> Tuple[List[int], Dict[str, int]]:
+    """組譯 .asm，回傳 (機器碼, 標籤 -> ROM 位址)"""
+    assembler = hack_assembler.Assembler(asm_file)
+    instructions = assembler.first_pass(assembler.read_file())
+    labels = dict(assembler.symbol_table.table)
+    machine_code = assembler.second_pass(instructions)
+    predefined = hack_assembler.SymbolTable().table
+    return ([int(code, 2) for code in machine_code],
+            {name: address for name, address in labels.items() if name not in predefined})
+
+
+def load_program(path: str) -> Tuple[List[int], Dict[str, int]]:
+    """
+    讀入 .asm 或 .hack。.hack 沒有標籤，如果旁邊有同名的 .asm 就從它取得 SymbolTable。
+    """
+    if path.endswith('.asm'):
+        return assemble(path)
+    with open(path, 'r') as f:
+        rom = [int(line.strip(), 2) for line in f if line.strip()]
+    asm_file = os.path.splitext(path)[0] + '.asm'
+    labels = assemble(asm_file)[1] if os.path.exists(asm_file) else {}
+    return rom, labels
+
+
+# ============= Profiler =============
+
+class ExecutionProfiler:
+    """
+    依 SymbolTable 的標籤把執行的指令歸到各個 function (self)，
+    並用影子呼叫堆疊記錄 call graph：每條 caller -> callee 的呼叫次數和包含子呼叫的指令數。
+    """
+
+    def __init__(self, labels: Dict[str, int], rom_size: int):
+        names = {name for name, address in labels.items()
+                 if '.' in name and '$' not in name and address < rom_size}
+        entries = sorted((labels[name], name) for name in names
+                         if '_' not in name or name.split('_', 1)[1] not in names)
+        self.names = ['(startup)'] + [name for _, name in entries]
+        self.owner = [0] * rom_size
+        for index, (address, _) in enumerate(entries, 1):
+            end = entries[index][0] if index < len(entries) else rom_size
+            self.owner[address:end] = [index] * (end - address)
+        self.entry_of = {address: index for index, (address, _) in enumerate(entries, 1)}
+        self.returns = {address for name, address in labels.items() if RETURN_LABEL.fullmatch(name)}
+        self.pc_counts = [0] * rom_size
+
+        count = len(self.names)
+        self.calls = [0] * count
+        self.inclusive = [0] * count
+        self.active = [0] * count  # 遞迴時只算最外層的那次呼叫
+        self.edges: Dict[Tuple[int, int], List[int]] = {}  # (caller, callee) -> [次數, 指令數]
+        self.stack: List[Tuple[int, int, int]] = []  # (caller, callee, 進入時的 cycle)
+
+    def on_jump(self, pc: int, target: int, cycle: int):
+        callee = self.entry_of.get(target)
+        if callee is not None:
+            # 呼叫可能經過共用的 call 副程式 (官方工具的寫法)，所以 caller 以影子堆疊為準
+            caller = self.stack[-1][1] if self.stack else self.owner[pc]
+            self.calls[callee] += 1
+            self.active[callee] += 1
+            edge = self.edges.setdefault((caller, callee), [0, 0])
+            edge[0] += 1
+            self.stack.append((caller, callee, cycle))
+        elif target in self.returns and self.stack:
+            self._pop(cycle)
+
+    def _pop(self, cycle: int):
+        caller, callee, start = self.stack.pop()
+        self.active[callee] -= 1
+        if not self.active[callee]:
+            self.inclusive[callee] += cycle - start
+        if (caller, callee) not in {(c, f) for c, f, _ in self.stack}:
+            self.edges[(caller, callee)][1] += cycle - start
+
+    def finish(self, cycle: int):
+        """執行結束時還沒 return 的呼叫，算到目前為止"""
+        while self.stack:
+            self._pop(cycle)
+
+    def self_counts(self) -> List[int]:
+        counts = [0] * len(self.names)
+        for pc, count in enumerate(self.pc_counts):
+            if count:
+                counts[self.owner[pc]] += count
+        return counts
+
+    def print_flat(self, top: int):
+        counts = self.self_counts()
+        total = sum(counts) or 1
+        order = sorted(range(len(counts)), key=lambda i: -counts[i])
+        print("Flat profile:")
+        print(f"{'%self':>7}{'self':>12}{'inclusive':>12}{'calls':>9}  function")
+        for i in order[:top]:
+            if not counts[i] and not self.calls[i]:
+                break
+            print(f"{counts[i] * 100 / total:>6.2f}%{counts[i]:>12}{self.inclusive[i]:>12}"
+                  f"{self.calls[i]:>9}  {self.names[i]}")
+
+    def print_call_graph(self, top: int):
+        callers: Dict[int, List[Tuple[int, List[int]]]] = {}
+        callees: Dict[int, List[Tuple[int, List[int]]]] = {}
+        for (caller, callee), edge in self.edges.items():
+            callers.setdefault(callee, []).append((caller, edge))
+            callees.setdefault(caller, []).append((callee, edge))
+        counts = self.self_counts()
+        order = sorted(range(len(self.names)), key=lambda i: -(self.inclusive[i] or counts[i]))
+        print("\nCall graph (calls, inclusive instructions):")
+        for i in order[:top]:
+            if not counts[i] and not self.calls[i]:
+                break
+            for caller, (calls, inclusive) in sorted(callers.get(i, []), key=lambda e: -e[1][1]):
+                print(f"    {calls:>9}{inclusive:>12}      {self.names[caller]}")
+            print(f"  [{self.names[i]}]  self {counts[i]}, inclusive {self.inclusive[i]}, "
+                  f"calls {self.calls[i]}")
+            for callee, (calls, inclusive) in sorted(callees.get(i, []), key=lambda e: -e[1][1]):
+                print(f"    {calls:>9}{inclusive:>12}          {self.names[callee]}")
+            print()
+
+
+# ============= 螢幕與鍵盤 =============
+
+# 位元順序反轉：Hack 的 word 中 bit 0 是最左邊的像素，PBM / PNG 的 byte 則是最高位元在左
+REVERSED_BITS = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+# Jack OS 的按鍵碼 (Keyboard.keyPressed)；其他按鍵用字元本身的 ASCII 碼
+KEY_CODES = {
+    'newline': 128, 'enter': 128, 'backspace': 129, 'left': 130, 'up': 131, 'right': 132,
+    'down': 133, 'home': 134, 'end': 135, 'pageup': 136, 'pagedown': 137, 'insert': 138,
+    'delete': 139, 'esc': 140, 'space': 32,
+    **{f'f{n}': 140 + n for n in range(1, 13)},
+}
+
+
+class Screen:
+    """
+    記憶體對映的螢幕：512 x 256 像素，對應 RAM[SCREEN .. KBD-1]，每列 32 個 word。
+    直接讀 HackComputer 的 RAM，不另外保存副本；像素 1 代表黑色。
+    """
+
+    def __init__(self, ram: List[int]):
+        self.ram = ram
+
+    def pixels(self):
+        """(256, 512) 的像素陣列：有 NumPy 時是 bool 的 ndarray，否則是 list 的 list"""
+        if np is not None:
+            words = np.array(self.ram[SCREEN:KBD], dtype='<u2')
+            bits = np.unpackbits(words.view(np.uint8), bitorder='little')
+            return bits.reshape(SCREEN_HEIGHT, SCREEN_WIDTH).astype(bool)
+        return [[bool(word >> bit & 1) for word in self.ram[SCREEN + row * 32:SCREEN + row * 32 + 32]
+                 for bit in range(16)] for row in range(SCREEN_HEIGHT)]
+
+    def rows(self) -> List[bytes]:
+        """每列打包成 64 bytes (最左邊的像素在最高位元，1 = 黑)，PBM 的格式"""
+        if np is not None:
+            return [row.tobytes() for row in np.packbits(self.pixels(), axis=1, bitorder='big')]
+        rows = []
+        for row in range(SCREEN_HEIGHT):
+            start = SCREEN + row * 32
+            packed = bytearray()
+            for word in self.ram[start:start + 32]:
+                packed.append(REVERSED_BITS[word & 0xFF])
+                packed.append(REVERSED_BITS[word >> 8])
+            rows.append(bytes(packed))
+        return rows
+
+    def save(self, path: str):
+        """依副檔名存成 .png 或 .pbm"""
+        if path.endswith('.pbm'):
+            data = b'P4\n%d %d\n' % (SCREEN_WIDTH, SCREEN_HEIGHT) + b''.join(self.rows())
+        else:
+            data = self.png()
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def png(self) -> bytes:
+        """1 位元灰階 PNG (灰階的 0 是黑色，所以位元要反過來)"""
+        invert = bytes(255 - i for i in range(256))
+        raw = b''.join(b'\x00' + row.translate(invert) for row in self.rows())
+
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        header = struct.pack('>IIBBBBB', SCREEN_WIDTH, SCREEN_HEIGHT, 1, 0, 0, 0, 0)
+        return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+                chunk(b'IDAT', zlib.compress(raw, 9)) + chunk(b'IEND', b''))
+
+
+def key_code(name: str) -> int:
+    """按鍵名稱 (left、enter、f1 ...)、單一字元或數字 -> 按鍵碼；'-' 或 'none' 代表放開"""
+    lowered = name.lower()
+    if lowered in ('-', 'none', 'release'):
+        return 0
+    if lowered in KEY_CODES:
+        return KEY_CODES[lowered]
+    if len(name) == 1:
+        return ord(name)
+    if name.isdigit():
+        return int(name)
+    raise ValueError(f"unknown key '{name}'")
+
+
+def read_key_script(path: str) -> List[Tuple[int, int]]:
+    """
+    鍵盤腳本：每行 "<cycle> <按鍵>"，執行到該 cycle 時把按鍵碼寫進 KBD，
+    直到下一個事件為止 (用 '-' 放開)。# 之後是註解。
+    """
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                cycle, key = line.split(None, 1)
+                events.append((int(cycle), key_code(key.strip())))
+            except ValueError as error:
+                raise ValueError(f"{path}:{number}: {error}") from None
+    return sorted(events)
+
+
+def run_headless(computer: HackComputer, cycles: int, step, keys: List[Tuple[int, int]] = (),
+                 frame_every: int = 0, on_frame=None) -> int:
+    """
+    分段執行 cycles 個指令：每個鍵盤事件的 cycle 和每 frame_every 個 cycle 都會停下來，
+    套用按鍵或呼叫 on_frame()。step(n) 執行最多 n 個指令 (run 或 run_jit)。回傳實際執行的數量。
+    """
+    start = computer.cycles
+    end = start + cycles
+    keys = list(keys)
+    next_frame = start + frame_every if frame_every else None
+    while computer.cycles < end and not computer.halted:
+        while keys and keys[0][0] <= computer.cycles:
+            computer.ram[KBD] = keys.pop(0)[1]
+        stop = end
+        if keys:
+            stop = min(stop, keys[0][0])
+        if next_frame is not None:
+            stop = min(stop, next_frame)
+        step(stop - computer.cycles)
+        if next_frame is not None and computer.cycles >= next_frame:
+            on_frame()
+            next_frame += frame_every
+    return computer.cycles - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        usage="python HackEmulator.py [--cycles N] [--jit | --profile [--top N]] [--keys SCRIPT] "
+              "[--screenshot FILE] [--frames DIR --frame-every N] <program.hack | program.asm>")
+    arg_parser.add_argument('program')
+    arg_parser.add_argument('--cycles', type=int, default=1_000_000,
+                            help="最多執行幾個指令 (預設 1000000)")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="依 SymbolTable 的 function 標籤統計 flat profile 和 call graph")
+    arg_parser.add_argument('--jit', action='store_true',
+                            help="以 basic block 為單位產生 Python 函數執行 (比逐個指令直譯快很多)")
+    arg_parser.add_argument('--top', type=int, default=30,
+                            help="profile 最多列出幾個 function (預設 30)")
+    arg_parser.add_argument('--keys', metavar='SCRIPT',
+                            help="鍵盤腳本，每行 \"<cycle> <按鍵>\" (例如 200000 left、400000 -)")
+    arg_parser.add_argument('--screenshot', metavar='FILE',
+                            help="結束時把螢幕存成 .png 或 .pbm")
+    arg_parser.add_argument('--frames', metavar='DIR',
+                            help="每 --frame-every 個 cycle 存一張螢幕畫面到這個目錄")
+    arg_parser.add_argument('--frame-every', type=int, default=100_000,
+                            help="--frames 的間隔 cycle 數 (預設 100000)")
+    arg_parser.add_argument('--frame-format', choices=['png', 'pbm'], default='png')
+    args = arg_parser.parse_args()
+
+    if not os.path.isfile(args.program):
+        print(f"Error: {args.program} is not a file")
+        sys.exit(1)
+    if args.jit and args.profile:
+        print("Error: --profile needs per-instruction counts and cannot be used with --jit")
+        sys.exit(1)
+
+    rom, labels = load_program(args.program)
+    computer = HackComputer(rom)
+    profiler = None
+    if args.profile:
+        if not labels:
+            print("Warning: no symbols (.asm) found, everything is attributed to (startup)")
+        profiler = ExecutionProfiler(labels, len(rom))
+
+    try:
+        keys = read_key_script(args.keys) if args.keys else []
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}")
+        sys.exit(1)
+    screen = Screen(computer.ram)
+    if args.frames:
+        os.makedirs(args.frames, exist_ok=True)
+
+    def save_frame():
+        screen.save(os.path.join(args.frames, f"frame_{computer.cycles:010d}.{args.frame_format}"))
+
+    step = computer.run_jit if args.jit else lambda n: computer.run(n, profiler)
+    try:
+        executed = run_headless(computer, args.cycles, step, keys,
+                                args.frame_every if args.frames else 0, save_frame)
+    except HackError as error:
+        print(f"Error: {error}")
+        sys.exit(1)
+    if args.screenshot:
+        screen.save(args.screenshot)
+    state = 'halted' if computer.halted else 'stopped'
+    print(f"{state} after {executed} instruction(s): PC={computer.pc} A={computer.a} D={computer.d} "
+          f"SP={computer.ram[0]}")
+
+    if profiler:
+        profiler.finish(computer.cycles)
+        print()
+        profiler.print_flat(args.top)
+        profiler.print_call_graph(args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+"""
+Jack Toolchain - Nand2Tetris 第 6~11 章串接
+Jack (.jack) -> VM (.vm) -> Hack 組合語言 (.asm) -> Hack 機器碼 (.hack)
+
+直接載入各章的程式 (11/JackCompiler.py、8/VMTranslator.py、6/assembler.py)，
+在同一個 process 裡完成整個建置，不必每次手動依序執行三個工具。
+各階段之間直接傳遞記憶體中的資料 (VM 指令 tuple、16 位元機器碼)，
+不寫出中間檔再重新讀取、解析；需要看中間結果時用 --dump 寫出 .vm / .asm。
+--watch 會常駐並輪詢專案目錄，只重新編譯有變動的 class，再重新連結出 .hack。
+--profile 記錄每個階段、每個檔案花的時間與記憶體，寫出 JSON 和 cProfile 的結果。
+--size-report 列出每個 subroutine 佔用的 VM 指令、組合語言行數和 ROM 大小。
+"""
+
+import os
+import io
+import re
+import sys
+import json
+import time
+import cProfile
+import hashlib
+import argparse
+import contextlib
+import tracemalloc
+import importlib.util
+from typing import Dict, List, Optional, Tuple
+
+TOOLCHAIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name: str, relative_path: str):
+    """用檔案路徑載入各章的程式 (它們不是 package，不能直接 import)"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(TOOLCHAIN_DIR, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+jack_compiler = load_module('JackCompiler', os.path.join('11', 'JackCompiler.py'))
+vm_translator = load_module('VMTranslator', os.path.join('8', 'VMTranslator.py'))
+hack_assembler = load_module('assembler', os.path.join('6', 'assembler.py'))
+
+OUTPUT_FOLDER_NAME = 'output'
+
+# Hack 的 ROM 大小 (32K words)
+ROM_SIZE = 32768
+
+# CodeWriter 自動產生的標籤：比較指令的 LABEL_n 和 call 的 function$ret.n
+# 每個 class 各自從 0 開始編號，連結時再依前面 class 用掉的數量往後平移
+COMPARE_LABEL = re.compile(r'(?<=[@(])LABEL_(\d+)')
+RETURN_LABEL = re.compile(r'\$ret\.(\d+)(?=\)|$)')
+
+
+# VM 指令：(Parser.C_xxx, arg1, arg2)，和 VMTranslator.parse_command 相同
+VMCommand = Tuple[int, Optional[str], Optional[int]]
+
+# 每個 VM function 產生的大小：(function 名稱, VM 指令數, 組合語言行數, ROM words)
+FunctionSize = Tuple[str, int, int, int]
+
+
+# ============= 編譯單元 =============
+
+# 預定義符號 (SP、R0~R15、SCREEN、KBD ...)
+PREDEFINED_SYMBOLS = hack_assembler.SymbolTable().table
+
+
+class HackEncoder:
+    """
+    給 CodeWriter 用的輸出串流：CodeWriter 每次 write 剛好是一行，
+    收到就直接編碼成 16 位元的機器碼，不產生組合語言文字再交給 Assembler 重新解析。
+    - 標籤 (XXX) 記下在這段機器碼中的位址
+    - 還不知道位址的 @symbol 先填 0，記到 fixups，連結時再補上
+    listing 為 True 時另外保留組合語言原文 (--dump 用)。
+    """
+
+    # C 指令原文 -> 機器碼；CodeWriter 用到的 C 指令只有幾十種，各解析一次
+    _c_words: Dict[str, int] = {}
+
+    def __init__(self, listing: bool = False):
+        self.words: List[int] = []
+        self.labels: Dict[str, int] = {}
+        self.fixups: List[Tuple[int, str]] = []
+        self.lines: Optional[List[str]] = [] if listing else None
+        self.line_count = 0  # 組合語言行數 (含註解和標籤)，--size-report 用
+
+    def write(self, text: str):
+        line = text[:-1]
+        self.line_count += 1
+        if self.lines is not None:
+            self.lines.append(line)
+        first = line[0]
+        if first == '/':
+            return
+        if first == '@':
+            symbol = line[1:]
+            if symbol.isdigit():
+                self.words.append(int(symbol))
+            elif symbol in PREDEFINED_SYMBOLS:
+                self.words.append(PREDEFINED_SYMBOLS[symbol])
+            else:
+                self.fixups.append((len(self.words), symbol))
+                self.words.append(0)
+        elif first == '(':
+            self.labels[line[1:-1]] = len(self.words)
+        else:
+            word = self._c_words.get(line)
+            if word is None:
+                word = self._c_words[line] = self.encode_c(line)
+            self.words.append(word)
+
+    @staticmethod
+    def encode_c(line: str) -> int:
+        """C 指令：111accccccdddjjj，和 Assembler.second_pass 相同的規則"""
+        parser = hack_assembler.Parser([line])
+        parser.advance()
+        code = hack_assembler.Code
+        return int('111' + code.comp(parser.comp()) + code.dest(parser.dest()) + code.jump(parser.jump()), 2)
+
+    def close(self):
+        pass
+
+
+class Unit:
+    """
+    一個 class 的建置狀態，常駐在記憶體中：
+    原始檔的 (mtime, size) 與內容 hash、VM 指令，以及這個 class 的機器碼、
+    標籤位址和待補的 fixups (位址都從這個 class 的開頭算起)。
+    --dump 時另外保留組合語言 (每行一個元素，含註解)、需要平移標籤編號的行和用掉的標籤數量。
+    """
+
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.source = source
+        self.stamp: Optional[Tuple[int, int]] = None
+        self.digest: Optional[str] = None
+        self.commands: List[VMCommand] = []
+        self.words: List[int] = []
+        self.labels: Dict[str, int] = {}
+        self.fixups: List[Tuple[int, str]] = []
+        self.asm: List[str] = []
+        self.relocations: List[int] = []
+        self.label_count = 0
+        self.call_count = 0
+        self.functions: List[FunctionSize] = []
+        self.subroutine_lines: Dict[str, int] = {}  # Jack subroutine 名稱 -> 原始碼行號
+        self.errors: List[str] = []
+
+    @property
+    def is_library(self) -> bool:
+        """--lib 給的 .vm (例如 Jack OS) 不需要編譯"""
+        return self.source.endswith('.vm')
+
+
+def file_stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def read_vm_commands(lines: List[str]) -> List[VMCommand]:
+    return vm_translator.read_commands(vm_translator.Parser(lines))
+
+
+def function_groups(commands: List[VMCommand]) -> List[Tuple[Optional[str], List[VMCommand]]]:
+    """依 function 指令切開；第一個 function 之前的指令歸在 None"""
+    groups: List[Tuple[Optional[str], List[VMCommand]]] = []
+    for command in commands:
+        if command[0] == vm_translator.Parser.C_FUNCTION or not groups:
+            name = command[1] if command[0] == vm_translator.Parser.C_FUNCTION else None
+            groups.append((name, []))
+        groups[-1][1].append(command)
+    return groups
+
+
+def translate_unit(unit: Unit, listing: bool = False):
+    """
+    把一個 class 的 VM 指令直接翻成機器碼，標籤從 0 開始編號。
+    逐個 function 翻譯，順便記下每個 function 產生的大小。
+    """
+    encoder = HackEncoder(listing)
+    code_writer = vm_translator.CodeWriter(encoder)
+    code_writer.set_file_name(unit.name)
+    unit.functions = []
+    for name, group in function_groups(unit.commands):
+        words, lines = len(encoder.words), encoder.line_count
+        vm_translator.translate_commands(group, code_writer)
+        unit.functions.append((name, len(group), encoder.line_count - lines, len(encoder.words) - words))
+    store_code(unit, code_writer)
+
+
+def store_code(unit: Unit, code_writer):
+    encoder = code_writer.output
+    unit.words, unit.labels, unit.fixups = encoder.words, encoder.labels, encoder.fixups
+    unit.asm = encoder.lines or []
+    unit.relocations = [i for i, line in enumerate(unit.asm)
+                        if not line.startswith('//') and ('LABEL_' in line or '$ret.' in line)]
+    unit.label_count = code_writer.label_counter
+    unit.call_count = code_writer.call_counter
+
+
+def relocate(line: str, label_base: int, call_base: int) -> str:
+    """把一行組合語言中自動產生的標籤編號往後平移"""
+    if label_base:
+        line = COMPARE_LABEL.sub(lambda m: f"LABEL_{int(m.group(1)) + label_base}", line)
+    if call_base:
+        line = RETURN_LABEL.sub(lambda m: f"$ret.{int(m.group(1)) + call_base}", line)
+    return line
+
+
+# ============= Profiling (--profile) =============
+
+class Profiler:
+    """
+    記錄每個階段 (tokenize、compile、translate、link、write) 每個檔案的
+    執行時間、處理數量 (token、VM 指令、機器碼 ...) 以及 tracemalloc 量到的記憶體配置。
+    時間包含 tracemalloc / cProfile 本身的額外負擔，適合看各階段的相對比例。
+    """
+
+    def __init__(self):
+        self.records: List[dict] = []
+        tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, file_name: str):
+        """with profiler.stage(...) as counts: counts 是要填入處理數量的 dict"""
+        counts: Dict[str, int] = {}
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            self.records.append({
+                'stage': stage,
+                'file': file_name,
+                'seconds': elapsed,
+                'counts': counts,
+                'allocated_bytes': current - before,
+                'peak_bytes': peak - before,
+            })
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def totals(self) -> Dict[str, dict]:
+        """依階段加總 (保留第一次出現的順序)"""
+        totals: Dict[str, dict] = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {
+                'files': 0, 'seconds': 0.0, 'counts': {}, 'allocated_bytes': 0, 'peak_bytes': 0})
+            total['files'] += 1
+            total['seconds'] += record['seconds']
+            total['allocated_bytes'] += record['allocated_bytes']
+            total['peak_bytes'] = max(total['peak_bytes'], record['peak_bytes'])
+            for key, value in record['counts'].items():
+                total['counts'][key] = total['counts'].get(key, 0) + value
+        return totals
+
+    def write_json(self, path: str, **info):
+        report = dict(info, stages=self.totals(), records=self.records)
+        jack_compiler.write_file_atomic(path, json.dumps(report, indent=2))
+
+    def print_summary(self):
+        print(f"\n{'stage':<10}{'files':>6}{'ms':>10}{'alloc KB':>10}{'peak KB':>10}  counts")
+        for stage, total in self.totals().items():
+            counts = ', '.join(f"{key}={value}" for key, value in total['counts'].items())
+            print(f"{stage:<10}{total['files']:>6}{total['seconds'] * 1000:>10.2f}"
+                  f"{total['allocated_bytes'] / 1024:>10.1f}{total['peak_bytes'] / 1024:>10.1f}  {counts}")
+
+
+# ============= 建置 =============
+
+class Toolchain:
+    """
+    專案目錄的建置器。build() 只重新處理 mtime 或大小有變、而且內容 hash 真的不同的 class，
+    其餘沿用記憶體中的結果；連結時依檔名排序串接所有機器碼並補上 fixups，
+    輸出和依序執行 JackCompiler、VMTranslator、assembler 的結果完全相同。
+    dump 為 True 時另外寫出各階段的中間結果 (output/ 下的 .vm 和 .asm)。
+    """
+
+    def __init__(self, project_dir: str, lib_dirs: List[str] = (),
+                 string_pool: bool = False, optimize: bool = False, dump: bool = False):
+        self.project_dir = project_dir
+        self.lib_dirs = list(lib_dirs)
+        self.string_pool = string_pool
+        self.optimize = optimize
+        self.dump = dump
+        self.output_dir = os.path.join(project_dir, OUTPUT_FOLDER_NAME)
+        program_name = os.path.basename(os.path.abspath(project_dir))
+        self.asm_file = os.path.join(self.output_dir, program_name + '.asm')
+        self.hack_file = os.path.join(self.output_dir, program_name + '.hack')
+        self.units: Dict[str, Unit] = {}
+        self.rom_size = 0
+        self.profiler: Optional[Profiler] = None
+        self.bootstrap = self._bootstrap()
+
+    @staticmethod
+    def _bootstrap() -> Unit:
+        bootstrap = Unit('Sys.init bootstrap', '')
+        code_writer = vm_translator.CodeWriter(HackEncoder(listing=True))
+        code_writer.write_init()
+        store_code(bootstrap, code_writer)
+        bootstrap.functions = [(None, 0, code_writer.output.line_count, len(bootstrap.words))]
+        return bootstrap
+
+    def sources(self) -> Dict[str, str]:
+        """目前的原始檔：class 名稱 -> 路徑 (.jack，或 --lib 目錄中沒有同名 .jack 的 .vm)"""
+        found = {}
+        for lib_dir in self.lib_dirs:
+            for filename in os.listdir(lib_dir):
+                if filename.endswith('.vm'):
+                    found[filename[:-3]] = os.path.join(lib_dir, filename)
+        for filename in os.listdir(self.project_dir):
+            if filename.endswith('.jack'):
+                found[filename[:-5]] = os.path.join(self.project_dir, filename)
+        return found
+
+    def _stage(self, stage: str, file_name: str):
+        if self.profiler is None:
+            return contextlib.nullcontext({})
+        return self.profiler.stage(stage, file_name)
+
+    def build(self) -> Optional[List[str]]:
+        """
+        增量建置。回傳這次重新處理的 class 名稱；
+        沒有任何變動時回傳 None，有編譯錯誤時不連結 (保留上一次的 .asm / .hack)。
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        sources = self.sources()
+        removed = [name for name in self.units if name not in sources]
+        for name in removed:
+            del self.units[name]
+
+        changed = []
+        for name, source in sorted(sources.items()):
+            unit = self.units.get(name)
+            if unit is None or unit.source != source:
+                unit = self.units[name] = Unit(name, source)
+            try:
+                stamp = file_stamp(source)
+            except OSError:
+                continue  # 編輯器存檔途中暫時不見，下一輪再處理
+            if stamp == unit.stamp:
+                continue
+            unit.stamp = stamp
+            with open(source, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+            if digest == unit.digest and not unit.errors:
+                continue  # 只是 touch 或存了相同內容
+            unit.digest = digest
+            self._rebuild(unit)
+            changed.append(name)
+
+        if not changed and not removed:
+            return None
+        if any(unit.errors for unit in self.units.values()):
+            for unit in self.units.values():
+                for message in unit.errors:
+                    print(message)
+            return changed
+        self.link()
+        return changed
+
+    def _rebuild(self, unit: Unit):
+        file_name = os.path.basename(unit.source)
+        if unit.is_library:
+            with self._stage('read', file_name) as counts:
+                with open(unit.source, 'r') as f:
+                    unit.commands = read_vm_commands(f.readlines())
+                counts['vm_commands'] = len(unit.commands)
+            unit.errors = []
+        else:
+            with self._stage('tokenize', file_name) as counts:
+                tokenizer = jack_compiler.JackTokenizer(unit.source)
+                counts['bytes'] = unit.stamp[1]
+                counts['tokens'] = len(tokenizer.tokens)
+            unit.subroutine_lines = subroutine_lines(tokenizer)
+            # 編譯器輸出到記憶體中的串流，再轉成 VM 指令 tuple 交給 CodeWriter
+            with self._stage('compile', file_name) as counts:
+                stream = io.StringIO()
+                engine = jack_compiler.CompilationEngine(tokenizer, stream, self.string_pool, self.optimize)
+                engine.compile_class()
+                engine.close()
+                unit.errors = engine.errors
+                if not unit.errors:
+                    vm_text = stream.getvalue()
+                    unit.commands = read_vm_commands(vm_text.splitlines())
+                    counts['vm_commands'] = len(unit.commands)
+            if unit.errors:
+                return
+            if self.dump:
+                jack_compiler.write_file_atomic(os.path.join(self.output_dir, unit.name + '.vm'), vm_text)
+        with self._stage('translate', file_name) as counts:
+            translate_unit(unit, self.dump)
+            counts['vm_commands'] = len(unit.commands)
+            counts['words'] = len(unit.words)
+            counts['fixups'] = len(unit.fixups)
+
+    def link(self):
+        """依 .vm 檔名排序串接各 class 的機器碼 (和 VMTranslator 處理目錄的順序相同)"""
+        units = [self.bootstrap] + [self.units[name] for name in sorted(self.units, key=lambda name: name + '.vm')]
+        with self._stage('link', os.path.basename(self.hack_file)) as counts:
+            words = self._resolve(units)
+            counts['units'] = len(units)
+            counts['words'] = len(words)
+        with self._stage('write', os.path.basename(self.hack_file)) as counts:
+            hack_text = ''.join(f"{word:016b}\n" for word in words)
+            jack_compiler.write_file_atomic(self.hack_file, hack_text)
+            counts['bytes'] = len(hack_text)
+            if self.dump:
+                counts['bytes'] += self.write_listing(units)
+        self.rom_size = len(words)
+
+    def _resolve(self, units: List[Unit]) -> List[int]:
+        bases = []
+        labels: Dict[str, int] = {}
+        size = 0
+        for unit in units:
+            bases.append(size)
+            for label, address in unit.labels.items():
+                labels[label] = size + address
+            size += len(unit.words)
+
+        # 補上 fixups：先找同一個 class 裡的標籤 (LABEL_n、$ret.n 這類自動產生的標籤只在 class 內有效)，
+        # 再找全域標籤，都沒有就是變數，和 Assembler 一樣依第一次出現的順序從 RAM[16] 開始配置
+        words: List[int] = []
+        variables: Dict[str, int] = {}
+        for unit, base in zip(units, bases):
+            words += unit.words
+            for index, symbol in unit.fixups:
+                address = unit.labels.get(symbol)
+                if address is not None:
+                    address += base
+                else:
+                    address = labels.get(symbol)
+                    if address is None:
+                        address = variables.setdefault(symbol, 16 + len(variables))
+                words[base + index] = address
+        return words
+
+    def write_listing(self, units: List[Unit]) -> int:
+        """--dump: 寫出連結後的組合語言，自動產生的標籤依前面 class 用掉的數量重新編號；回傳寫出的字元數"""
+        asm: List[str] = []
+        label_base = call_base = 0
+        for unit in units:
+            start = len(asm)
+            asm += unit.asm
+            if label_base or call_base:
+                for i in unit.relocations:
+                    asm[start + i] = relocate(asm[start + i], label_base, call_base)
+            label_base += unit.label_count
+            call_base += unit.call_count
+        asm_text = ''.join(line + '\n' for line in asm)
+        jack_compiler.write_file_atomic(self.asm_file, asm_text)
+        return len(asm_text)
+
+
+def subroutine_lines(tokenizer) -> Dict[str, int]:
+    """Jack subroutine 名稱 -> 宣告所在的行號 (constructor/function/method 後面隔一個型別就是名稱)"""
+    tokens = tokenizer.tokens
+    return {tokens[i + 2]: tokenizer.positions[i][0]
+            for i in range(len(tokens) - 2)
+            if tokens[i] in jack_compiler.SUBROUTINE_KEYWORDS and tokenizer.token_types[i] == 'KEYWORD'}
+
+
+def print_size_report(toolchain: Toolchain):
+    """
+    --size-report: 每個 VM function 的大小，依 ROM words 由大到小排序，
+    並標出對應的 Jack 原始碼位置 (--lib 的 .vm 只標檔名)。
+    """
+    rows = [('(bootstrap)', '', *toolchain.bootstrap.functions[0][1:])]
+    for unit in toolchain.units.values():
+        for name, vm_commands, asm_lines, words in unit.functions:
+            source = os.path.basename(unit.source)
+            subroutine = name.split('.', 1)[-1] if name else None
+            if subroutine in unit.subroutine_lines:
+                source += f":{unit.subroutine_lines[subroutine]}"
+            rows.append((name or '(top level)', source, vm_commands, asm_lines, words))
+    rows.sort(key=lambda row: (-row[4], row[0]))
+
+    total_words = sum(row[4] for row in rows)
+    print(f"\n{'function':<32}{'source':<20}{'VM':>7}{'ASM':>8}{'ROM':>8}{'%ROM':>7}")
+    for name, source, vm_commands, asm_lines, words in rows:
+        print(f"{name:<32}{source:<20}{vm_commands:>7}{asm_lines:>8}{words:>8}"
+              f"{words * 100 / ROM_SIZE:>6.1f}%")
+    print(f"{'total':<52}{sum(row[2] for row in rows):>7}{sum(row[3] for row in rows):>8}"
+          f"{total_words:>8}{total_words * 100 / ROM_SIZE:>6.1f}%")
+    if total_words > ROM_SIZE:
+        print(f"Warning: program exceeds the {ROM_SIZE}-word ROM by {total_words - ROM_SIZE} word(s)")
+
+
+def watch(toolchain: Toolchain, interval: float):
+    """常駐輪詢專案目錄，有變動就增量重建；Ctrl+C 結束"""
+    print(f"Watching {toolchain.project_dir} (Ctrl+C to stop)")
+    try:
+        while True:
+            start = time.perf_counter()
+            changed = toolchain.build()
+            if changed is not None:
+                report(toolchain, changed, time.perf_counter() - start)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print()
+
+
+def report(toolchain: Toolchain, changed: List[str], elapsed: float):
+    errors = sum(len(unit.errors) for unit in toolchain.units.values())
+    rebuilt = ', '.join(changed) if changed else '(removed files only)'
+    if errors:
+        print(f"[{time.strftime('%H:%M:%S')}] {rebuilt}: {errors} error(s), not linked")
+    else:
+        print(f"[{time.strftime('%H:%M:%S')}] {rebuilt} -> {toolchain.hack_file} "
+              f"({toolchain.rom_size} words, {elapsed * 1000:.0f} ms)")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        usage="python JackToolchain.py [--watch | --profile] [--dump] [--size-report] [--lib DIR] [-O] [--string-pool] "
+              "<project directory>")
+    arg_parser.add_argument('project_dir')
+    arg_parser.add_argument('--watch', action='store_true',
+                            help="常駐監看目錄，存檔後只重新編譯有變動的 class 並重新連結")
+    arg_parser.add_argument('--interval', type=float, default=0.2,
+                            help="--watch 輪詢間隔秒數 (預設 0.2)")
+    arg_parser.add_argument('--dump', action='store_true',
+                            help="另外寫出中間結果：output/ 下每個 class 的 .vm 和連結後的 .asm")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="記錄各階段的時間、數量、記憶體配置，寫出 output/<專案>.profile.json 和 .prof (cProfile)")
+    arg_parser.add_argument('--size-report', action='store_true',
+                            help="列出每個 subroutine 的 VM 指令數、組合語言行數和 ROM 大小 (由大到小)")
+    arg_parser.add_argument('--lib', action='append', default=[], metavar='DIR',
+                            help="一起連結的 .vm 目錄 (例如 Jack OS)，可重複指定")
+    arg_parser.add_argument('--string-pool', action='store_true',
+                            help="相同的字串常數只建構一次 (同 JackCompiler --string-pool)")
+    arg_parser.add_argument('-O', '--optimize', action='store_true',
+                            help="常數折疊與分支化簡 (同 JackCompiler -O)")
+    args = arg_parser.parse_args()
+
+    if not os.path.isdir(args.project_dir):
+        print(f"Error: {args.project_dir} is not a directory")
+        sys.exit(1)
+    if args.watch and args.profile:
+        print("Error: --profile cannot be used with --watch")
+        sys.exit(1)
+
+    toolchain = Toolchain(args.project_dir, args.lib, args.string_pool, args.optimize, args.dump)
+    if args.watch:
+        watch(toolchain, args.interval)
+        return
+
+    if args.profile:
+        toolchain.profiler = Profiler()
+        profile = cProfile.Profile()
+        profile.enable()
+    start = time.perf_counter()
+    changed = toolchain.build() or []
+    elapsed = time.perf_counter() - start
+    report(toolchain, changed, elapsed)
+    if args.size_report and not any(unit.errors for unit in toolchain.units.values()):
+        print_size_report(toolchain)
+
+    if args.profile:
+        profile.disable()
+        toolchain.profiler.stop()
+        base_path = os.path.splitext(toolchain.hack_file)[0]
+        profile.dump_stats(base_path + '.prof')
+        toolchain.profiler.write_json(base_path + '.profile.json', project=toolchain.project_dir,
+                                      options={'string_pool': args.string_pool, 'optimize': args.optimize,
+                                               'dump': args.dump},
+                                      total_seconds=elapsed, rom_words=toolchain.rom_size)
+        toolchain.profiler.print_summary()
+        print(f"\nProfile: {base_path}.profile.json, {base_path}.prof")
+    if any(unit.errors for unit in toolchain.units.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+Test Runner - 執行 Nand2Tetris 的 .tst 測試腳本並和 .cmp 比對，不需要官方的 Java 模擬器
+- CPUEmulator 的腳本 (load Xxx.asm / Xxx.hack)：用第 6 章的 Assembler 組譯，在 HackEmulator 上執行；
+  Xxx.asm 是 VM 翻譯結果時 (同目錄有 Xxx.vm，或目錄本身就是 Xxx)，先用第 8 章的 VMTranslator
+  在記憶體中重新翻譯，測的是目前的翻譯器而不是舊的 .asm 檔
+- VMEmulator 的腳本 (load Xxx.vm / load 整個目錄)：在 VMEmulator 上執行
+- HardwareSimulator 的腳本 (load Xxx.hdl)：在 期中作業/HardwareSimulator.py 上執行；
+  echo 要求按住某個鍵時 (Memory.tst 的鍵盤測試) 自動按下，clear-echo 時放開
+
+輸出格式和官方模擬器相同 (output-list 的 %D1.6.1 等格式)，.cmp 中的 '*' 代表不比對的字元。
+整個測試集用 process pool 平行執行。
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+TOOLCHAIN_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(TOOLCHAIN_DIR)
+
+
+def load_module(name: str, relative_path: str):
+    """用檔案路徑載入各章的程式 (它們不是 package，不能直接 import)"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(TOOLCHAIN_DIR, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+hack_assembler = load_module('assembler', os.path.join('6', 'assembler.py'))
+vm_translator = load_module('VMTranslator', os.path.join('8', 'VMTranslator.py'))
+hack_emulator = load_module('HackEmulator', 'HackEmulator.py')
+vm_emulator = load_module('VMEmulator', 'VMEmulator.py')
+hardware_simulator = None  # 第一次 load .hdl 時才載入
+
+
+def load_hardware_simulator():
+    global hardware_simulator
+    if hardware_simulator is None:
+        hardware_simulator = load_module('HardwareSimulator', os.path.join('..', '期中作業', 'HardwareSimulator.py'))
+    return hardware_simulator
+
+TOKEN = re.compile(r'"[^"]*"|[{},;]|[^\s{},;]+')
+COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+OUTPUT_FORMAT = re.compile(r'^(.+?)(?:%([BDXS])(\d+)\.(\d+)\.(\d+))?$')
+DEFAULT_FORMAT = ('B', 1, 1, 1)
+HOLD_KEY = re.compile(r"hold down (?:the )?'(.)'", re.IGNORECASE)
+MAX_WHILE_ITERATIONS = 1_000_000
+
+# 腳本解析後的敘述：('command', [token ...]) / ('repeat', 次數或 None, [敘述 ...]) /
+# ('while', (左, 運算子, 右), [敘述 ...])
+Statement = Tuple
+
+
+class ScriptError(Exception):
+    """腳本語法錯誤、不支援的指令，或執行時的錯誤"""
+
+
+class ComparisonFailure(Exception):
+    """輸出和 .cmp 不同"""
+
+
+# ============= 腳本解析 =============
+
+def parse_script(text: str) -> List[Statement]:
+    tokens = TOKEN.findall(COMMENT.sub(' ', text))
+    statements, position = parse_block(tokens, 0)
+    if position < len(tokens):
+        raise ScriptError(f"unexpected '{tokens[position]}'")
+    return statements
+
+
+def parse_block(tokens: List[str], position: int) -> Tuple[List[Statement], int]:
+    """解析到 '}' 或結尾為止，回傳 (敘述, '}' 的位置)"""
+    statements = []
+    while position < len(tokens) and tokens[position] != '}':
+        token = tokens[position]
+        if token in (',', ';'):
+            position += 1
+        elif token in ('repeat', 'while'):
+            end = tokens.index('{', position)
+            header = tokens[position + 1:end]
+            body, position = parse_block(tokens, end + 1)
+            if position >= len(tokens):
+                raise ScriptError(f"missing '}}' after {token}")
+            position += 1
+            if token == 'repeat':
+                statements.append(('repeat', int(header[0]) if header else None, body))
+            elif len(header) == 3:
+                statements.append(('while', tuple(header), body))
+            else:
+                raise ScriptError(f"bad while condition: {' '.join(header)}")
+        else:
+            end = position
+            while end < len(tokens) and tokens[end] not in (',', ';', '}', '{'):
+                end += 1
+            statements.append(('command', tokens[position:end]))
+            position = end
+    return statements, position
+
+
+def parse_value(text: str) -> int:
+    """腳本中的數值：-1、%B0101、%X0FCF、%D12"""
+    if text.startswith('%'):
+        base = {'B': 2, 'X': 16, 'D': 10}.get(text[1].upper())
+        if base is None:
+            raise ScriptError(f"bad value {text}")
+        return int(text[2:], base)
+    return int(text)
+
+
+def find_commands(statements: List[Statement], name: str) -> List[List[str]]:
+    found = []
+    for statement in statements:
+        if statement[0] == 'command':
+            if statement[1] and statement[1][0] == name:
+                found.append(statement[1])
+        else:
+            found += find_commands(statement[2], name)
+    return found
+
+
+# ============= 輸出格式 =============
+
+class OutputColumn:
+    """output-list 的一欄：名稱%格式 左邊空白.寬度.右邊空白"""
+
+    def __init__(self, spec: str):
+        match = OUTPUT_FORMAT.match(spec)
+        self.name = match.group(1)
+        if match.group(2):
+            self.kind = match.group(2)
+            self.left, self.width, self.right = (int(match.group(n)) for n in (3, 4, 5))
+        else:
+            self.kind, self.left, self.width, self.right = DEFAULT_FORMAT
+
+    def header(self) -> str:
+        """名稱置中 (多的空白放右邊)，太長就截斷"""
+        total = self.left + self.width + self.right
+        name = self.name[:total]
+        padding = total - len(name)
+        return ' ' * (padding // 2) + name + ' ' * (padding - padding // 2)
+
+    def format(self, value) -> str:
+        if self.kind == 'S':
+            text = str(value).ljust(self.width)
+        elif self.kind == 'D':
+            text = str(vm_emulator.s16(value)).rjust(self.width)  # 16 位元的值用 %D 顯示時是有號數
+        elif self.kind == 'B':
+            text = format(value & ((1 << self.width) - 1), f'0{self.width}b')
+        else:
+            text = format(value & 0xFFFF, '04X').rjust(self.width)
+        return ' ' * self.left + text + ' ' * self.right
+
+
+def lines_match(actual: str, expected: str) -> bool:
+    """.cmp 中的 '*' 代表這個字元不比對"""
+    return len(actual) == len(expected) and all(e == '*' or a == e for a, e in zip(actual, expected))
+
+
+# ============= 模擬器 (測試的對象) =============
+
+class CPUTarget:
+    """CPUEmulator：ROM + RAM，ticktock 執行一個指令"""
+
+    def __init__(self, rom: List[int]):
+        self.computer = hack_emulator.HackComputer(rom)
+
+    def get(self, name: str) -> int:
+        computer = self.computer
+        base, index = split_index(name)
+        if base == 'RAM' and index is not None:
+            return computer.ram[ram_address(name, index, computer.ram)]
+        registers = {'PC': computer.pc, 'A': computer.a, 'D': computer.d}
+        if base in registers and index is None:
+            return registers[base]
+        raise ScriptError(f"unknown variable {name}")
+
+    def set(self, name: str, value: int):
+        computer = self.computer
+        base, index = split_index(name)
+        value &= 0xFFFF
+        if base == 'RAM' and index is not None:
+            computer.ram[ram_address(name, index, computer.ram)] = value
+        elif base == 'PC':
+            computer.pc = value
+            computer.halted = False
+        elif base == 'A':
+            computer.a = value
+        elif base == 'D':
+            computer.d = value
+        else:
+            raise ScriptError(f"unknown variable {name}")
+
+    def step(self, command: str, count: int = 1) -> bool:
+        if command != 'ticktock':
+            return False
+        computer = self.computer
+        executed = computer.run_jit(count)
+        if executed < count and computer.halted:
+            # 停在 @X / 0;JMP：剩下的時脈只在 X 和 X+1 之間來回，不用真的執行
+            if (count - executed) % 2:
+                computer.a = computer.pc
+                computer.pc += 1
+        return True
+
+
+class VMTarget:
+    """VMEmulator：vmstep 執行一個 VM 指令；sp、local ... 和 local[i] 等區段變數"""
+
+    REGISTERS = {'sp': 0, 'local': 1, 'argument': 2, 'this': 3, 'that': 4}
+    FIXED = {'temp': 5, 'pointer': 3}
+
+    def __init__(self, vm_files: List[str]):
+        self.vm = vm_emulator.VMEmulator(vm_emulator.VMProgram(vm_files))
+        self.vm.start(bootstrap=False)
+
+    def address(self, name: str) -> int:
+        ram = self.vm.ram
+        base, index = split_index(name)
+        if base == 'RAM' and index is not None:
+            return ram_address(name, index, ram)
+        if base in self.REGISTERS:
+            if index is None:
+                return self.REGISTERS[base]
+            return ram_address(name, ram[self.REGISTERS[base]] + index, ram)
+        if base in self.FIXED and index is not None:
+            return ram_address(name, self.FIXED[base] + index, ram)
+        raise ScriptError(f"unknown variable {name}")
+
+    def get(self, name: str) -> int:
+        return self.vm.ram[self.address(name)]
+
+    def set(self, name: str, value: int):
+        self.vm.ram[self.address(name)] = value & 0xFFFF
+
+    def step(self, command: str, count: int = 1) -> bool:
+        if command != 'vmstep':
+            return False
+        self.vm.run(count)
+        return True
+
+
+def split_index(name: str) -> Tuple[str, Optional[int]]:
+    """RAM[12] -> ('RAM', 12)；sp -> ('sp', None)"""
+    if name.endswith(']') and '[' in name:
+        base, index = name[:-1].split('[', 1)
+        return base, int(index) if index else None
+    return name, None
+
+
+def ram_address(name: str, address: int, ram: List[int]) -> int:
+    """檢查變數的 RAM 位址 (負數在 Python 會從尾端取值，也要擋下來)"""
+    if not 0 <= address < len(ram):
+        raise ScriptError(f"{name}: RAM address {address} is out of range (0..{len(ram) - 1})")
+    return address
+
+
+def translate_vm(vm_files: List[str], bootstrap: bool) -> List[str]:
+    """在記憶體中執行 VM 翻譯器 (和 VMTranslator 的 main 一樣：翻譯整個目錄時才加 bootstrap)"""
+    code_writer = vm_translator.CodeWriter(io.StringIO())
+    if bootstrap:
+        code_writer.write_init()
+    for vm_file in vm_files:
+        vm_translator.translate_file(vm_file, code_writer)
+    return code_writer.output.getvalue().splitlines()
+
+
+def assemble_lines(name: str, lines: List[str]) -> List[int]:
+    assembler = hack_assembler.Assembler(name)
+    cleaned = [line for line in map(assembler.clean_line, lines) if line]
+    return [int(code, 2) for code in assembler.second_pass(assembler.first_pass(cleaned))]
+
+
+def load_target(directory: str, argument: Optional[str]):
+    """
+    腳本的 load 指令：依副檔名建立要測試的模擬器。
+    沒有參數時載入目錄中所有的 .vm 檔 (VMEmulator 的寫法)。
+    """
+    vm_files = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.vm'))
+    if argument is None:
+        return VMTarget(vm_files)
+    path = os.path.join(directory, argument)
+    stem, extension = os.path.splitext(argument)
+    if extension == '.hdl':
+        return load_hardware_simulator().HardwareTarget(path)
+    if extension == '.vm':
+        return VMTarget([path])
+    if extension == '.hack':
+        with open(path, 'r') as f:
+            return CPUTarget([int(line.strip(), 2) for line in f if line.strip()])
+    if extension == '.asm':
+        if os.path.exists(os.path.join(directory, stem + '.vm')):
+            lines = translate_vm([os.path.join(directory, stem + '.vm')], bootstrap=False)
+        elif vm_files and stem == os.path.basename(os.path.normpath(directory)):
+            lines = translate_vm(vm_files, bootstrap=True)
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        return CPUTarget(assemble_lines(path, lines))
+    raise ScriptError(f"cannot load {argument}")
+
+
+# ============= 執行腳本 =============
+
+class ScriptRunner:
+    """執行一個 .tst：output 產生的每一行都馬上和 .cmp 的同一行比對"""
+
+    def __init__(self, script_path: str, write_output: bool = False):
+        self.script_path = script_path
+        self.directory = os.path.dirname(os.path.abspath(script_path))
+        self.write_output = write_output
+        with open(script_path, 'r', encoding='utf-8') as f:
+            self.statements = parse_script(f.read())
+        self.target = None
+        self.columns: List[OutputColumn] = []
+        self.output_file: Optional[str] = None
+        self.expected: Optional[List[str]] = None
+        self.lines: List[str] = []
+
+    def comparison_file(self) -> Optional[str]:
+        commands = find_commands(self.statements, 'compare-to')
+        return commands[0][1] if commands and len(commands[0]) > 1 else None
+
+    def run(self) -> int:
+        """執行到結束，回傳比對過的行數；不同時丟出 ComparisonFailure"""
+        try:
+            self.execute(self.statements)
+        finally:
+            if self.write_output and self.output_file:
+                with open(os.path.join(self.directory, self.output_file), 'w') as f:
+                    f.write(''.join(line + '\n' for line in self.lines))
+        if self.expected is not None and len(self.lines) < len(self.expected):
+            raise ComparisonFailure(f"output has {len(self.lines)} line(s), "
+                                    f"{os.path.basename(self.comparison_file())} has {len(self.expected)}")
+        return len(self.lines)
+
+    def execute(self, statements: List[Statement]):
+        for statement in statements:
+            if statement[0] == 'command':
+                self.command(statement[1])
+            elif statement[0] == 'repeat':
+                count, body = statement[1], statement[2]
+                if count is None:
+                    raise ScriptError("endless 'repeat' (interactive script)")
+                # 只有一個單步指令的 repeat 交給模擬器一次執行 count 步
+                if (len(body) == 1 and body[0][0] == 'command' and len(body[0][1]) == 1
+                        and self.target is not None and self.target.step(body[0][1][0], count)):
+                    continue
+                for _ in range(count):
+                    self.execute(body)
+            else:
+                iterations = 0
+                while self.condition(statement[1]):
+                    iterations += 1
+                    if iterations > MAX_WHILE_ITERATIONS:
+                        raise ScriptError(f"'while {' '.join(statement[1])}' never finished")
+                    self.execute(statement[2])
+
+    def condition(self, condition: Tuple[str, str, str]) -> bool:
+        left, operator, right = condition
+        value = vm_emulator.s16(self.get(left))
+        expected = parse_value(right)
+        comparisons = {'=': value == expected, '<>': value != expected, '<': value < expected,
+                       '>': value > expected, '<=': value <= expected, '>=': value >= expected}
+        if operator not in comparisons:
+            raise ScriptError(f"unknown operator {operator}")
+        return comparisons[operator]
+
+    def get(self, name: str):
+        if self.target is None:
+            raise ScriptError(f"{name} used before load")
+        return self.target.get(name)
+
+    def command(self, tokens: List[str]):
+        name, arguments = tokens[0], tokens[1:]
+        if name == 'load':
+            self.target = load_target(self.directory, arguments[0] if arguments else None)
+        elif name == 'output-file':
+            self.output_file = arguments[0]
+        elif name == 'compare-to':
+            with open(os.path.join(self.directory, arguments[0]), 'r') as f:
+                self.expected = f.read().splitlines()
+        elif name == 'output-list':
+            self.columns = [OutputColumn(spec) for spec in arguments]
+            self.emit('|' + '|'.join(column.header() for column in self.columns) + '|')
+        elif name == 'output':
+            self.emit('|' + '|'.join(column.format(self.get(column.name)) for column in self.columns) + '|')
+        elif name == 'set':
+            if self.target is None:
+                raise ScriptError("set before load")
+            self.target.set(arguments[0], parse_value(arguments[1]))
+        elif name == 'echo':
+            # 代替使用者照著提示按住按鍵
+            key = HOLD_KEY.search(' '.join(arguments))
+            if key and hasattr(self.target, 'press'):
+                self.target.press(ord(key.group(1)))
+        elif name == 'clear-echo':
+            if hasattr(self.target, 'press'):
+                self.target.press(0)
+        elif self.target is None or not (self.target.step(name) if len(tokens) == 1 else
+                                         hasattr(self.target, 'command') and self.target.command(tokens)):
+            raise ScriptError(f"unsupported command '{' '.join(tokens)}'")
+
+    def emit(self, line: str):
+        self.lines.append(line)
+        if self.expected is None:
+            return
+        number = len(self.lines)
+        expected = self.expected[number - 1] if number <= len(self.expected) else None
+        if expected is None or not lines_match(line, expected):
+            raise ComparisonFailure(f"comparison failure at line {number}\n"
+                                    f"    expected: {expected}\n    actual:   {line}")
+
+
+def run_test(script_path: str, write_output: bool = False) -> Tuple[str, str, str, float]:
+    """執行一個測試，回傳 (腳本, PASS / FAIL / SKIP, 訊息, 秒數)"""
+    started = time.perf_counter()
+    try:
+        runner = ScriptRunner(script_path, write_output)
+        if runner.comparison_file() is None:
+            return script_path, 'SKIP', "no compare-to (interactive script)", 0.0
+        lines = runner.run()
+        return script_path, 'PASS', f"{lines} line(s)", time.perf_counter() - started
+    except ComparisonFailure as failure:
+        return script_path, 'FAIL', str(failure), time.perf_counter() - started
+    except (ScriptError, OSError, ValueError, vm_emulator.VMError, hack_emulator.HackError) as error:
+        return script_path, 'FAIL', f"error: {error}", time.perf_counter() - started
+    except Exception as error:
+        # 其他例外也只讓這個腳本失敗，不要中斷整批測試
+        return script_path, 'FAIL', f"error: {type(error).__name__}: {error}", time.perf_counter() - started
+
+
+def find_scripts(paths: List[str]) -> List[str]:
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                scripts += [os.path.join(root, name) for name in sorted(files) if name.endswith('.tst')]
+        else:
+            scripts.append(path)
+    return scripts
+
+
+def run_tests(scripts: List[str], jobs: int = 1, write_output: bool = False):
+    if jobs > 1 and len(scripts) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(run_test, script, write_output) for script in scripts]
+            return [future.result() for future in futures]
+    return [run_test(script, write_output) for script in scripts]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        usage="python TestRunner.py [-j N] [--write-out] [-q] [file.tst | directory ...]")
+    arg_parser.add_argument('paths', nargs='*', default=[PROJECT_ROOT],
+                            help="要執行的 .tst 或目錄 (預設整個專案)")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=0,
+                            help="平行執行的 process 數 (預設 0 = CPU 核心數)")
+    arg_parser.add_argument('--write-out', action='store_true',
+                            help="和官方模擬器一樣寫出腳本的 output-file (.out)")
+    arg_parser.add_argument('-q', '--quiet', action='store_true',
+                            help="只列出失敗的測試")
+    args = arg_parser.parse_args()
+
+    scripts = find_scripts(args.paths)
+    if not scripts:
+        print("Error: no .tst files found")
+        sys.exit(1)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    started = time.perf_counter()
+    results = run_tests(scripts, jobs, args.write_out)
+    counts: Dict[str, int] = {'PASS': 0, 'FAIL': 0, 'SKIP': 0}
+    for script, status, message, elapsed in results:
+        counts[status] += 1
+        if status == 'FAIL' or not args.quiet:
+            name = os.path.relpath(script)
+            timing = f" ({elapsed:.2f} s)" if status != 'SKIP' else ''
+            print(f"{status} {name}{timing}: {message}")
+    print(f"{counts['PASS']} passed, {counts['FAIL']} failed, {counts['SKIP']} skipped "
+          f"in {time.perf_counter() - started:.2f} s (jobs={jobs})")
+    sys.exit(1 if counts['FAIL'] else 0)
+
+
+if __name__ == '__main__':
+    main()
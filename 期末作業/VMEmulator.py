@@ -0,0 +1,822 @@
+#!/usr/bin/env python3
+"""
+VM Emulator - 直接執行 .vm 程式的虛擬機 (Nand2Tetris 第 7、8 章的 VM)
+不需要先翻譯成 Hack 組合語言，而且 Jack OS (Math、Memory、String、Array、Output、
+Screen、Keyboard、Sys) 用 Python 直接實作：編譯好的 Jack 程式可以不用 OS 的 .vm 檔，
+Math.multiply、String.appendChar 這類呼叫一步就完成，比跑 OS 的 VM 程式快很多。
+
+記憶體和 Hack 平台相同：RAM[0..4] 是 SP、LCL、ARG、THIS、THAT，temp 在 RAM[5..12]，
+static 從 RAM[16] 起依檔案配置，stack 從 256 開始，heap 是 2048..16383，
+螢幕在 RAM[16384..]、鍵盤在 RAM[24576]。所以螢幕可以用 HackEmulator 的 Screen 存成圖片。
+
+- 載入的 .vm 檔裡有定義的 function 優先 (例如自己寫的 Math.vm)，沒有定義的 OS function 才用 Python 版本
+- Output 不畫字型點陣到螢幕，而是把文字直接輸出到 stdout
+- Keyboard.keyPressed 讀 KBD (可以用 --keys 腳本依指令數輸入)；
+  readChar / readLine / readInt 從 --input 檔案 (預設 stdin) 讀文字
+"""
+
+import os
+import sys
+import time
+import bisect
+import argparse
+import importlib.util
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
+
+TOOLCHAIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name: str, relative_path: str):
+    """用檔案路徑載入各章的程式 (它們不是 package，不能直接 import)"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(TOOLCHAIN_DIR, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+vm_translator = load_module('VMTranslator', os.path.join('8', 'VMTranslator.py'))
+hack_emulator = load_module('HackEmulator', 'HackEmulator.py')
+Parser = vm_translator.Parser
+
+RAM_SIZE = hack_emulator.RAM_SIZE
+SCREEN = hack_emulator.SCREEN
+KBD = hack_emulator.KBD
+STACK_BASE = 256
+STATIC_BASE = 16
+STATIC_LIMIT = 256
+HEAP_BASE = 2048
+HEAP_END = SCREEN
+TRUE = 0xFFFF
+
+# 文字模式的 Output：23 列 x 64 字 (和 Jack OS 相同)
+TEXT_ROWS = 23
+TEXT_COLUMNS = 64
+NEWLINE = 128
+BACKSPACE = 129
+DOUBLE_QUOTE = 34
+
+# VM 指令預先轉成 (opcode, a, b)；push/pop 依區段分成固定位址 (temp、pointer、static)
+# 和「基底暫存器 + index」(local、argument、this、that) 兩種
+(PUSH_CONSTANT, PUSH_FIXED, PUSH_SEGMENT, POP_FIXED, POP_SEGMENT,
+ ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ GOTO, IF_GOTO, FUNCTION, CALL, CALL_NATIVE, RETURN, HALT) = range(21)
+
+ARITHMETIC_OPCODES = {'add': ADD, 'sub': SUB, 'neg': NEG, 'eq': EQ, 'gt': GT, 'lt': LT,
+                      'and': AND, 'or': OR, 'not': NOT}
+SEGMENT_REGISTERS = {'local': 1, 'argument': 2, 'this': 3, 'that': 4}
+FIXED_SEGMENTS = {'pointer': (3, 2), 'temp': (5, 8)}  # 區段 -> (起點, 大小)
+
+Instruction = Tuple[int, object, object]
+
+
+class VMError(Exception):
+    """VM 程式的錯誤 (呼叫不存在的 function、區段 index 超出範圍、stack 溢位 ...)"""
+
+
+def s16(value: int) -> int:
+    """16 位元無號數 -> 有號整數"""
+    return value - 0x10000 if value & 0x8000 else value
+
+
+# ============= Jack OS (Python 版本) =============
+
+NATIVE_FUNCTIONS: Dict[str, Callable] = {}
+NATIVE_ARITY: Dict[str, int] = {}   # 每個 OS function 的參數個數 (不含 self)
+
+
+def native(name: str):
+    """把 JackOS 的方法登記成 OS function name 的實作"""
+    def register(method):
+        NATIVE_FUNCTIONS[name] = method
+        NATIVE_ARITY[name] = method.__code__.co_argcount - 1
+        return method
+    return register
+
+
+class JackOS:
+    """
+    Jack OS 的 Python 實作。參數和回傳值都是 16 位元無號數 (RAM 中的樣子)；
+    錯誤時和 Jack OS 一樣呼叫 Sys.error(代碼)。
+    String 物件的記憶體配置：[最大長度, 目前長度, 字元 ...]
+    """
+
+    def __init__(self, vm: 'VMEmulator', stdout: TextIO = sys.stdout, stdin: Optional[TextIO] = None):
+        self.vm = vm
+        self.ram = vm.ram
+        self.stdout = stdout
+        self.stdin = stdin if stdin is not None else sys.stdin
+        self.echo = not self.stdin.isatty()
+        self.reset()
+
+    def reset(self):
+        self.free_blocks: List[Tuple[int, int]] = [(HEAP_BASE, HEAP_END - HEAP_BASE)]  # (位址, 大小)
+        self.color = True
+        self.row = self.column = 0
+        self.error_code: Optional[int] = None
+
+    # ----- Math -----
+
+    @native('Math.init')
+    def math_init(self):
+        return 0
+
+    @native('Math.multiply')
+    def math_multiply(self, x, y):
+        return s16(x) * s16(y)
+
+    @native('Math.divide')
+    def math_divide(self, x, y):
+        x, y = s16(x), s16(y)
+        if y == 0:
+            return self.sys_error(3)
+        quotient = abs(x) // abs(y)
+        return quotient if (x < 0) == (y < 0) else -quotient
+
+    @native('Math.sqrt')
+    def math_sqrt(self, x):
+        x = s16(x)
+        if x < 0:
+            return self.sys_error(4)
+        root = 0
+        while (root + 1) * (root + 1) <= x:
+            root += 1
+        return root
+
+    @native('Math.abs')
+    def math_abs(self, x):
+        return abs(s16(x))
+
+    @native('Math.min')
+    def math_min(self, x, y):
+        return min(s16(x), s16(y))
+
+    @native('Math.max')
+    def math_max(self, x, y):
+        return max(s16(x), s16(y))
+
+    # ----- Memory -----
+
+    @native('Memory.init')
+    def memory_init(self):
+        self.free_blocks = [(HEAP_BASE, HEAP_END - HEAP_BASE)]
+        return 0
+
+    @native('Memory.peek')
+    def memory_peek(self, address):
+        return self.ram[address & 0x7FFF]
+
+    @native('Memory.poke')
+    def memory_poke(self, address, value):
+        self.ram[address & 0x7FFF] = value
+        return 0
+
+    @native('Memory.alloc')
+    def memory_alloc(self, size):
+        """first fit；區塊前一個 word 記錄大小，deAlloc 時用"""
+        size = s16(size)
+        if size <= 0:
+            return self.sys_error(5)
+        for index, (address, length) in enumerate(self.free_blocks):
+            if length >= size + 1:
+                if length == size + 1:
+                    del self.free_blocks[index]
+                else:
+                    self.free_blocks[index] = (address + size + 1, length - size - 1)
+                self.ram[address] = size
+                return address + 1
+        return self.sys_error(6)
+
+    @native('Memory.deAlloc')
+    def memory_dealloc(self, block):
+        """
+        free_blocks 依位址排序，歸還時和相鄰的空閒區塊合併，
+        否則反覆 alloc/deAlloc 會把 heap 切碎到整個 heap 都空著也配置不出來
+        """
+        if not HEAP_BASE < block < HEAP_END:
+            return 0
+        address, length = block - 1, self.ram[block - 1] + 1
+        if address + length > HEAP_END:
+            return 0
+        blocks = self.free_blocks
+        index = bisect.bisect_left(blocks, (address, 0))
+        # 和已經空閒的區塊重疊 (重複 dispose)：忽略，以免同一個位址被配置兩次
+        if index > 0 and blocks[index - 1][0] + blocks[index - 1][1] > address:
+            return 0
+        if index < len(blocks) and address + length > blocks[index][0]:
+            return 0
+        if index < len(blocks) and address + length == blocks[index][0]:
+            length += blocks.pop(index)[1]
+        if index > 0 and blocks[index - 1][0] + blocks[index - 1][1] == address:
+            index -= 1
+            address, length = blocks[index][0], blocks[index][1] + length
+            del blocks[index]
+        blocks.insert(index, (address, length))
+        return 0
+
+    # ----- Array -----
+
+    @native('Array.new')
+    def array_new(self, size):
+        if s16(size) <= 0:
+            return self.sys_error(2)
+        return self.memory_alloc(size)
+
+    @native('Array.dispose')
+    def array_dispose(self, this):
+        return self.memory_dealloc(this)
+
+    # ----- String -----
+
+    def text(self, string: int) -> str:
+        """String 物件 -> Python 字串"""
+        length = self.ram[string + 1]
+        return ''.join(map(chr, self.ram[string + 2:string + 2 + length]))
+
+    @native('String.new')
+    def string_new(self, max_length):
+        if s16(max_length) < 0:
+            return self.sys_error(14)
+        string = self.memory_alloc(max_length + 2)
+        if not self.vm.halted:
+            self.ram[string] = max_length
+            self.ram[string + 1] = 0
+        return string
+
+    @native('String.dispose')
+    def string_dispose(self, this):
+        return self.memory_dealloc(this)
+
+    @native('String.length')
+    def string_length(self, this):
+        return self.ram[this + 1]
+
+    @native('String.charAt')
+    def string_char_at(self, this, j):
+        if not 0 <= s16(j) < self.ram[this + 1]:
+            return self.sys_error(15)
+        return self.ram[this + 2 + j]
+
+    @native('String.setCharAt')
+    def string_set_char_at(self, this, j, c):
+        if not 0 <= s16(j) < self.ram[this + 1]:
+            return self.sys_error(16)
+        self.ram[this + 2 + j] = c
+        return 0
+
+    @native('String.appendChar')
+    def string_append_char(self, this, c):
+        length = self.ram[this + 1]
+        if length >= self.ram[this]:
+            return self.sys_error(17)
+        self.ram[this + 2 + length] = c
+        self.ram[this + 1] = length + 1
+        return this
+
+    @native('String.eraseLastChar')
+    def string_erase_last_char(self, this):
+        if self.ram[this + 1] == 0:
+            return self.sys_error(18)
+        self.ram[this + 1] -= 1
+        return 0
+
+    @native('String.intValue')
+    def string_int_value(self, this):
+        text = self.text(this)
+        sign, digits = (-1, text[1:]) if text.startswith('-') else (1, text)
+        value = 0
+        for char in digits:
+            if not char.isdigit():
+                break
+            value = value * 10 + int(char)
+        return sign * value
+
+    @native('String.setInt')
+    def string_set_int(self, this, value):
+        digits = str(s16(value))
+        if len(digits) > self.ram[this]:
+            return self.sys_error(19)
+        self.ram[this + 1] = len(digits)
+        self.ram[this + 2:this + 2 + len(digits)] = map(ord, digits)
+        return 0
+
+    @native('String.newLine')
+    def string_new_line(self):
+        return NEWLINE
+
+    @native('String.backSpace')
+    def string_back_space(self):
+        return BACKSPACE
+
+    @native('String.doubleQuote')
+    def string_double_quote(self):
+        return DOUBLE_QUOTE
+
+    # ----- Output (文字輸出到 stdout) -----
+
+    @native('Output.init')
+    def output_init(self):
+        self.row = self.column = 0
+        return 0
+
+    @native('Output.moveCursor')
+    def output_move_cursor(self, i, j):
+        i, j = s16(i), s16(j)
+        if not (0 <= i < TEXT_ROWS and 0 <= j < TEXT_COLUMNS):
+            return self.sys_error(20)
+        if i != self.row and self.column:
+            self.stdout.write('\n')
+        self.row, self.column = i, j
+        return 0
+
+    @native('Output.printChar')
+    def output_print_char(self, c):
+        if c == NEWLINE:
+            return self.output_println()
+        if c == BACKSPACE:
+            return self.output_back_space()
+        self.stdout.write(chr(c))
+        self.column += 1
+        if self.column == TEXT_COLUMNS:
+            self.output_println()
+        return 0
+
+    @native('Output.printString')
+    def output_print_string(self, s):
+        for char in self.ram[s + 2:s + 2 + self.ram[s + 1]]:
+            self.output_print_char(char)
+        return 0
+
+    @native('Output.printInt')
+    def output_print_int(self, i):
+        for char in str(s16(i)):
+            self.output_print_char(ord(char))
+        return 0
+
+    @native('Output.println')
+    def output_println(self):
+        self.stdout.write('\n')
+        self.row = (self.row + 1) % TEXT_ROWS
+        self.column = 0
+        return 0
+
+    @native('Output.backSpace')
+    def output_back_space(self):
+        if self.column:
+            self.column -= 1
+            self.stdout.write('\b')
+        return 0
+
+    # ----- Screen (直接寫 RAM 的螢幕區) -----
+
+    @native('Screen.init')
+    def screen_init(self):
+        self.color = True
+        return 0
+
+    @native('Screen.clearScreen')
+    def screen_clear_screen(self):
+        self.ram[SCREEN:KBD] = [0] * (KBD - SCREEN)
+        return 0
+
+    @native('Screen.setColor')
+    def screen_set_color(self, b):
+        self.color = b != 0
+        return 0
+
+    def fill_row(self, y: int, x1: int, x2: int):
+        """畫第 y 列的 x1..x2 (含兩端)：整個 word 一次寫入"""
+        ram, base = self.ram, SCREEN + y * 32
+        for word in range(x1 >> 4, (x2 >> 4) + 1):
+            low = max(x1, word << 4) & 15
+            high = min(x2, (word << 4) + 15) & 15
+            mask = ((1 << (high + 1)) - 1) ^ ((1 << low) - 1)
+            if self.color:
+                ram[base + word] |= mask
+            else:
+                ram[base + word] &= ~mask & 0xFFFF
+
+    @native('Screen.drawPixel')
+    def screen_draw_pixel(self, x, y):
+        x, y = s16(x), s16(y)
+        if not (0 <= x < 512 and 0 <= y < 256):
+            return self.sys_error(7)
+        self.fill_row(y, x, x)
+        return 0
+
+    @native('Screen.drawLine')
+    def screen_draw_line(self, x1, y1, x2, y2):
+        x1, y1, x2, y2 = s16(x1), s16(y1), s16(x2), s16(y2)
+        if not all(0 <= x < 512 for x in (x1, x2)) or not all(0 <= y < 256 for y in (y1, y2)):
+            return self.sys_error(8)
+        if y1 == y2:
+            self.fill_row(y1, min(x1, x2), max(x1, x2))
+            return 0
+        # Bresenham
+        dx, dy = abs(x2 - x1), -abs(y2 - y1)
+        step_x, step_y = (1 if x2 > x1 else -1), (1 if y2 > y1 else -1)
+        balance = dx + dy
+        while True:
+            self.fill_row(y1, x1, x1)
+            if x1 == x2 and y1 == y2:
+                return 0
+            twice = 2 * balance
+            if twice >= dy:
+                balance += dy
+                x1 += step_x
+            if twice <= dx:
+                balance += dx
+                y1 += step_y
+
+    @native('Screen.drawRectangle')
+    def screen_draw_rectangle(self, x1, y1, x2, y2):
+        x1, y1, x2, y2 = s16(x1), s16(y1), s16(x2), s16(y2)
+        if not (0 <= x1 <= x2 < 512 and 0 <= y1 <= y2 < 256):
+            return self.sys_error(9)
+        for y in range(y1, y2 + 1):
+            self.fill_row(y, x1, x2)
+        return 0
+
+    @native('Screen.drawCircle')
+    def screen_draw_circle(self, x, y, r):
+        x, y, r = s16(x), s16(y), s16(r)
+        if not (0 <= x < 512 and 0 <= y < 256):
+            return self.sys_error(12)
+        if r < 0 or r > 181 or x - r < 0 or x + r > 511 or y - r < 0 or y + r > 255:
+            return self.sys_error(13)
+        for dy in range(-r, r + 1):
+            half = self.math_sqrt(r * r - dy * dy)
+            self.fill_row(y + dy, x - half, x + half)
+        return 0
+
+    # ----- Keyboard -----
+
+    @native('Keyboard.init')
+    def keyboard_init(self):
+        return 0
+
+    @native('Keyboard.keyPressed')
+    def keyboard_key_pressed(self):
+        return self.ram[KBD]
+
+    @native('Keyboard.readChar')
+    def keyboard_read_char(self):
+        char = self.stdin.read(1)
+        if not char:
+            raise VMError("Keyboard: input exhausted")
+        c = NEWLINE if char == '\n' else ord(char)
+        if self.echo:
+            self.output_print_char(c)
+        return c
+
+    @native('Keyboard.readLine')
+    def keyboard_read_line(self, message):
+        self.output_print_string(message)
+        chars: List[int] = []
+        while True:
+            c = self.keyboard_read_char()
+            if c == NEWLINE:
+                break
+            if c == BACKSPACE:
+                if chars:
+                    chars.pop()
+            else:
+                chars.append(c)
+        string = self.string_new(max(len(chars), 1))
+        for c in chars:
+            self.string_append_char(string, c)
+        return string
+
+    @native('Keyboard.readInt')
+    def keyboard_read_int(self, message):
+        string = self.keyboard_read_line(message)
+        value = self.string_int_value(string)
+        self.memory_dealloc(string)
+        return value
+
+    # ----- Sys -----
+
+    @native('Sys.halt')
+    def sys_halt(self):
+        self.vm.halted = True
+        return 0
+
+    @native('Sys.error')
+    def sys_error(self, code):
+        self.error_code = s16(code)
+        if self.column:
+            self.stdout.write('\n')
+        self.stdout.write(f"ERR{self.error_code}\n")
+        self.vm.halted = True
+        return 0
+
+    @native('Sys.wait')
+    def sys_wait(self, duration):
+        if s16(duration) <= 0:
+            return self.sys_error(1)
+        return 0  # 沒有畫面可看，不需要真的等待
+
+
+# ============= 載入程式 =============
+
+def vm_files(path: str) -> List[str]:
+    """目錄 -> 裡面所有的 .vm 檔 (依檔名排序)；單一檔案 -> [檔案]"""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.vm'))
+    return [path]
+
+
+class VMProgram:
+    """
+    把 .vm 檔解析成 VMEmulator 執行的指令表。
+    label 的範圍是所在的 function；static 每個檔案 (class) 各自從 RAM[16] 起依序配置。
+    """
+
+    def __init__(self, files: List[str]):
+        self.commands: List[Tuple[str, int, object, object]] = []  # (檔名, 類型, arg1, arg2)
+        for path in files:
+            class_name = os.path.splitext(os.path.basename(path))[0]
+            for command in vm_translator.read_commands(Parser(path)):
+                self.commands.append((class_name,) + command)
+        self.functions: Dict[str, int] = {}
+        self.owners: List[Optional[str]] = []  # 每個指令所在的 function
+        self.static_base: Dict[str, int] = {}
+        self.natives: List[str] = []
+        self._assign_statics()
+        labels = self._collect_labels()
+        self.instructions: List[Instruction] = [self._encode(i, labels) for i in range(len(self.commands))]
+        # 沒有定義 Sys.init 時，用一小段 VM 程式代替 OS 的 Sys.init：呼叫 Main.main 後停止
+        self.defines_sys_init = 'Sys.init' in self.functions
+        self.entry: Optional[int] = self.functions.get('Sys.init')
+        if self.entry is None and 'Main.main' in self.functions:
+            self.entry = len(self.instructions)
+            self.instructions += [(FUNCTION, 0, None), (CALL, self.functions['Main.main'], 0),
+                                  (POP_FIXED, 5, None)]
+        self.halt_address = len(self.instructions)
+        self.instructions.append((HALT, None, None))
+
+    def _assign_statics(self):
+        sizes: Dict[str, int] = {}
+        for class_name, cmd_type, segment, index in self.commands:
+            sizes.setdefault(class_name, 0)
+            if cmd_type in (Parser.C_PUSH, Parser.C_POP) and segment == 'static':
+                sizes[class_name] = max(sizes[class_name], index + 1)
+        address = STATIC_BASE
+        for class_name, size in sizes.items():
+            self.static_base[class_name] = address
+            address += size
+        if address > STATIC_LIMIT:
+            raise VMError(f"too many static variables ({address - STATIC_BASE}, at most "
+                          f"{STATIC_LIMIT - STATIC_BASE})")
+
+    def _collect_labels(self) -> Dict[Tuple[Optional[str], str], int]:
+        """
+        label 不是指令 (官方 VM Emulator 的 vmstep 也不算 label)：從指令表移除，
+        label 的位址就是它下一個指令的位置
+        """
+        labels = {}
+        commands = []
+        function = None
+        for command in self.commands:
+            class_name, cmd_type, arg1, arg2 = command
+            if cmd_type == Parser.C_LABEL:
+                labels[(function, arg1)] = len(commands)
+                continue
+            if cmd_type == Parser.C_FUNCTION:
+                function = arg1
+                if arg1 in self.functions:
+                    raise VMError(f"function {arg1} is defined twice")
+                self.functions[arg1] = len(commands)
+            commands.append(command)
+            self.owners.append(function)
+        self.commands = commands
+        return labels
+
+    def _encode(self, address: int, labels) -> Instruction:
+        class_name, cmd_type, arg1, arg2 = self.commands[address]
+        if cmd_type == Parser.C_ARITHMETIC:
+            return ARITHMETIC_OPCODES[arg1], None, None
+        if cmd_type in (Parser.C_PUSH, Parser.C_POP):
+            push = cmd_type == Parser.C_PUSH
+            if arg1 == 'constant':
+                if not push:
+                    raise VMError(f"{class_name}: cannot pop to constant")
+                return PUSH_CONSTANT, arg2 & 0xFFFF, None
+            if arg1 in SEGMENT_REGISTERS:
+                return (PUSH_SEGMENT if push else POP_SEGMENT), SEGMENT_REGISTERS[arg1], arg2
+            if arg1 == 'static':
+                fixed = self.static_base[class_name] + arg2
+            elif arg1 in FIXED_SEGMENTS and 0 <= arg2 < FIXED_SEGMENTS[arg1][1]:
+                fixed = FIXED_SEGMENTS[arg1][0] + arg2
+            else:
+                raise VMError(f"{class_name}: illegal segment '{arg1} {arg2}'")
+            return (PUSH_FIXED if push else POP_FIXED), fixed, None
+        if cmd_type in (Parser.C_FUNCTION, Parser.C_RETURN):
+            return (FUNCTION if cmd_type == Parser.C_FUNCTION else RETURN), arg2, None
+        if cmd_type in (Parser.C_GOTO, Parser.C_IF):
+            function = self.owners[address]
+            if (function, arg1) not in labels:
+                raise VMError(f"{function or class_name}: undefined label {arg1}")
+            return (GOTO if cmd_type == Parser.C_GOTO else IF_GOTO), labels[(function, arg1)], None
+        if cmd_type == Parser.C_CALL:
+            if arg1 in self.functions:
+                return CALL, self.functions[arg1], arg2
+            if arg1 in NATIVE_FUNCTIONS:
+                if arg2 != NATIVE_ARITY[arg1]:
+                    raise VMError(f"{self.owners[address] or class_name}: {arg1} expects "
+                                  f"{NATIVE_ARITY[arg1]} argument(s), called with {arg2}")
+                if arg1 not in self.natives:
+                    self.natives.append(arg1)
+                return CALL_NATIVE, NATIVE_FUNCTIONS[arg1], arg2
+            raise VMError(f"{self.owners[address] or class_name}: call to undefined function {arg1}")
+        raise VMError(f"{class_name}: unknown command {cmd_type}")
+
+
+# ============= VM =============
+
+class VMEmulator:
+    """
+    執行 VMProgram。介面和 HackEmulator 的 HackComputer 相同 (ram、cycles、halted、run)，
+    所以可以直接用 HackEmulator 的 run_headless 和 Screen；cycles 是已執行的 VM 指令數。
+    """
+
+    def __init__(self, program: VMProgram, stdout: TextIO = sys.stdout, stdin: Optional[TextIO] = None):
+        self.program = program
+        self.instructions = program.instructions
+        self.ram = [0] * RAM_SIZE
+        self.pc = 0
+        self.cycles = 0
+        self.native_calls = 0
+        self.halted = False
+        self.os = JackOS(self, stdout, stdin)
+
+    def start(self, bootstrap: bool = True):
+        """
+        bootstrap：和翻譯器的啟動碼一樣 SP = 256 後 call Sys.init (或代替它的 Main.main)，
+        Sys.init 結束就停止。否則 (.tst 的 load，或程式裡沒有任何 function 可以進入)
+        直接從 .vm 檔定義的 Sys.init 開始，沒有的話從第一個指令開始，RAM 由呼叫者設定。
+        """
+        self.halted = False
+        self.os.reset()
+        program = self.program
+        if not bootstrap or program.entry is None:
+            self.pc = program.functions['Sys.init'] if program.defines_sys_init else 0
+            return
+        ram = self.ram
+        ram[STACK_BASE:STACK_BASE + 5] = [program.halt_address, 0, 0, 0, 0]
+        ram[0] = ram[1] = STACK_BASE + 5
+        ram[2] = STACK_BASE
+        self.pc = program.entry
+
+    def run(self, max_cycles: int) -> int:
+        """執行最多 max_cycles 個 VM 指令，回傳實際執行的數量"""
+        instructions, ram, os_ = self.instructions, self.ram, self.os
+        pc, sp = self.pc, ram[0]
+        executed = 0
+        try:
+            while executed < max_cycles and not self.halted:
+                opcode, a, b = instructions[pc]
+                executed += 1
+                pc += 1
+                if opcode == PUSH_SEGMENT:
+                    ram[sp] = ram[ram[a] + b]
+                    sp += 1
+                elif opcode == PUSH_CONSTANT:
+                    ram[sp] = a
+                    sp += 1
+                elif opcode == PUSH_FIXED:
+                    ram[sp] = ram[a]
+                    sp += 1
+                elif opcode == POP_SEGMENT:
+                    sp -= 1
+                    ram[ram[a] + b] = ram[sp]
+                elif opcode == POP_FIXED:
+                    sp -= 1
+                    ram[a] = ram[sp]
+                elif opcode == ADD:
+                    sp -= 1
+                    ram[sp - 1] = (ram[sp - 1] + ram[sp]) & 0xFFFF
+                elif opcode == SUB:
+                    sp -= 1
+                    ram[sp - 1] = (ram[sp - 1] - ram[sp]) & 0xFFFF
+                elif opcode == IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = a
+                elif opcode == GOTO:
+                    # 跳回自己的無窮迴圈 (label END / goto END) 是程式結束的慣用寫法
+                    if a == pc - 1:
+                        self.halted = True
+                    pc = a
+                elif opcode == LT:
+                    sp -= 1
+                    ram[sp - 1] = TRUE if ram[sp - 1] ^ 0x8000 < ram[sp] ^ 0x8000 else 0
+                elif opcode == GT:
+                    sp -= 1
+                    ram[sp - 1] = TRUE if ram[sp - 1] ^ 0x8000 > ram[sp] ^ 0x8000 else 0
+                elif opcode == EQ:
+                    sp -= 1
+                    ram[sp - 1] = TRUE if ram[sp - 1] == ram[sp] else 0
+                elif opcode == AND:
+                    sp -= 1
+                    ram[sp - 1] &= ram[sp]
+                elif opcode == OR:
+                    sp -= 1
+                    ram[sp - 1] |= ram[sp]
+                elif opcode == NOT:
+                    ram[sp - 1] ^= 0xFFFF
+                elif opcode == NEG:
+                    ram[sp - 1] = -ram[sp - 1] & 0xFFFF
+                elif opcode == CALL_NATIVE:
+                    sp -= b
+                    ram[0] = sp
+                    self.native_calls += 1
+                    result = a(os_, *ram[sp:sp + b])
+                    ram[sp] = (result or 0) & 0xFFFF
+                    sp += 1
+                elif opcode == CALL:
+                    ram[sp:sp + 5] = [pc, ram[1], ram[2], ram[3], ram[4]]
+                    ram[2] = sp - b
+                    sp += 5
+                    ram[1] = sp
+                    pc = a
+                    if sp >= HEAP_BASE:
+                        raise VMError("stack overflow")
+                elif opcode == FUNCTION:
+                    ram[sp:sp + a] = [0] * a
+                    sp += a
+                elif opcode == RETURN:
+                    frame = ram[1]
+                    return_address = ram[frame - 5]
+                    argument = ram[2]
+                    ram[argument] = ram[sp - 1]
+                    sp = argument + 1
+                    ram[1], ram[2], ram[3], ram[4] = ram[frame - 4], ram[frame - 3], ram[frame - 2], ram[frame - 1]
+                    pc = return_address
+                else:  # HALT
+                    self.halted = True
+                    pc -= 1
+        except IndexError:
+            raise VMError(f"memory access out of range near VM command {pc - 1}") from None
+        finally:
+            self.pc = pc
+            ram[0] = sp
+            self.cycles += executed
+        return executed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        usage="python VMEmulator.py [--steps N] [--input FILE] [--keys SCRIPT] [--screenshot FILE] "
+              "<directory | file.vm>")
+    arg_parser.add_argument('program', help="放 .vm 檔的目錄 (例如 JackCompiler 的 output/) 或單一 .vm 檔")
+    arg_parser.add_argument('--steps', type=int, default=100_000_000,
+                            help="最多執行幾個 VM 指令 (預設 100000000)")
+    arg_parser.add_argument('--input', metavar='FILE',
+                            help="Keyboard.readChar / readLine / readInt 讀的文字 (預設 stdin)")
+    arg_parser.add_argument('--keys', metavar='SCRIPT',
+                            help="Keyboard.keyPressed 的鍵盤腳本，每行 \"<指令數> <按鍵>\" (同 HackEmulator)")
+    arg_parser.add_argument('--screenshot', metavar='FILE',
+                            help="結束時把螢幕存成 .png 或 .pbm")
+    args = arg_parser.parse_args()
+
+    files = vm_files(args.program)
+    if not files or not all(os.path.isfile(path) for path in files):
+        print(f"Error: no .vm files found in {args.program}")
+        sys.exit(1)
+
+    try:
+        program = VMProgram(files)
+        keys = hack_emulator.read_key_script(args.keys) if args.keys else []
+        stdin = open(args.input, 'r', encoding='utf-8') if args.input else None
+    except (OSError, ValueError, VMError) as error:
+        print(f"Error: {error}")
+        sys.exit(1)
+
+    vm = VMEmulator(program, stdin=stdin)
+    vm.start()
+    started = time.perf_counter()
+    try:
+        executed = hack_emulator.run_headless(vm, args.steps, vm.run, keys)
+    except VMError as error:
+        print(f"\nError: {error}")
+        sys.exit(1)
+    finally:
+        if stdin:
+            stdin.close()
+    elapsed = time.perf_counter() - started
+    if vm.os.column:
+        print()
+    if args.screenshot:
+        hack_emulator.Screen(vm.ram).save(args.screenshot)
+
+    state = 'halted' if vm.halted else 'stopped'
+    print(f"{state} after {executed} VM command(s), {vm.native_calls} native OS call(s) "
+          f"in {elapsed:.2f} s")
+    if program.natives:
+        print(f"native OS functions: {', '.join(sorted(program.natives))}")
+    if vm.os.error_code is not None:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()